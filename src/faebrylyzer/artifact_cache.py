@@ -0,0 +1,210 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Content-addressed cache of build stage outputs.
+
+A stage is keyed by a `Fingerprint` of all its inputs (the code of the app and
+of faebryk, the parts lock, the pcb, ...). Its output files are stored
+once per content hash in `objects/`, the manifest of a key maps the outputs of
+the stage to those hashes. Objects and manifests are written to a temporary file
+and moved in place, so several machines can share the cache directory (e.g. on
+a network mount) without locks, a manifest is only visible once all its objects
+are.
+
+    <root>/objects/ab/abcdef...     file contents
+    <root>/entries/12/123456....json  {output name: {relative path: object}}
+
+Usage:
+    cache = ArtifactCache(Path("/mnt/ci/faebrylyzer-cache"))
+    key = Fingerprint(code_fingerprint()).add("pcb", pcb_path).hexdigest()
+    cache.run(key, {"visuals": visuals_dir}, lambda: export_svg(...))
+"""
+
+import hashlib
+import importlib.metadata
+import json
+import logging
+import os
+import shutil
+import tempfile
+from functools import cache
+from pathlib import Path
+from typing import Any, Callable
+
+import faebryk
+
+from faebrylyzer.locking import FILE_MODE, atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+# bump to invalidate all entries written by older versions
+CACHE_VERSION = 1
+
+CHUNK_SIZE = 1 << 20
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _files(path: Path) -> dict[str, Path]:
+    """
+    Files of an output by their path relative to it, "" for a single file
+    """
+    if path.is_file():
+        return {"": path}
+    if path.is_dir():
+        return {
+            p.relative_to(path).as_posix(): p
+            for p in sorted(path.rglob("*"))
+            if p.is_file()
+        }
+    return {}
+
+
+def _copy_atomic(src: Path, dst: Path):
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dst.parent, prefix=f".{dst.name}.")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.chmod(tmp, FILE_MODE)
+        os.replace(tmp, dst)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Fingerprint:
+    """
+    Hash of named stage inputs, in the order they are added
+    """
+
+    def __init__(self, *parents: str):
+        self._hash = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+        for parent in parents:
+            self.add("parent", parent)
+
+    def add(self, name: str, value: Any) -> "Fingerprint":
+        """
+        Add an input: bytes and str as is, files and directories by their
+        content, callables by their qualified name, everything else by repr
+        """
+        self._hash.update(f"\0{name}\0".encode())
+        match value:
+            case bytes():
+                self._hash.update(value)
+            case str():
+                self._hash.update(value.encode())
+            case Path():
+                files = _files(value)
+                if not files:
+                    self._hash.update(b"<missing>")
+                for rel, path in files.items():
+                    self._hash.update(f"{rel}\0{_file_digest(path)}\0".encode())
+            case _ if callable(value) and hasattr(value, "__qualname__"):
+                self._hash.update(f"{value.__module__}.{value.__qualname__}".encode())
+            case _:
+                self._hash.update(repr(value).encode())
+        return self
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+@cache
+def code_fingerprint() -> str:
+    """
+    Hash of the sources of this package and of faebryk, and the faebryk version
+
+    faebryk is a develop path dependency, its version does not change with its
+    sources.
+    """
+    fingerprint = Fingerprint().add("faebryk", importlib.metadata.version("faebryk"))
+    packages = {
+        "faebryk": [Path(p) for p in faebryk.__path__],
+        "faebrylyzer": [Path(__file__).parent],
+    }
+    for name, roots in packages.items():
+        for root in roots:
+            for path in sorted(root.rglob("*.py")):
+                rel = path.relative_to(root).as_posix()
+                fingerprint.add(f"{name}/{rel}", path.read_bytes())
+    return fingerprint.hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self, root: Path):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+
+    def _object(self, digest: str) -> Path:
+        return self.root.joinpath("objects", digest[:2], digest)
+
+    def _manifest(self, key: str) -> Path:
+        return self.root.joinpath("entries", key[:2], f"{key}.json")
+
+    def restore(self, key: str, outputs: dict[str, Path]) -> bool:
+        """
+        Copy the stored outputs of `key` to `outputs`, False if there are none
+        """
+        manifest_path = self._manifest(key)
+        if not manifest_path.exists():
+            return False
+        manifest: dict[str, dict[str, str]] = json.loads(
+            manifest_path.read_text(encoding="utf-8")
+        )
+        if manifest.keys() != outputs.keys():
+            logger.warning(f"Cache entry {key} has other outputs, ignoring it")
+            return False
+        objects = [
+            (
+                self._object(digest),
+                outputs[name].joinpath(rel) if rel else outputs[name],
+            )
+            for name, files in manifest.items()
+            for rel, digest in files.items()
+        ]
+        if not all(src.exists() for src, _ in objects):
+            logger.warning(f"Cache entry {key} is incomplete, ignoring it")
+            return False
+        for src, dst in objects:
+            _copy_atomic(src, dst)
+        return True
+
+    def store(self, key: str, outputs: dict[str, Path]):
+        """
+        Store the files of `outputs` (files or directories) under `key`
+        """
+        manifest: dict[str, dict[str, str]] = {}
+        for name, path in outputs.items():
+            manifest[name] = {}
+            for rel, file in _files(path).items():
+                digest = _file_digest(file)
+                if not self._object(digest).exists():
+                    _copy_atomic(file, self._object(digest))
+                manifest[name][rel] = digest
+        atomic_write_text(
+            self._manifest(key), json.dumps(manifest, indent=2, sort_keys=True)
+        )
+
+    def run(self, key: str, outputs: dict[str, Path], fn: Callable[[], Any]) -> bool:
+        """
+        Restore `outputs` from the cache, or produce them with `fn` and store
+        them, returns True on a cache hit
+        """
+        if self.restore(key, outputs):
+            self.hits += 1
+            logger.info(f"Restored {', '.join(outputs)} from cache entry {key[:12]}")
+            return True
+        self.misses += 1
+        fn()
+        self.store(key, outputs)
+        logger.info(f"Stored {', '.join(outputs)} as cache entry {key[:12]}")
+        return False
@@ -0,0 +1,416 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Benchmarks for the faebrylyzer build pipeline.
+
+Times every stage of the build (see `faebrylyzer.main.build`) for the real
+`faebrylyzerApp` and for synthetic designs that scale the repetitive parts of it.
+Runs are appended to a JSON history file and can be compared against a stored
+baseline.
+
+Benchmarks only use the local picker tables from `pickers.py` and never touch the
+JLCPCB database. Footprints are resolved from the easyeda cache in `build/cache`,
+which needs to be populated once by a normal build.
+
+Usage:
+    python -m faebrylyzer.benchmark run --design app
+    python -m faebrylyzer.benchmark run --design resistor_arrays --scale 64
+    python -m faebrylyzer.benchmark layout --count 10000
+    python -m faebrylyzer.benchmark set-baseline
+    python -m faebrylyzer.benchmark compare --threshold 0.2
+"""
+
+import json
+import logging
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from enum import StrEnum
+from pathlib import Path
+from typing import Callable
+
+import faebryk.library._F as F
+import typer
+from faebryk.core.module import Module
+from faebryk.exporters.pcb.layout.extrude import LayoutExtrude
+from faebryk.exporters.pcb.layout.layout import Layout
+from faebryk.exporters.pcb.layout.matrix import LayoutMatrix
+from faebryk.exporters.pcb.layout.typehierarchy import LayoutTypeHierarchy
+from faebryk.libs.logging import setup_basic_logging
+from faebryk.libs.units import P
+from typing_extensions import Annotated
+
+from faebrylyzer.app import faebrylyzerApp
+from faebrylyzer.layouts import BatchLayout
+from faebrylyzer.library.ResistorArray import ResistorArray
+from faebrylyzer.main import BuildPaths, StageTimer, build
+from faebrylyzer.pcb import transform_pcb
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DIR = Path("./build/benchmarks")
+HISTORY_FILE = BENCHMARK_DIR.joinpath("history.json")
+BASELINE_FILE = BENCHMARK_DIR.joinpath("baseline.json")
+
+
+# ----------------------------------------
+#           Synthetic designs
+# ----------------------------------------
+class ScaledResistorArrays(Module):
+    """
+    Chains of `count` resistor arrays, one chain per array element
+    """
+
+    power: F.ElectricPower
+
+    def __init__(self, count: int):
+        self._count = count
+
+    def __preinit__(self):
+        arrays = self.add_to_container(self._count, ResistorArray)
+
+        for ra in arrays:
+            ra.resistance.merge(F.Range.from_center_rel(100 * P.ohm, 0.05))
+
+        for left, right in zip(arrays, arrays[1:]):
+            for lr, rr in zip(left.resistor, right.resistor):
+                lr.unnamed[1].connect(rr.unnamed[0])
+
+        for r in arrays[0].resistor:
+            r.unnamed[0].connect(self.power.hv)
+        for r in arrays[-1].resistor:
+            r.unnamed[1].connect(self.power.lv)
+
+
+class ScaledChannels(Module):
+    """
+    `channels` logic channels with the same input network as `faebrylyzerApp`:
+    series resistor, pull-up, buffer, series resistor to the output
+    """
+
+    power: F.ElectricPower
+
+    def __init__(self, channels: int):
+        self._channels = channels
+
+    def __preinit__(self):
+        n = self._channels
+        n_buffers = -(-n // 8)
+        n_arrays = -(-n // 4)
+
+        inputs = self.add_to_container(n, F.ElectricLogic)
+        outputs = self.add_to_container(n, F.ElectricLogic)
+        buffers = self.add_to_container(n_buffers, F.SNx4LVC541A)
+        input_series = self.add_to_container(n_arrays, ResistorArray)
+        input_pullups = self.add_to_container(n_arrays, ResistorArray)
+        output_series = self.add_to_container(n_arrays, ResistorArray)
+
+        for buffer in buffers:
+            buffer.power.connect(self.power)
+            for oe in buffer.OE:
+                oe.signal.connect(self.power.lv)
+
+        for i in range(n):
+            buffer = buffers[i // 8]
+            a, y = buffer.A[i % 8].signal, buffer.Y[i % 8].signal
+            inputs[i].signal.connect_via(input_series[i // 4].resistor[i % 4], a)
+            a.connect_via(input_pullups[i // 4].resistor[i % 4], self.power.hv)
+            y.connect_via(output_series[i // 4].resistor[i % 4], outputs[i].signal)
+
+        for ra in input_series + output_series:
+            ra.resistance.merge(F.Range.from_center_rel(100 * P.ohm, 0.05))
+        for ra in input_pullups:
+            ra.resistance.merge(F.Range.from_center_rel(100 * P.kohm, 0.05))
+
+
+class Placed(Module):
+    """
+    Module placed by the layout benchmark
+    """
+
+
+class ScaledPlacements(Module):
+    def __init__(self, count: int):
+        self._count = count
+
+    def __preinit__(self):
+        self.add_to_container(self._count, Placed)
+
+
+class Design(StrEnum):
+    app = "app"
+    resistor_arrays = "resistor_arrays"
+    channels = "channels"
+
+
+def get_design(design: Design, scale: int) -> Callable[[], Module]:
+    match design:
+        case Design.app:
+            return faebrylyzerApp
+        case Design.resistor_arrays:
+            return lambda: ScaledResistorArrays(scale)
+        case Design.channels:
+            return lambda: ScaledChannels(scale)
+
+
+# ----------------------------------------
+#               Results
+# ----------------------------------------
+@dataclass
+class BenchmarkResult:
+    design: str
+    scale: int
+    timestamp: str
+    commit: str
+    stages: dict[str, float]
+    graph: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        return f"{self.design}@{self.scale}"
+
+    @property
+    def total(self) -> float:
+        return sum(self.stages.values())
+
+
+def load_results(path: Path) -> list[BenchmarkResult]:
+    if not path.exists():
+        return []
+    return [BenchmarkResult(**r) for r in json.loads(path.read_text())]
+
+
+def save_results(path: Path, results: list[BenchmarkResult]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps([asdict(r) for r in results], indent=2))
+
+
+def latest_by_key(results: list[BenchmarkResult]) -> dict[str, BenchmarkResult]:
+    return {r.key: r for r in results}
+
+
+def get_commit() -> str:
+    try:
+        return (
+            subprocess.check_output(["git", "describe", "--always", "--dirty"])
+            .strip()
+            .decode("utf-8")
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+
+def run_benchmark(
+    design: Design,
+    scale: int,
+    exports: bool = False,
+) -> BenchmarkResult:
+    """
+    Build `design` in a scratch build dir and time every stage
+    """
+    defaults = BuildPaths.default()
+
+    # never reopen pcbnew from a benchmark
+    os.environ.setdefault("FBRK_PCBNEW_AUTO", "0")
+
+    with tempfile.TemporaryDirectory(prefix="faebrylyzer-bench-") as tmp:
+        tmp_root = Path(tmp)
+        paths = BuildPaths(root=tmp_root, build_dir=tmp_root.joinpath("build"))
+
+        # work on copies, so the benchmark never touches the real project
+        shutil.copytree(defaults.kicad_prj_path, paths.kicad_prj_path)
+        paths.lib_dir.symlink_to(defaults.lib_dir.resolve())
+        cache = defaults.build_dir.joinpath("cache")
+        if cache.exists():
+            paths.build_dir.mkdir(parents=True)
+            paths.build_dir.joinpath("cache").symlink_to(cache.resolve())
+
+        timer = StageTimer()
+        app = build(
+            paths,
+            export_manufacturing_artifacts=exports,
+            export_visuals=exports,
+            export_parameters=exports,
+            export_esphome_config=exports,
+            app_factory=get_design(design, scale),
+            transform=transform_pcb if design == Design.app else None,
+            jlcpcb_pickers=False,
+            stage=timer,
+        )
+
+    G = app.get_graph()
+    return BenchmarkResult(
+        design=str(design),
+        scale=scale if design != Design.app else 1,
+        timestamp=datetime.now(tz=timezone.utc).isoformat(timespec="seconds"),
+        commit=get_commit(),
+        stages=timer.timings,
+        graph={"nodes": G.node_cnt, "edges": G.edge_cnt},
+    )
+
+
+def run_layout_benchmark(count: int, matrix: bool = False) -> dict[str, float]:
+    """
+    Place `count` modules with faebryk's layout and with `BatchLayout`, and
+    resolve all their positions, as moving the footprints does
+    """
+    Point = F.has_pcb_position.Point
+    L = F.has_pcb_position.layer_type
+    LVL = LayoutTypeHierarchy.Level
+
+    base = Point((0, 0, 90, L.TOP_LAYER))
+    if matrix:
+        columns = math.ceil(math.sqrt(count))
+        layout = LayoutMatrix(
+            base=base, vector=(1, 1, 90), distribution=(-(-count // columns), columns)
+        )
+    else:
+        layout = LayoutExtrude(base=base, vector=(0.5, 0, 90), dynamic_rotation=True)
+
+    variants: dict[str, Layout] = {
+        "per_node": LayoutTypeHierarchy([LVL(mod_type=Placed, layout=layout)]),
+        "batch": LayoutTypeHierarchy(
+            [LVL(mod_type=Placed, layout=BatchLayout(layout))]
+        ),
+    }
+
+    timings = {}
+    positions = {}
+    for name, variant in variants.items():
+        root = ScaledPlacements(count)
+        root.add(F.has_pcb_position_defined(Point((10, 10, 0, L.NONE))))
+        nodes = root.get_children(direct_only=True, types=Placed)
+
+        start = time.perf_counter()
+        variant.apply(root)
+        positions[name] = sorted(
+            n.get_trait(F.has_pcb_position).get_position() for n in nodes
+        )
+        timings[name] = time.perf_counter() - start
+
+    error = max(
+        max(abs(a - b) for a, b in zip(p[:3], q[:3]))
+        for p, q in zip(positions["per_node"], positions["batch"])
+    )
+    if error > 1e-6:
+        raise AssertionError(f"Batched layout differs from faebryk by {error}")
+
+    return timings
+
+
+def compare_results(
+    baseline: BenchmarkResult, current: BenchmarkResult, threshold: float
+) -> list[str]:
+    """
+    Return a description of every stage that got slower by more than `threshold`
+    (relative) compared to the baseline
+    """
+    regressions = []
+    for name, t in current.stages.items():
+        if name not in baseline.stages:
+            continue
+        t_base = baseline.stages[name]
+        if t_base > 0 and (t - t_base) / t_base > threshold:
+            regressions.append(
+                f"{current.key} {name}: {t_base:.3f}s -> {t:.3f}s"
+                f" (+{(t - t_base) / t_base:.0%})"
+            )
+    return regressions
+
+
+# ----------------------------------------
+#               CLI
+# ----------------------------------------
+cli = typer.Typer()
+
+
+@cli.command()
+def run(
+    design: Annotated[Design, typer.Option(help="Design to build")] = Design.app,
+    scale: Annotated[
+        int, typer.Option(help="Size of synthetic designs (arrays or channels)")
+    ] = 8,
+    repeat: Annotated[int, typer.Option(help="Number of runs")] = 1,
+    exports: Annotated[
+        bool, typer.Option(help="Also time the exports (needs kicad-cli)")
+    ] = False,
+    history: Annotated[Path, typer.Option(help="JSON history file")] = HISTORY_FILE,
+):
+    results = load_results(history)
+    for _ in range(repeat):
+        result = run_benchmark(design, scale, exports=exports)
+        results.append(result)
+        save_results(history, results)
+
+        for name, t in result.stages.items():
+            print(f"{result.key:<24} {name:<24} {t:>9.3f}s")
+        print(f"{result.key:<24} {'total':<24} {result.total:>9.3f}s")
+
+
+@cli.command()
+def layout(
+    count: Annotated[int, typer.Option(help="Number of placed modules")] = 10000,
+    matrix: Annotated[
+        bool, typer.Option(help="LayoutMatrix instead of LayoutExtrude")
+    ] = False,
+):
+    """
+    Compare faebryk's layouts against the batched ones
+    """
+    timings = run_layout_benchmark(count, matrix=matrix)
+    for name, t in timings.items():
+        print(f"layout@{count:<17} {name:<24} {t:>9.3f}s")
+    print(f"speedup {timings['per_node'] / timings['batch']:.1f}x")
+
+
+@cli.command()
+def set_baseline(
+    history: Annotated[Path, typer.Option(help="JSON history file")] = HISTORY_FILE,
+    baseline: Annotated[Path, typer.Option(help="JSON baseline file")] = BASELINE_FILE,
+):
+    """
+    Store the latest run of every design in the history as the baseline
+    """
+    latest = latest_by_key(load_results(history))
+    if not latest:
+        raise typer.BadParameter(f"No benchmark results in {history}")
+    save_results(baseline, list(latest.values()))
+
+
+@cli.command()
+def compare(
+    threshold: Annotated[
+        float, typer.Option(help="Allowed relative slowdown per stage")
+    ] = 0.2,
+    history: Annotated[Path, typer.Option(help="JSON history file")] = HISTORY_FILE,
+    baseline: Annotated[Path, typer.Option(help="JSON baseline file")] = BASELINE_FILE,
+):
+    """
+    Compare the latest run of every design against the baseline
+    """
+    base = latest_by_key(load_results(baseline))
+    current = latest_by_key(load_results(history))
+
+    regressions = []
+    for key, result in current.items():
+        if key not in base:
+            logger.warning(f"No baseline for {key}")
+            continue
+        regressions += compare_results(base[key], result, threshold)
+
+    for r in regressions:
+        print(f"REGRESSION {r}")
+    if regressions:
+        raise typer.Exit(code=1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    setup_basic_logging()
+    cli()
@@ -0,0 +1,432 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Construction cost of the app, attributed to every node type and instance path.
+
+While profiling, `Node._setup` (field instantiation, then `__preinit__` and
+`__postinit__` of all bases) is wrapped to record a frame per constructed node.
+A frame records the time, the allocated memory blocks, and the nodes, graph
+interfaces and links created while it is on top of the stack, its "self" cost.
+The self time is split into phases: fields, init (pre- and postinit) and links
+(`GraphInterface.connect`, which also attaches traits and children). Children
+are constructed while their parent sets up its fields or runs its init, so their
+cost is part of the "total" cost of the parent only. Traits are nodes as well
+and show up as their own types. Allocated bytes are recorded with tracemalloc,
+which slows construction down by an order of magnitude, so it is optional.
+
+Outputs:
+- a table by type or by instance path, sortable by any column
+- a CSV of all instances
+- collapsed stacks of self time per type path (`App;ResistorArray;Resistor`),
+  in microseconds, for flamegraph.pl, speedscope or inferno
+
+Usage:
+    python -m faebrylyzer.construction_profile --sort self_time --top 30
+    python -m faebrylyzer.construction_profile --by path --collapsed app.folded
+"""
+
+import csv
+import logging
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field, fields
+from enum import StrEnum
+from pathlib import Path
+from typing import Callable
+
+import typer
+from faebryk.core.graphinterface import GraphInterface
+from faebryk.core.module import Module
+from faebryk.core.node import Node
+from faebryk.libs.logging import setup_basic_logging
+from typing_extensions import Annotated
+
+from faebrylyzer.benchmark import Design, get_design
+
+logger = logging.getLogger(__name__)
+
+
+PHASES = ("fields", "init", "links")
+
+
+@dataclass
+class Cost:
+    time: float = 0
+    # net allocated memory blocks
+    blocks: int = 0
+    # net allocated bytes, 0 without tracemalloc
+    alloc: int = 0
+    nodes: int = 0
+    gifs: int = 0
+    links: int = 0
+
+    def __iadd__(self, other: "Cost") -> "Cost":
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+        return self
+
+
+@dataclass(eq=False)
+class Frame:
+    node: Node
+    parent: "Frame | None"
+    # one of PHASES
+    phase: str = "fields"
+    own: dict[str, Cost] = field(
+        default_factory=lambda: {phase: Cost() for phase in PHASES}
+    )
+    children: list["Frame"] = field(default_factory=list)
+    total: Cost = field(default_factory=Cost)
+
+    @property
+    def self_cost(self) -> Cost:
+        cost = Cost()
+        for c in self.own.values():
+            cost += c
+        return cost
+
+    @property
+    def type_name(self) -> str:
+        return type(self.node).__qualname__
+
+    @property
+    def path(self) -> str:
+        """
+        Instance path, nodes not added to a parent (e.g. merged parameters) are
+        named by their type below the node constructing them
+        """
+        if self.parent is None or self.node.get_parent() is not None:
+            return self.node.get_full_name()
+        return f"{self.parent.path}.({self.type_name})"
+
+    @property
+    def type_path(self) -> list[str]:
+        frame, out = self, []
+        while frame is not None:
+            out.append(frame.type_name)
+            frame = frame.parent
+        return out[::-1]
+
+
+@dataclass
+class Row:
+    """
+    Cost of a type or an instance, the columns of the table
+    """
+
+    name: str
+    type: str
+    count: int
+    self_time: float
+    total_time: float
+    fields_time: float
+    init_time: float
+    links_time: float
+    self_blocks: int
+    total_blocks: int
+    self_alloc: int
+    total_alloc: int
+    nodes: int
+    gifs: int
+    links: int
+
+
+class Column(StrEnum):
+    count = "count"
+    self_time = "self_time"
+    total_time = "total_time"
+    fields_time = "fields_time"
+    init_time = "init_time"
+    links_time = "links_time"
+    self_blocks = "self_blocks"
+    total_blocks = "total_blocks"
+    self_alloc = "self_alloc"
+    total_alloc = "total_alloc"
+    nodes = "nodes"
+    gifs = "gifs"
+    links = "links"
+
+
+class GroupBy(StrEnum):
+    type = "type"
+    path = "path"
+
+
+class ConstructionProfiler:
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.frames: list[Frame] = []
+        self.root: Frame | None = None
+        self._stack: list[Frame] = []
+        self._mark = (0.0, 0, 0)
+
+    # recording ----------------------------------------------
+    def _now(self) -> tuple[float, int, int]:
+        alloc = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        return time.perf_counter(), sys.getallocatedblocks(), alloc
+
+    def _charge(self):
+        """
+        Charge the time and memory since the last mark to the top frame
+        """
+        now = self._now()
+        if self._stack:
+            top = self._stack[-1]
+            cost = top.own[top.phase]
+            cost.time += now[0] - self._mark[0]
+            cost.blocks += now[1] - self._mark[1]
+            cost.alloc += now[2] - self._mark[2]
+        self._mark = now
+
+    def _count(self, attr: str):
+        if self._stack:
+            top = self._stack[-1]
+            cost = top.own[top.phase]
+            setattr(cost, attr, getattr(cost, attr) + 1)
+
+    def profile[T: Node](self, factory: Callable[[], T]) -> T:
+        """
+        Construct `factory()` with all node constructions recorded
+        """
+        profiler = self
+        setup, setup_fields = Node._setup, Node._setup_fields
+        gif_init, connect = GraphInterface.__init__, GraphInterface.connect
+
+        def _setup(node: Node):
+            profiler._count("nodes")
+            profiler._charge()
+            parent = profiler._stack[-1] if profiler._stack else None
+            frame = Frame(node, parent)
+            if parent:
+                parent.children.append(frame)
+            profiler.frames.append(frame)
+            profiler._stack.append(frame)
+            try:
+                setup(node)
+            finally:
+                profiler._charge()
+                profiler._stack.pop()
+
+        def _setup_fields(node: Node, cls):
+            try:
+                return setup_fields(node, cls)
+            finally:
+                if profiler._stack and profiler._stack[-1].node is node:
+                    profiler._charge()
+                    profiler._stack[-1].phase = "init"
+
+        def _gif_init(gif: GraphInterface, *args, **kwargs):
+            profiler._count("gifs")
+            gif_init(gif, *args, **kwargs)
+
+        def _connect(gif: GraphInterface, *args, **kwargs):
+            if not profiler._stack:
+                return connect(gif, *args, **kwargs)
+            top = profiler._stack[-1]
+            profiler._count("links")
+            profiler._charge()
+            phase, top.phase = top.phase, "links"
+            try:
+                return connect(gif, *args, **kwargs)
+            finally:
+                profiler._charge()
+                top.phase = phase
+
+        start_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        Node._setup = _setup
+        Node._setup_fields = _setup_fields
+        GraphInterface.__init__ = _gif_init
+        GraphInterface.connect = _connect
+        try:
+            self._mark = self._now()
+            out = factory()
+        finally:
+            Node._setup, Node._setup_fields = setup, setup_fields
+            GraphInterface.__init__, GraphInterface.connect = gif_init, connect
+            if start_tracing:
+                tracemalloc.stop()
+
+        roots = [f for f in self.frames if f.parent is None]
+        self.root = next((f for f in roots if f.node is out), roots[-1])
+        for frame in reversed(self.frames):
+            frame.total += frame.self_cost
+            if frame.parent:
+                frame.parent.total += frame.total
+        return out
+
+    # results ------------------------------------------------
+    def rows(self, by: GroupBy = GroupBy.type) -> list[Row]:
+        groups: dict[str, list[Frame]] = defaultdict(list)
+        for frame in self.frames:
+            key = frame.type_name if by == GroupBy.type else frame.path
+            groups[key].append(frame)
+
+        rows = []
+        for name, frames in groups.items():
+            own = [f.own for f in frames]
+            ids = {id(f) for f in frames}
+            self_cost, total = Cost(), Cost()
+            for f in frames:
+                self_cost += f.self_cost
+                # the total of nested frames of the group is in their parents
+                if not any(id(p) in ids for p in _parents(f)):
+                    total += f.total
+            rows.append(
+                Row(
+                    name=name,
+                    type=frames[0].type_name,
+                    count=len(frames),
+                    self_time=self_cost.time,
+                    total_time=total.time,
+                    fields_time=sum(o["fields"].time for o in own),
+                    init_time=sum(o["init"].time for o in own),
+                    links_time=sum(o["links"].time for o in own),
+                    self_blocks=self_cost.blocks,
+                    total_blocks=total.blocks,
+                    self_alloc=self_cost.alloc,
+                    total_alloc=total.alloc,
+                    nodes=total.nodes,
+                    gifs=total.gifs,
+                    links=total.links,
+                )
+            )
+        return rows
+
+    def to_markdown(
+        self,
+        by: GroupBy = GroupBy.type,
+        sort: Column = Column.self_time,
+        top: int | None = 30,
+    ) -> str:
+        rows = sorted(self.rows(by), key=lambda r: getattr(r, sort), reverse=True)
+        root = self.root.total if self.root else Cost()
+        memory = ["Self [kB]", "Total [kB]"] if self.trace_memory else []
+        header = [
+            by.capitalize(),
+            "Count",
+            "Self [ms]",
+            "Total [ms]",
+            "Fields [ms]",
+            "Init [ms]",
+            "Links [ms]",
+            "Self [blocks]",
+            "Total [blocks]",
+            *memory,
+            "Nodes",
+            "GIFs",
+            "Links",
+        ]
+        lines = [
+            f"# Construction profile by {by}",
+            "",
+            f"{len(self.frames)} nodes, {root.gifs} graph interfaces,"
+            f" {root.links} links in {root.time:.3f}s"
+            + (f", {root.alloc / 1e6:.1f} MB" if self.trace_memory else ""),
+            "",
+            f"| {' | '.join(header)} |",
+            f"|{' --- |' * len(header)}",
+        ]
+        for r in rows[:top]:
+            cells = [
+                r.name,
+                r.count,
+                f"{r.self_time * 1e3:.1f}",
+                f"{r.total_time * 1e3:.1f}",
+                f"{r.fields_time * 1e3:.1f}",
+                f"{r.init_time * 1e3:.1f}",
+                f"{r.links_time * 1e3:.1f}",
+                r.self_blocks,
+                r.total_blocks,
+                *(
+                    [f"{r.self_alloc / 1e3:.0f}", f"{r.total_alloc / 1e3:.0f}"]
+                    if self.trace_memory
+                    else []
+                ),
+                r.nodes,
+                r.gifs,
+                r.links,
+            ]
+            lines.append(f"| {' | '.join(map(str, cells))} |")
+        lines.append("")
+        return "\n".join(lines)
+
+    def write_csv(self, path: Path, by: GroupBy = GroupBy.path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=[f.name for f in fields(Row)])
+            writer.writeheader()
+            for row in self.rows(by):
+                writer.writerow(asdict(row))
+        logger.info(f"Wrote construction profile to {path}")
+
+    def collapsed(self) -> dict[str, int]:
+        """
+        Self time in microseconds per type path, with the init and links phases
+        as leaves
+        """
+        stacks: dict[str, float] = defaultdict(float)
+        for frame in self.frames:
+            path = ";".join(frame.type_path)
+            stacks[path] += frame.own["fields"].time
+            stacks[f"{path};[init]"] += frame.own["init"].time
+            stacks[f"{path};[links]"] += frame.own["links"].time
+        return {k: round(v * 1e6) for k, v in stacks.items() if round(v * 1e6) > 0}
+
+    def write_collapsed(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            "".join(f"{k} {v}\n" for k, v in sorted(self.collapsed().items())),
+            encoding="utf-8",
+        )
+        logger.info(f"Wrote collapsed stacks to {path}")
+
+
+def _parents(frame: Frame):
+    while frame.parent is not None:
+        frame = frame.parent
+        yield frame
+
+
+def main(
+    design: Annotated[Design, typer.Option(help="Design to construct")] = Design.app,
+    scale: Annotated[
+        int, typer.Option(help="Size of synthetic designs (arrays or channels)")
+    ] = 8,
+    by: Annotated[GroupBy, typer.Option(help="Rows of the table")] = GroupBy.type,
+    sort: Annotated[Column, typer.Option(help="Column to sort by")] = (
+        Column.self_time
+    ),
+    top: Annotated[int, typer.Option(help="Rows of the table")] = 30,
+    trace_memory: Annotated[
+        bool,
+        typer.Option(help="Also record allocated bytes (tracemalloc, much slower)"),
+    ] = False,
+    csv_path: Annotated[
+        Path | None, typer.Option("--csv", help="Write all instances as CSV")
+    ] = None,
+    collapsed: Annotated[
+        Path | None, typer.Option(help="Write collapsed stacks for flamegraphs")
+    ] = None,
+):
+    from faebrylyzer.main import make_app
+
+    profiler = ConstructionProfiler(trace_memory=trace_memory)
+    factory = get_design(design, scale)
+    app = profiler.profile(lambda: make_app(factory))
+    assert isinstance(app, Module)
+
+    print(profiler.to_markdown(by, sort, top))
+    if csv_path:
+        profiler.write_csv(csv_path)
+    if collapsed:
+        profiler.write_collapsed(collapsed)
+
+
+if __name__ == "__main__":
+    setup_basic_logging()
+    typer.run(main)
@@ -0,0 +1,613 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Fast placement check of a KiCad PCB.
+
+Loads footprint courtyards, pads and silkscreen items (including board level
+silkscreen text and lines) as convex outlines into a uniform grid and reports
+- overlapping courtyards
+- overlapping pads of different nets
+- silkscreen overlapping other silkscreen or pads
+- items not fully inside the board outline
+
+Text extents are estimated from the font size, there is no font rendering.
+Board level silkscreen lines along the outline (mechanical markings of the board
+edge) are not checked. Intentional violations are excluded with an `Allow` list.
+
+Usage:
+    python -m faebrylyzer.drc <kicad_pcb>
+"""
+
+import logging
+import math
+from collections import defaultdict
+from dataclasses import dataclass, field
+from enum import StrEnum, auto
+from fnmatch import fnmatchcase
+from pathlib import Path
+from statistics import median
+from typing import Iterable, Sequence
+
+import typer
+from faebryk.libs.kicad.fileformats import (
+    C_arc,
+    C_circle,
+    C_effects,
+    C_fp_text,
+    C_kicad_pcb_file,
+    C_line,
+    C_rect,
+    C_xyr,
+)
+from faebryk.libs.logging import setup_basic_logging
+from typing_extensions import Annotated
+
+logger = logging.getLogger(__name__)
+
+PCB = C_kicad_pcb_file.C_kicad_pcb
+Footprint = PCB.C_pcb_footprint
+
+Point = tuple[float, float]
+BBox = tuple[float, float, float, float]
+
+# average stroke font character width relative to the font width
+CHAR_WIDTH = 0.9
+
+
+class ItemKind(StrEnum):
+    COURTYARD = auto()
+    PAD = auto()
+    SILKSCREEN = auto()
+
+
+@dataclass
+class Item:
+    kind: ItemKind
+    # reference of the footprint, None for board level items
+    owner: str | None
+    # text of text items, property name of footprint properties
+    name: str
+    layer: str
+    polygon: Sequence[Point]
+    net: int | None = None
+    # library name of the footprint, None for board level items
+    footprint: str | None = None
+    bbox: BBox = field(init=False)
+
+    def __post_init__(self):
+        xs = [x for x, _ in self.polygon]
+        ys = [y for _, y in self.polygon]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.owner or 'board'}:{self.name} ({self.layer})"
+
+
+@dataclass
+class Violation:
+    rule: str
+    a: Item
+    b: Item | None = None
+
+    def __str__(self) -> str:
+        return f"{self.rule}: {self.a}" + (f" <-> {self.b}" if self.b else "")
+
+
+@dataclass(frozen=True)
+class ItemClass:
+    """
+    Items by kind and glob patterns of their footprint and name, `footprint` None
+    matches board level items only
+    """
+
+    kind: ItemKind | None = None
+    footprint: str | None = "*"
+    name: str = "*"
+
+    def matches(self, item: Item) -> bool:
+        if self.kind is not None and item.kind != self.kind:
+            return False
+        if self.footprint is None or item.footprint is None:
+            if self.footprint is not item.footprint:
+                return False
+        elif not fnmatchcase(item.footprint, self.footprint):
+            return False
+        return fnmatchcase(item.name, self.name)
+
+
+ANY_ITEM = ItemClass()
+
+
+@dataclass(frozen=True)
+class Allow:
+    """
+    Intentional violations of `rule` between items of class `a` and `b`, in either
+    order, violations of a single item only need to match `a`
+    """
+
+    rule: str
+    a: ItemClass = ANY_ITEM
+    b: ItemClass = ANY_ITEM
+
+    def matches(self, violation: Violation) -> bool:
+        if violation.rule != self.rule:
+            return False
+        a, b = violation.a, violation.b
+        if b is None:
+            return self.a.matches(a)
+        return (self.a.matches(a) and self.b.matches(b)) or (
+            self.a.matches(b) and self.b.matches(a)
+        )
+
+
+# ----------------------------------------
+#               Geometry
+# ----------------------------------------
+def _rotate(p: Point, angle: float) -> Point:
+    # KiCad angles are counter-clockwise with y pointing down
+    a = math.radians(-angle)
+    c, s = math.cos(a), math.sin(a)
+    return (p[0] * c - p[1] * s, p[0] * s + p[1] * c)
+
+
+def _place(points: Iterable[Point], at: C_xyr | None) -> list[Point]:
+    if at is None:
+        return list(points)
+    return [(at.x + x, at.y + y) for x, y in (_rotate(p, at.r or 0) for p in points)]
+
+
+def _rect(x0: float, y0: float, x1: float, y1: float) -> list[Point]:
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+def _centered_rect(w: float, h: float, angle: float) -> list[Point]:
+    return [_rotate(p, angle) for p in _rect(-w / 2, -h / 2, w / 2, h / 2)]
+
+
+def _bbox_rect(points: Iterable[Point]) -> list[Point]:
+    xs, ys = zip(*points)
+    return _rect(min(xs), min(ys), max(xs), max(ys))
+
+
+def _geo_polygon(geo: C_line | C_rect | C_circle | C_arc) -> list[Point]:
+    """
+    Convex outline of a graphical item including its stroke width
+    """
+    width = geo.stroke.width if geo.stroke else 0
+    if isinstance(geo, C_line):
+        (x0, y0), (x1, y1) = (geo.start.x, geo.start.y), (geo.end.x, geo.end.y)
+        length = math.hypot(x1 - x0, y1 - y0)
+        angle = -math.degrees(math.atan2(y1 - y0, x1 - x0))
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        return [
+            (cx + x, cy + y) for x, y in _centered_rect(length + width, width, angle)
+        ]
+    if isinstance(geo, C_circle):
+        r = math.hypot(geo.end.x - geo.center.x, geo.end.y - geo.center.y) + width / 2
+        return _rect(
+            geo.center.x - r, geo.center.y - r, geo.center.x + r, geo.center.y + r
+        )
+    if isinstance(geo, C_arc):
+        points = [(p.x, p.y) for p in (geo.start, geo.mid, geo.end)]
+    else:
+        points = [(geo.start.x, geo.start.y), (geo.end.x, geo.end.y)]
+    x0, y0, x1, y1 = Item(ItemKind.SILKSCREEN, None, "", "", points).bbox
+    w = width / 2
+    return _rect(x0 - w, y0 - w, x1 + w, y1 + w)
+
+
+def _text_polygon(text: str, at: C_xyr, effects: C_effects) -> list[Point]:
+    """
+    Estimated outline of a text relative to its anchor
+    """
+    font = effects.font
+    size_w, size_h = font.size.w, font.size.h or font.size.w
+    thickness = font.thickness or 0
+    lines = text.split("\n")
+    w = max(len(line) for line in lines) * size_w * CHAR_WIDTH + thickness
+    h = len(lines) * size_h * 1.6 - size_h * 0.6 + thickness
+
+    justify = set(effects.justify or ())
+    x0 = -w / 2
+    if C_effects.E_justify.left in justify:
+        x0 = 0
+    elif C_effects.E_justify.right in justify:
+        x0 = -w
+    if C_effects.E_justify.mirror in justify:
+        x0 = -x0 - w
+    y0 = -h / 2
+    if C_effects.E_justify.top in justify:
+        y0 = 0
+    elif C_effects.E_justify.bottom in justify:
+        y0 = -h
+
+    return [_rotate(p, at.r or 0) for p in _rect(x0, y0, x0 + w, y0 + h)]
+
+
+def _separated(a: Sequence[Point], b: Sequence[Point], clearance: float) -> bool:
+    """
+    Separating axis test of two convex polygons
+    """
+    for poly in (a, b):
+        for i in range(len(poly)):
+            (x0, y0), (x1, y1) = poly[i], poly[(i + 1) % len(poly)]
+            nx, ny = y0 - y1, x1 - x0
+            norm = math.hypot(nx, ny)
+            if norm == 0:
+                continue
+            nx, ny = nx / norm, ny / norm
+            pa = [x * nx + y * ny for x, y in a]
+            pb = [x * nx + y * ny for x, y in b]
+            if max(pa) + clearance <= min(pb) or max(pb) + clearance <= min(pa):
+                return True
+    return False
+
+
+def _inside(p: Point, polygon: Sequence[Point]) -> bool:
+    x, y = p
+    inside = False
+    for i in range(len(polygon)):
+        (x0, y0), (x1, y1) = polygon[i - 1], polygon[i]
+        if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+            inside = not inside
+    return inside
+
+
+def _crosses(a0: Point, a1: Point, b0: Point, b1: Point) -> bool:
+    def orientation(p: Point, q: Point, r: Point) -> float:
+        return (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+
+    return (
+        orientation(a0, a1, b0) * orientation(a0, a1, b1) < 0
+        and orientation(b0, b1, a0) * orientation(b0, b1, a1) < 0
+    )
+
+
+# ----------------------------------------
+#               Items
+# ----------------------------------------
+def _side(layer: str) -> str:
+    return layer.split(".")[0]
+
+
+def _pad_layers(layers: list[str]) -> list[str]:
+    out = []
+    for layer in layers:
+        if layer == "*.Cu":
+            out += ["F.Cu", "B.Cu"]
+        elif layer.endswith(".Cu"):
+            out.append(layer)
+    return out
+
+
+def _footprint_items(fp: Footprint) -> list[Item]:
+    ref_prop = fp.propertys.get("Reference")
+    ref = ref_prop.value if ref_prop else fp.name
+    items: list[Item] = []
+
+    courtyard: dict[str, list[Point]] = defaultdict(list)
+    fab: list[Point] = []
+    for geo in [*fp.fp_lines, *fp.fp_arcs, *fp.fp_circles, *fp.fp_rects]:
+        if geo.layer.endswith(".CrtYd"):
+            courtyard[geo.layer] += _geo_polygon(geo)
+        elif geo.layer.endswith(".Fab"):
+            fab += _geo_polygon(geo)
+        elif geo.layer.endswith(".SilkS"):
+            items.append(
+                Item(
+                    ItemKind.SILKSCREEN,
+                    ref,
+                    "graphic",
+                    geo.layer,
+                    _place(_geo_polygon(geo), fp.at),
+                )
+            )
+    for poly in fp.fp_poly:
+        points = [(p.x, p.y) for p in poly.pts.xys]
+        if poly.layer.endswith(".CrtYd"):
+            courtyard[poly.layer] += points
+        elif poly.layer.endswith(".SilkS") and points:
+            items.append(
+                Item(
+                    ItemKind.SILKSCREEN,
+                    ref,
+                    "polygon",
+                    poly.layer,
+                    _place(_bbox_rect(points), fp.at),
+                )
+            )
+    if not courtyard:
+        # footprints without courtyard (e.g. from EasyEDA): use pads and fab outline
+        fp_angle = fp.at.r or 0
+        for pad in fp.pads:
+            fab += [
+                (pad.at.x + x, pad.at.y + y)
+                for x, y in _centered_rect(
+                    pad.size.w, pad.size.h or pad.size.w, (pad.at.r or 0) - fp_angle
+                )
+            ]
+        if fab:
+            courtyard[f"{_side(fp.layer)}.CrtYd"] = fab
+    for layer, points in courtyard.items():
+        items.append(
+            Item(
+                ItemKind.COURTYARD,
+                ref,
+                "courtyard",
+                layer,
+                _place(_bbox_rect(points), fp.at),
+            )
+        )
+
+    for pad in fp.pads:
+        # pad angles are absolute, positions relative to the footprint
+        center = _place([(pad.at.x, pad.at.y)], fp.at)[0]
+        outline = [
+            (center[0] + x, center[1] + y)
+            for x, y in _centered_rect(
+                pad.size.w, pad.size.h or pad.size.w, pad.at.r or 0
+            )
+        ]
+        for layer in _pad_layers(pad.layers):
+            items.append(
+                Item(
+                    ItemKind.PAD,
+                    ref,
+                    pad.name,
+                    layer,
+                    outline,
+                    net=pad.net.number if pad.net and pad.net.number else None,
+                )
+            )
+
+    texts = [
+        (t.text, t.text, t.at, t.layer.layer, t.effects)
+        for t in fp.fp_texts
+        if t.type == C_fp_text.E_type.user
+    ] + [
+        (p.name, p.value, p.at, p.layer.layer, p.effects)
+        for p in fp.propertys.values()
+        if not p.hide
+    ]
+    for name, text, at, layer, effects in texts:
+        if not layer.endswith(".SilkS") or not text:
+            continue
+        anchor = _place([(at.x, at.y)], fp.at)[0]
+        items.append(
+            Item(
+                ItemKind.SILKSCREEN,
+                ref,
+                name,
+                layer,
+                [
+                    (anchor[0] + x, anchor[1] + y)
+                    for x, y in _text_polygon(text, at, effects)
+                ],
+            )
+        )
+
+    for item in items:
+        item.footprint = fp.name
+    return items
+
+
+def _on_outline(line: C_line, outline: Sequence[Point], tolerance=1e-3) -> bool:
+    """
+    `line` lies on an edge of the `outline` polygon
+    """
+    (x0, y0), (x1, y1) = (line.start.x, line.start.y), (line.end.x, line.end.y)
+    for (ex0, ey0), (ex1, ey1) in (
+        (outline[i - 1], outline[i]) for i in range(len(outline))
+    ):
+        length = math.hypot(ex1 - ex0, ey1 - ey0)
+        if length == 0:
+            continue
+        # distance of both ends to the edge and their position along it
+        dx, dy = (ex1 - ex0) / length, (ey1 - ey0) / length
+        if all(
+            abs((x - ex0) * dy - (y - ey0) * dx) <= tolerance
+            and -tolerance <= (x - ex0) * dx + (y - ey0) * dy <= length + tolerance
+            for x, y in ((x0, y0), (x1, y1))
+        ):
+            return True
+    return False
+
+
+def get_items(pcb: PCB, outline: Sequence[Point] | None = None) -> list[Item]:
+    """
+    Items of all footprints and the board level silkscreen, except for silkscreen
+    lines on an edge of `outline`
+    """
+    items = [item for fp in pcb.footprints for item in _footprint_items(fp)]
+
+    for geo in [*pcb.gr_lines, *pcb.gr_arcs, *pcb.gr_circles, *pcb.gr_rects]:
+        if geo.layer.endswith(".SilkS"):
+            if outline and isinstance(geo, C_line) and _on_outline(geo, outline):
+                continue
+            items.append(
+                Item(ItemKind.SILKSCREEN, None, "graphic", geo.layer, _geo_polygon(geo))
+            )
+    for text in pcb.gr_texts:
+        if text.layer.layer.endswith(".SilkS") and text.text:
+            items.append(
+                Item(
+                    ItemKind.SILKSCREEN,
+                    None,
+                    text.text,
+                    text.layer.layer,
+                    [
+                        (text.at.x + x, text.at.y + y)
+                        for x, y in _text_polygon(text.text, text.at, text.effects)
+                    ],
+                )
+            )
+
+    return items
+
+
+# ----------------------------------------
+#             Spatial index
+# ----------------------------------------
+class GridIndex:
+    """
+    Uniform grid over item bounding boxes
+    """
+
+    def __init__(self, items: Sequence[Item], cell_size: float | None = None):
+        self.items = items
+        if cell_size is None:
+            extents = [max(i.bbox[2] - i.bbox[0], i.bbox[3] - i.bbox[1]) for i in items]
+            cell_size = max(2 * median(extents), 0.5) if extents else 1
+        self.cell_size = cell_size
+
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        for idx, item in enumerate(items):
+            for cell in self._cells(item.bbox):
+                self.cells[cell].append(idx)
+
+    def _cells(self, bbox: BBox) -> Iterable[tuple[int, int]]:
+        x0, y0, x1, y1 = (math.floor(v / self.cell_size) for v in bbox)
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                yield i, j
+
+    def candidate_pairs(self, clearance: float = 0) -> set[tuple[int, int]]:
+        """
+        Index pairs of all items with overlapping bounding boxes
+        """
+        pairs: set[tuple[int, int]] = set()
+        for members in self.cells.values():
+            for n, ia in enumerate(members):
+                a = self.items[ia].bbox
+                for ib in members[n + 1 :]:
+                    b = self.items[ib].bbox
+                    if (
+                        a[0] < b[2] + clearance
+                        and b[0] < a[2] + clearance
+                        and a[1] < b[3] + clearance
+                        and b[1] < a[3] + clearance
+                    ):
+                        pairs.add((ia, ib) if ia < ib else (ib, ia))
+        return pairs
+
+
+# ----------------------------------------
+#               Checks
+# ----------------------------------------
+def _rule(a: Item, b: Item) -> str | None:
+    """
+    Name of the rule that forbids `a` and `b` to overlap, if any
+    """
+    if a.owner is not None and a.owner == b.owner:
+        return None
+
+    kinds = {a.kind, b.kind}
+    if kinds == {ItemKind.COURTYARD}:
+        return "courtyard overlap" if a.layer == b.layer else None
+    if kinds == {ItemKind.PAD}:
+        if a.layer != b.layer or (a.net is not None and a.net == b.net):
+            return None
+        return "pad overlap"
+    if kinds == {ItemKind.SILKSCREEN}:
+        return "silkscreen overlap" if a.layer == b.layer else None
+    if kinds == {ItemKind.SILKSCREEN, ItemKind.PAD}:
+        return "silkscreen on pad" if _side(a.layer) == _side(b.layer) else None
+    return None
+
+
+def check_overlaps(items: Sequence[Item], clearance: float = 0) -> list[Violation]:
+    index = GridIndex(items)
+    violations = {}
+    for ia, ib in sorted(index.candidate_pairs(clearance)):
+        a, b = items[ia], items[ib]
+        rule = _rule(a, b)
+        if rule is None or _separated(a.polygon, b.polygon, clearance):
+            continue
+        # report every pair of named items once, not every pair of their strokes
+        violation = Violation(rule, a, b)
+        violations.setdefault(str(violation), violation)
+    return list(violations.values())
+
+
+def check_outline(items: Sequence[Item], outline: Sequence[Point]) -> list[Violation]:
+    """
+    Items not fully inside the board `outline` polygon
+    """
+    edges = [
+        (e0, e1, Item(ItemKind.COURTYARD, None, "", "", [e0, e1]).bbox)
+        for e0, e1 in ((outline[i - 1], outline[i]) for i in range(len(outline)))
+    ]
+    violations = []
+    for item in items:
+        poly = item.polygon
+        x0, y0, x1, y1 = item.bbox
+        # only edges near the item can cross it
+        near = [
+            (e0, e1)
+            for e0, e1, (ex0, ey0, ex1, ey1) in edges
+            if ex0 <= x1 and x0 <= ex1 and ey0 <= y1 and y0 <= ey1
+        ]
+        if not near:
+            # entirely inside or entirely outside
+            if _inside(poly[0], outline):
+                continue
+        elif all(_inside(p, outline) for p in poly) and not any(
+            _crosses(poly[i - 1], poly[i], e0, e1)
+            for i in range(len(poly))
+            for e0, e1 in near
+        ):
+            continue
+        violations.append(Violation("outside outline", item))
+    return violations
+
+
+def check_placement(
+    pcb: PCB,
+    outline: Sequence[Point] | None = None,
+    clearance: float = 0,
+    allow: Sequence[Allow] = (),
+) -> list[Violation]:
+    """
+    Violations of the placement rules, except for the ones matched by `allow`
+    """
+    items = get_items(pcb, outline)
+    violations = check_overlaps(items, clearance)
+    if outline:
+        violations += check_outline(items, outline)
+
+    problems = [v for v in violations if not any(a.matches(v) for a in allow)]
+    if len(problems) < len(violations):
+        logger.debug(f"Allowed {len(violations) - len(problems)} placement problems")
+    return problems
+
+
+def log_violations(violations: list[Violation]):
+    if not violations:
+        logger.info("Placement check passed")
+        return
+    logger.warning(f"Placement check found {len(violations)} problems")
+    for v in violations:
+        logger.warning(f"  {v}")
+
+
+def main(
+    pcbfile: Annotated[Path, typer.Argument(help="KiCad PCB file to check")],
+    clearance: Annotated[
+        float, typer.Option(help="Minimum distance between items in mm")
+    ] = 0,
+):
+    # pcb.py routes with the items of this module
+    from faebrylyzer.pcb import BOARD_SIZE, DRC_ALLOWLIST, get_outline_coordinates
+
+    pcb = C_kicad_pcb_file.loads(pcbfile).kicad_pcb
+    log_violations(
+        check_placement(
+            pcb, get_outline_coordinates(BOARD_SIZE), clearance, DRC_ALLOWLIST
+        )
+    )
+
+
+if __name__ == "__main__":
+    setup_basic_logging()
+    typer.run(main)
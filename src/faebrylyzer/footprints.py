@@ -0,0 +1,184 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Batched footprint edits for PCB_Transformer passes.
+
+Edits are queued with a selection (layer, designator prefix, module type or any
+predicate) and applied in one pass over the footprints. All edits matching a
+footprint are merged in the order they were added, later values win, so the
+reference designator is moved and re-fonted at most once and the silkscreen
+bbox of a footprint is computed at most once.
+
+Only reference designators can be edited so far, they are the one per-footprint
+pass of `pcb.transform_pcb` (replacing set_designator_position), the rest of its
+silkscreen are board level texts and lines.
+
+Usage:
+    editor = FootprintEditor(transformer)
+    editor.add(DesignatorEdit(offset=0.75, font=Font(...)))
+    editor.add(DesignatorEdit(hide=True), Select(prefixes=("LOGO",)))
+    editor.apply()
+"""
+
+import logging
+import re
+from dataclasses import dataclass, fields
+from typing import Callable, Optional
+
+# the library has to be loaded before the transformer (circular import)
+import faebryk.library._F  # noqa: F401
+from faebryk.core.module import Module
+from faebryk.exporters.pcb.kicad.transformer import Font, PCB_Transformer
+from faebryk.libs.kicad.fileformats import (
+    C_effects,
+    C_kicad_pcb_file,
+    C_text_layer,
+    C_xy,
+    C_xyr,
+)
+
+logger = logging.getLogger(__name__)
+
+Footprint = C_kicad_pcb_file.C_kicad_pcb.C_pcb_footprint
+Side = PCB_Transformer.Side
+Justify = tuple[C_effects.E_justify, C_effects.E_justify, C_effects.E_justify]
+
+
+def designator_prefix(fp: Footprint) -> str:
+    """
+    Reference without its number, e.g. `R` for `R12`, `LOGO` for `LOGO1`
+    """
+    reference = fp.propertys.get("Reference")
+    if reference is None:
+        return ""
+    match = re.match(r"^\D*", reference.value)
+    return match.group(0) if match else ""
+
+
+@dataclass(frozen=True)
+class Select:
+    """
+    Footprints matching all given criteria, everything by default
+    """
+
+    # footprint side, "F" or "B", or a full layer name
+    layer: str | None = None
+    prefixes: tuple[str, ...] = ()
+    types: tuple[type[Module], ...] = ()
+    where: Callable[[Module, Footprint], bool] | None = None
+
+    def __call__(self, module: Module, fp: Footprint) -> bool:
+        if self.layer is not None and not fp.layer.startswith(self.layer):
+            return False
+        if self.prefixes and designator_prefix(fp) not in self.prefixes:
+            return False
+        if self.types and not isinstance(module, self.types):
+            return False
+        return self.where is None or self.where(module, fp)
+
+
+@dataclass(frozen=True)
+class DesignatorEdit:
+    """
+    Changes to the reference designator of a footprint, None keeps the value
+
+    The arguments are the ones of `PCB_Transformer.set_designator_position`,
+    `offset` moves the designator next to the silkscreen bbox on `side`.
+    `layer` None puts it on the silkscreen of the footprint side (which resets
+    the knockout, as set_designator_position does).
+    """
+
+    offset: Optional[float] = None
+    displacement: Optional[C_xy] = None
+    rotation: Optional[float] = None
+    side: Optional[Side] = None
+    layer: Optional[C_text_layer] = None
+    font: Optional[Font] = None
+    knockout: Optional[C_text_layer.E_knockout] = None
+    justify: Optional[Justify] = None
+    hide: Optional[bool] = None
+
+    def merge(self, other: "DesignatorEdit") -> "DesignatorEdit":
+        """
+        This edit overridden by the values set in `other`
+        """
+        return DesignatorEdit(
+            **{
+                f.name: (
+                    getattr(other, f.name)
+                    if getattr(other, f.name) is not None
+                    else getattr(self, f.name)
+                )
+                for f in fields(self)
+            }
+        )
+
+
+class FootprintEditor:
+    def __init__(self, transformer: PCB_Transformer):
+        self.transformer = transformer
+        self.edits: list[tuple[Select, DesignatorEdit]] = []
+
+    def add(self, edit: DesignatorEdit, select: Select = Select()):
+        self.edits.append((select, edit))
+
+    def apply(self) -> int:
+        """
+        Apply all edits in one pass over the footprints, returns the number of
+        edited footprints
+        """
+        edited = 0
+        for module, fp in self.transformer.get_all_footprints():
+            merged = None
+            for select, edit in self.edits:
+                if select(module, fp):
+                    merged = edit if merged is None else merged.merge(edit)
+            if merged is None:
+                continue
+            self._apply(module, fp, merged)
+            edited += 1
+
+        logger.info(f"Applied {len(self.edits)} footprint edits to {edited} fps")
+        return edited
+
+    def _apply(self, module: Module, fp: Footprint, edit: DesignatorEdit):
+        reference = fp.propertys["Reference"]
+
+        reference.layer = (
+            edit.layer
+            if edit.layer
+            else C_text_layer(
+                layer="F.SilkS" if fp.layer.startswith("F") else "B.SilkS"
+            )
+        )
+        if edit.knockout:
+            reference.layer.knockout = edit.knockout
+        if edit.font:
+            reference.effects.font = edit.font
+        if edit.justify:
+            reference.effects.justify = edit.justify
+        if edit.hide is not None:
+            reference.hide = edit.hide
+
+        rot = edit.rotation if edit.rotation else reference.at.r
+        if edit.offset is None:
+            reference.at = C_xyr(reference.at.x, reference.at.y, rot)
+            return
+
+        bbox = self.transformer.get_footprint_silkscreen_bbox(module)
+        if not bbox:
+            return
+        (min_x, min_y), (max_x, max_y) = bbox
+        d = edit.displacement or C_xy(0, 0)
+        offset = edit.offset
+
+        match edit.side or Side.BOTTOM:
+            case Side.BOTTOM:
+                reference.at = C_xyr(d.x, max_y + offset - d.y, rot)
+            case Side.TOP:
+                reference.at = C_xyr(d.x, min_y - offset - d.y, rot)
+            case Side.LEFT:
+                reference.at = C_xyr(min_x - offset - d.x, d.y, rot)
+            case Side.RIGHT:
+                reference.at = C_xyr(max_x + offset + d.x, d.y, rot)
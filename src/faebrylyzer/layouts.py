@@ -0,0 +1,195 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Vectorized LayoutExtrude/LayoutMatrix.
+
+faebryk evaluates these layouts node by node, one `Geometry.abs_pos` per child,
+and defines the children relative to their parent, so every absolute position is
+resolved again by walking up the hierarchy through all relative positions above
+it (once per footprint when they are moved).
+
+`BatchLayout` computes the transforms (position, rotation and layer) of all
+children of a layout as one NumPy batch, composed with the already placed parents,
+and defines them absolutely, so moving the footprints is a single cheap pass.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import faebryk.library._F as F
+import numpy as np
+from faebryk.core.node import Node
+from faebryk.exporters.pcb.layout.extrude import LayoutExtrude
+from faebryk.exporters.pcb.layout.layout import Layout
+from faebryk.exporters.pcb.layout.matrix import LayoutMatrix
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+logger = logging.getLogger(__name__)
+
+L = F.has_pcb_position.layer_type
+
+
+# ----------------------------------------
+#               Geometry
+# ----------------------------------------
+def compose(
+    parent: "NDArray[np.float64]", child: "NDArray[np.float64]"
+) -> "NDArray[np.float64]":
+    """
+    Vectorized `Geometry.abs_pos` of (..., 3) arrays of x, y, r
+    """
+    a = np.radians(-parent[..., 2])
+    c, s = np.cos(a), np.sin(a)
+    x, y = child[..., 0], child[..., 1]
+    return np.stack(
+        [
+            parent[..., 0] + x * c - y * s,
+            parent[..., 1] + x * s + y * c,
+            parent[..., 2] + child[..., 2],
+        ],
+        axis=-1,
+    )
+
+
+def relative(
+    parent: "NDArray[np.float64]", child: "NDArray[np.float64]"
+) -> "NDArray[np.float64]":
+    """
+    Inverse of `compose`: `child` relative to `parent`
+    """
+    a = np.radians(parent[..., 2])
+    c, s = np.cos(a), np.sin(a)
+    x, y = child[..., 0] - parent[..., 0], child[..., 1] - parent[..., 1]
+    return np.stack(
+        [x * c - y * s, x * s + y * c, child[..., 2] - parent[..., 2]], axis=-1
+    )
+
+
+def compose_layers(
+    parent: "NDArray[np.int64]", child: "NDArray[np.int64]"
+) -> "NDArray[np.int64]":
+    """
+    Vectorized layer of `Geometry.abs_pos`, only one of both may be set
+    """
+    both = (parent != L.NONE) & (child != L.NONE)
+    if both.any():
+        i = int(np.flatnonzero(both)[0])
+        raise Exception(
+            f"Adding two non-zero layers: parent_layer={L(parent[i])!r}"
+            f" + child_layer={L(child[i])!r}"
+        )
+    return parent + child
+
+
+# ----------------------------------------
+#               Layouts
+# ----------------------------------------
+@dataclass(frozen=True, eq=True)
+class BatchLayout(Layout):
+    """
+    `LayoutExtrude` or `LayoutMatrix` with all child transforms computed at once
+    """
+
+    layout: LayoutExtrude | LayoutMatrix
+
+    def order(self, nodes: tuple[Node, ...]) -> list[Node]:
+        """
+        Nodes without position in the order of the wrapped layout
+        """
+        nodes = tuple(n for n in nodes if not n.has_trait(F.has_pcb_position))
+
+        if isinstance(self.layout, LayoutMatrix):
+            capacity = self.layout.distribution[0] * self.layout.distribution[1]
+            if len(nodes) > capacity:
+                raise ValueError(
+                    f"Number of nodes ({len(nodes)}) is more than we can"
+                    f" distribute ({capacity})"
+                )
+
+        # LayoutMatrix takes the nodes in the order they come in, which is the
+        # iteration order of a set in LayoutTypeHierarchy, sort them like
+        # LayoutExtrude instead
+        return sorted(
+            nodes,
+            key=lambda n: n.get_trait(F.has_designator).get_designator()
+            if n.has_trait(F.has_designator)
+            else n.get_full_name(),
+            reverse=getattr(self.layout, "reverse_order", False),
+        )
+
+    def multiples(self, count: int) -> "NDArray[np.float64]":
+        """
+        Multiples of the layout vector (x, y, r) of the first `count` children
+        """
+        i = np.arange(count, dtype=np.float64)
+        if isinstance(self.layout, LayoutMatrix):
+            rows = self.layout.distribution[1]
+            return np.stack([i // rows, i % rows, np.ones(count)], axis=1)
+        r = i if self.layout.dynamic_rotation else np.ones(count)
+        return np.stack([i, i, r], axis=1)
+
+    def transforms(self, count: int) -> "NDArray[np.float64]":
+        """
+        Positions (x, y, r) relative to the parent of the first `count` children
+        """
+        vector = np.array((*self.layout.vector, 0)[:3], dtype=np.float64)
+        offsets = self.multiples(count) * vector
+        offsets[:, 2] %= 360
+        return compose(np.array(self.layout.base[:3], dtype=np.float64), offsets)
+
+    def apply(self, *node: Node):
+        nodes = self.order(node)
+        if not nodes:
+            return
+
+        # layouts are applied top down, so the parents are placed already
+        parents = _parent_positions(nodes)
+        transforms = self.transforms(len(nodes))
+        layer = self.layout.base[3]
+
+        # without placed parent: left to faebryk to report
+        for n, p, (x, y, r) in zip(nodes, parents, transforms.tolist()):
+            if p is None:
+                n.add(F.has_pcb_position_defined_relative_to_parent((x, y, r, layer)))
+
+        placed = [i for i, p in enumerate(parents) if p is not None]
+        if not placed:
+            return
+        frames = np.array([parents[i] for i in placed], dtype=np.float64)
+        positions = compose(frames[:, :3], transforms[placed]).tolist()
+        layers = compose_layers(
+            frames[:, 3].astype(np.int64), np.full(len(placed), int(layer))
+        ).tolist()
+        for i, (x, y, r), z in zip(placed, positions, layers):
+            nodes[i].add(F.has_pcb_position_defined((x, y, r, L(z))))
+
+
+def _parent_positions(
+    nodes: list[Node],
+) -> list[tuple[float, float, float, int] | None]:
+    """
+    Position of the closest placed ancestor of every node, looked up once per
+    parent
+    """
+    cache: dict[Node, tuple[float, float, float, int] | None] = {}
+
+    def lookup(parent: Node | None):
+        if parent is None:
+            return None
+        if parent not in cache:
+            if parent.has_trait(F.has_pcb_position):
+                cache[parent] = parent.get_trait(F.has_pcb_position).get_position()
+            else:
+                grandparent = parent.get_parent()
+                cache[parent] = lookup(grandparent[0] if grandparent else None)
+        return cache[parent]
+
+    out = []
+    for n in nodes:
+        parent = n.get_parent()
+        out.append(lookup(parent[0] if parent else None))
+    return out
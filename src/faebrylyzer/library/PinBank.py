@@ -0,0 +1,69 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Sequence
+from typing import overload
+
+from faebryk.core.module import Module
+
+import faebrylyzer.library._F as F
+
+logger = logging.getLogger(__name__)
+
+
+class PinBank(Sequence["F.Electrical"]):
+    """
+    Pins of a footprint module that are only created when accessed.
+
+    Unused pins never get an F.Electrical (and thus no graph nodes). Pins created
+    after the footprint got attached are attached to their pad on creation.
+    """
+
+    def __init__(self, owner: Module, pin_names: list[str], name: str = "unnamed"):
+        self._owner = owner
+        self._name = name
+        self.pin_names = pin_names
+        self._pins: dict[int, F.Electrical] = {}
+        self._footprint: F.Footprint | None = None
+
+    def __len__(self) -> int:
+        return len(self.pin_names)
+
+    @overload
+    def __getitem__(self, index: int) -> F.Electrical: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[F.Electrical]: ...
+
+    def __getitem__(self, index: int | slice) -> F.Electrical | list[F.Electrical]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+
+        # normalizes negative indices & raises IndexError
+        index = range(len(self))[index]
+
+        if index not in self._pins:
+            pin = self._owner.add(F.Electrical(), name=f"{self._name}[{index}]")
+            self._pins[index] = pin
+            if self._footprint is not None:
+                self._attach_pins({self.pin_names[index]: pin})
+
+        return self._pins[index]
+
+    @property
+    def pinmap(self) -> dict[str, F.Electrical]:
+        """
+        Footprint pinmap of all pins created so far
+        """
+        return {self.pin_names[i]: pin for i, pin in sorted(self._pins.items())}
+
+    def attach(self, footprint: F.Footprint):
+        self._footprint = footprint
+        self._attach_pins(self.pinmap)
+
+    def _attach_pins(self, pinmap: dict[str, F.Electrical]):
+        assert self._footprint is not None
+        self._footprint.get_trait(F.can_attach_via_pinmap).attach(pinmap)
@@ -3,19 +3,52 @@
 
 import logging
 
-import faebryk.library._F as F
 from faebryk.core.module import Module
 from faebryk.libs.library import L
 from faebryk.libs.units import Quantity
 
+import faebrylyzer.library._F as F
+
 logger = logging.getLogger(__name__)
 
 
 class ResistorArray(Module):
-    resistance: F.TBD[Quantity]
-    rated_power: F.TBD[Quantity]
-    rated_voltage: F.TBD[Quantity]
+    class Element(Module):
+        """
+        Single resistor of a ResistorArray.
+
+        Only has its two terminals, the values are shared by the whole array.
+        """
+
+        unnamed = L.list_field(2, lambda: F.Electrical())
+
+        @L.rt_field
+        def can_bridge(self):
+            return F.can_bridge_defined(*self.unnamed)
+
+        @property
+        def array(self) -> "ResistorArray":
+            parent = self.get_parent()
+            assert parent and isinstance(parent[0], ResistorArray)
+            return parent[0]
+
+        @property
+        def resistance(self) -> "F.TBD[Quantity]":
+            return self.array.resistance
+
+        @property
+        def rated_power(self) -> "F.TBD[Quantity]":
+            return self.array.rated_power
+
+        @property
+        def rated_voltage(self) -> "F.TBD[Quantity]":
+            return self.array.rated_voltage
+
+    # fields are constructed lazily, so importing this does not load faebryk.library
+    resistance = L.d_field(lambda: F.TBD[Quantity]())
+    rated_power = L.d_field(lambda: F.TBD[Quantity]())
+    rated_voltage = L.d_field(lambda: F.TBD[Quantity]())
 
-    resistor = L.list_field(4, F.Resistor)
+    resistor = L.list_field(4, Element)
 
-    designator_prefix = L.f_field(F.has_designator_prefix_defined)("R")
+    designator_prefix = L.d_field(lambda: F.has_designator_prefix_defined("R"))
@@ -3,25 +3,29 @@
 
 import logging
 
-import faebryk.library._F as F
 from faebryk.core.module import Module
 from faebryk.libs.library import L
 
+import faebrylyzer.library._F as F
+from faebrylyzer.library.PinBank import PinBank
+
 logger = logging.getLogger(__name__)
 
 
 class SFPEdgeConnector(Module):
-    unnamed = L.list_field(20, F.Electrical)
+    pin_names = [f"{i+1}" for i in range(20)]
+
+    designator_prefix = L.d_field(lambda: F.has_designator_prefix_defined("J"))
 
-    designator_prefix = L.f_field(F.has_designator_prefix_defined)("J")
+    def __init__(self):
+        super().__init__()
+        self.unnamed = PinBank(self, self.pin_names)
 
     @L.rt_field
     def footprint(self):
-        return F.can_attach_to_footprint_via_pinmap(
-            pinmap={f"{i+1}": self.unnamed[i] for i in range(20)}
-        )
+        return F.can_attach_to_footprint_via_pinbank(self.unnamed)
 
     def __preinit__(self):
         self.footprint.attach(
-            F.KicadFootprint("custom:SFP_Edge", pin_names=[f"{i+1}" for i in range(20)])
+            F.KicadFootprint("custom:SFP_Edge", pin_names=self.pin_names)
         )
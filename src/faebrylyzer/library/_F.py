@@ -0,0 +1,84 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Lazy facade over faebryk.library and faebrylyzer.library.
+
+Use as `import faebrylyzer.library._F as F`. `F.<Name>` is resolved on first
+access: faebrylyzer modules through the map below, everything else through
+faebryk.library._F. faebryk's library can only be imported as a whole, so it is
+loaded by the first access of one of its names instead of on import.
+
+The map is generated with `python -m faebrylyzer.library._F`.
+"""
+
+import importlib
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from faebryk.library._F import *  # noqa: F403
+
+    from faebrylyzer.library.can_attach_to_footprint_via_pinbank import (  # noqa: F401
+        can_attach_to_footprint_via_pinbank,
+    )
+    from faebrylyzer.library.faebrykLogo import faebrykLogo  # noqa: F401
+    from faebrylyzer.library.faebrylyzerModule import faebrylyzerModule  # noqa: F401
+    from faebrylyzer.library.MountingSlot import MountingSlot  # noqa: F401
+    from faebrylyzer.library.PinBank import PinBank  # noqa: F401
+    from faebrylyzer.library.ResistorArray import ResistorArray  # noqa: F401
+    from faebrylyzer.library.SFPEdgeConnector import SFPEdgeConnector  # noqa: F401
+
+# generated -------------------------------------------------------------------
+MODULES = {
+    "MountingSlot": "faebrylyzer.library.MountingSlot",
+    "PinBank": "faebrylyzer.library.PinBank",
+    "ResistorArray": "faebrylyzer.library.ResistorArray",
+    "SFPEdgeConnector": "faebrylyzer.library.SFPEdgeConnector",
+    "can_attach_to_footprint_via_pinbank": (
+        "faebrylyzer.library.can_attach_to_footprint_via_pinbank"
+    ),
+    "faebrykLogo": "faebrylyzer.library.faebrykLogo",
+    "faebrylyzerModule": "faebrylyzer.library.faebrylyzerModule",
+}
+# end generated ---------------------------------------------------------------
+
+FAEBRYK_LIBRARY = "faebryk.library._F"
+
+
+def __getattr__(name: str) -> Any:
+    if name.startswith("__"):
+        raise AttributeError(name)
+
+    module = importlib.import_module(MODULES.get(name, FAEBRYK_LIBRARY))
+    try:
+        value = getattr(module, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(MODULES))
+
+
+def generate() -> dict[str, str]:
+    """
+    Map of all library modules that define a class named like the module
+    """
+    return {
+        path.stem: f"{__package__}.{path.stem}"
+        for path in sorted(Path(__file__).parent.glob("*.py"), key=lambda p: p.stem)
+        if not path.stem.startswith("_")
+        and re.search(rf"^class {path.stem}\b", path.read_text(), re.MULTILINE)
+    }
+
+
+if __name__ == "__main__":
+    print("MODULES = {")
+    for name, module in generate().items():
+        print(f'    "{name}": "{module}",')
+    print("}")
@@ -0,0 +1,15 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+import faebrylyzer.library._F as F
+from faebrylyzer.library.PinBank import PinBank
+
+
+class can_attach_to_footprint_via_pinbank(F.can_attach_to_footprint.impl()):
+    def __init__(self, pins: PinBank) -> None:
+        super().__init__()
+        self.pins = pins
+
+    def attach(self, footprint: F.Footprint):
+        self.obj.add(F.has_footprint_defined(footprint))
+        self.pins.attach(footprint)
@@ -3,17 +3,18 @@
 
 import logging
 
-import faebryk.library._F as F
 from faebryk.core.module import Module
 from faebryk.libs.library import L
 
+import faebrylyzer.library._F as F
+
 logger = logging.getLogger(__name__)
 
 
 class faebrykLogo(Module):
-    designator_prefix = L.f_field(F.has_designator_prefix_defined)("LOGO")
+    designator_prefix = L.d_field(lambda: F.has_designator_prefix_defined("LOGO"))
 
-    footprint: F.can_attach_to_footprint_symmetrically
+    footprint = L.d_field(lambda: F.can_attach_to_footprint_symmetrically())
 
     def __preinit__(self):
         self.footprint.attach(F.KicadFootprint("custom:faebryk_logo", pin_names=[]))
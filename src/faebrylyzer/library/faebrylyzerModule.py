@@ -3,12 +3,14 @@
 
 import logging
 
-import faebryk.library._F as F
+# the library has to be loaded before the layouts (circular import)
+import faebryk.library._F  # noqa: F401
 from faebryk.core.module import Module
 from faebryk.exporters.pcb.layout.absolute import LayoutAbsolute
 from faebryk.exporters.pcb.layout.typehierarchy import LayoutTypeHierarchy
 from faebryk.libs.library import L
 
+import faebrylyzer.library._F as F
 from faebrylyzer.library.MountingSlot import MountingSlot
 from faebrylyzer.library.SFPEdgeConnector import SFPEdgeConnector
 
@@ -0,0 +1,108 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+File locks and atomic writes for files shared between concurrent builds.
+
+Builds with their own output root (see `BuildPaths.isolated`) still share the
+parts lock, the lcsc footprint library, the easyeda cache and the JLCPCB part
+database. Writers of those
+hold an exclusive lock on a sibling `.lock` file and replace files atomically,
+so parallel builds never read half written files.
+"""
+
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Iterator
+
+import faebryk.libs.picker.lcsc as lcsc
+from faebryk.libs.picker.jlcpcb.jlcpcb import JLCPCB_DB
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# of atomically written files, mkstemp creates them only readable by the owner
+FILE_MODE = 0o644
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """
+    Exclusive lock for `path`, held on `<path>.lock`, blocks until acquired
+    """
+    lock_path = path.with_name(path.name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as f:
+        if fcntl is None:
+            logger.debug(f"No file locks on this platform, not locking {path}")
+            yield
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def atomic_write_text(path: Path, content: str, encoding: str = "utf-8"):
+    """
+    Write `content` to a temporary file next to `path` and move it in place
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding=encoding) as f:
+            f.write(content)
+        os.chmod(tmp, FILE_MODE)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@contextmanager
+def locked_lcsc(lock_path: Path) -> Iterator[None]:
+    """
+    Serialize the lcsc downloads (easyeda cache, footprints and 3d models)
+    of all builds sharing `lock_path`
+    """
+    download: Callable = lcsc.download_easyeda_info
+
+    @wraps(download)
+    def locked(*args, **kwargs):
+        with file_lock(lock_path):
+            return download(*args, **kwargs)
+
+    lcsc.download_easyeda_info = locked
+    try:
+        yield
+    finally:
+        lcsc.download_easyeda_info = download
+
+
+@contextmanager
+def locked_jlcpcb_db() -> Iterator[None]:
+    """
+    Serialize opening (and downloading) the JLCPCB part database at
+    `JLCPCB_DB.config.db_path` between all builds sharing it
+    """
+    init: Callable = JLCPCB_DB.init
+
+    @wraps(init)
+    def locked(self: JLCPCB_DB):
+        with file_lock(self.config.db_path):
+            return init(self)
+
+    JLCPCB_DB.init = locked
+    try:
+        yield
+    finally:
+        JLCPCB_DB.init = init
@@ -0,0 +1,433 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Loopback test vectors for the factory rig.
+
+The rig drives the pins of the card edge connector and the board captures them.
+`channel_map` follows every connector pin through the graph (input resistor,
+buffer, mcu resistor) to the PB bit it ends up at in the capture. The test
+vectors hold the stimulus as capture words, one bit per probe:
+- walking_ones: all low, then one probe high at a time
+- prbs7: a PRBS7 sequence per probe, shifted between the probes so shorts show
+
+Every word is held for `hold` samples. The verifier reads a raw capture (one
+little-endian word per sample, as fx2lafw streams it) memory mapped and compares
+it chunk by chunk against the expected samples, leaving out `guard` samples
+around every transition. Stimulus and capture clocks are expected to be locked,
+the phase and start of the pattern are found in the capture.
+
+Usage:
+    python -m faebrylyzer.loopback export
+    python -m faebrylyzer.loopback synth build/factory/capture.bin --flips 100
+    python -m faebrylyzer.loopback verify build/factory/capture.bin
+"""
+
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import faebryk.library._F as F
+import numpy as np
+import typer
+from faebryk.libs.logging import setup_basic_logging
+from typing_extensions import Annotated
+
+from faebrylyzer.app import faebrylyzerApp
+from faebrylyzer.library.ResistorArray import ResistorArray
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = Path("build", "factory", "loopback.json")
+CHUNK = 1 << 22
+
+
+@dataclass(frozen=True)
+class Probe:
+    # connector pin name (footprint pad)
+    pin: str
+    net: str
+    # index in faebrylyzerModule.channels
+    channel: int
+    # bit of the capture word (PB pin of the mcu)
+    bit: int
+
+
+# ----------------------------------------
+#               Channel map
+# ----------------------------------------
+def _net_name(net: F.Net | None) -> str | None:
+    if net is None or not net.has_trait(F.has_overriden_name):
+        return None
+    return net.get_trait(F.has_overriden_name).get_name()
+
+
+def channel_map(app: faebrylyzerApp) -> list[Probe]:
+    """
+    Probes of all connector pins that reach the capture, sorted by channel
+    """
+    module = app.faebrylyzer_module
+
+    # nets on both sides of every resistor array element
+    across: dict[F.Net, set[F.Net]] = {}
+    for element in app.get_children(direct_only=False, types=ResistorArray.Element):
+        a, b = (pin.get_net() for pin in element.unnamed)
+        if a is None or b is None:
+            continue
+        across.setdefault(a, set()).add(b)
+        across.setdefault(b, set()).add(a)
+
+    def find(net: F.Net | None, index: dict[F.Net, int]) -> int | None:
+        # directly or through a series resistor
+        if net is None:
+            return None
+        for n in (net, *sorted(across.get(net, ()), key=str)):
+            if n in index:
+                return index[n]
+        return None
+
+    buffer_in = {
+        net: i for i, a in enumerate(app.buffer.A) if (net := a.signal.get_net())
+    }
+    mcu_in = {net: i for i, pb in enumerate(app.mcu.PB) if (net := pb.signal.get_net())}
+    channels = {
+        net: i for i, c in enumerate(module.channels) if (net := c.signal.get_net())
+    }
+
+    probes = []
+    for pin, electrical in module.cardedge_connector.unnamed.pinmap.items():
+        net = electrical.get_net()
+        if net not in channels:
+            continue
+        a = find(net, buffer_in)
+        if a is None:
+            logger.warning(f"Connector pin {pin} does not reach the buffer")
+            continue
+        bit = find(app.buffer.Y[a].signal.get_net(), mcu_in)
+        if bit is None:
+            logger.warning(f"Buffer output {a} does not reach the mcu")
+            continue
+        probes.append(
+            Probe(pin=pin, net=_net_name(net) or "", channel=channels[net], bit=bit)
+        )
+
+    return sorted(probes, key=lambda p: p.channel)
+
+
+# ----------------------------------------
+#               Patterns
+# ----------------------------------------
+def prbs7(length: int = 127, seed: int = 0x7F) -> "NDArray[np.uint8]":
+    """
+    Bits of the PRBS7 (x^7 + x^6 + 1) sequence
+    """
+    state = seed
+    bits = np.empty(length, dtype=np.uint8)
+    for i in range(length):
+        bit = ((state >> 6) ^ (state >> 5)) & 1
+        state = ((state << 1) | bit) & 0x7F
+        bits[i] = bit
+    return bits
+
+
+@dataclass
+class Pattern:
+    # capture word of every step
+    words: "NDArray[np.uint16]"
+    # samples per step
+    hold: int
+
+    @property
+    def period(self) -> int:
+        return len(self.words) * self.hold
+
+    def expected(
+        self, start: int, stop: int, phase: int = 0, step: int = 0, guard: int = 0
+    ) -> tuple["NDArray[np.uint16]", "NDArray[np.bool_]"]:
+        """
+        Expected capture words of samples [start, stop) and whether they are at
+        least `guard` samples away from a transition, for a pattern whose step
+        `step` starts at sample `phase`
+        """
+        i = np.arange(start, stop, dtype=np.int64) - phase
+        steps = (i // self.hold + step) % len(self.words)
+        words = self.words[steps]
+        if not guard:
+            return words, np.ones(len(words), dtype=bool)
+
+        # transition into every step
+        changes = self.words != np.roll(self.words, 1)
+        at = i % self.hold
+        near = (at < guard) & changes[steps]
+        near |= (at >= self.hold - guard) & changes[(steps + 1) % len(self.words)]
+        return words, ~near
+
+
+def walking_ones(probes: list[Probe]) -> "NDArray[np.uint16]":
+    return np.array([0, *(1 << p.bit for p in probes)], dtype=np.uint16)
+
+
+def prbs_words(probes: list[Probe]) -> "NDArray[np.uint16]":
+    bits = prbs7()
+    shift = len(bits) // max(len(probes), 1)
+    words = np.zeros(len(bits), dtype=np.uint16)
+    for i, p in enumerate(probes):
+        words |= np.roll(bits, -i * shift).astype(np.uint16) << p.bit
+    return words
+
+
+@dataclass
+class TestVectors:
+    probes: list[Probe]
+    patterns: dict[str, Pattern]
+
+    @classmethod
+    def from_app(cls, app: faebrylyzerApp, hold: int = 4) -> "TestVectors":
+        probes = channel_map(app)
+        return cls(
+            probes=probes,
+            patterns={
+                "walking_ones": Pattern(walking_ones(probes), hold),
+                "prbs7": Pattern(prbs_words(probes), hold),
+            },
+        )
+
+    @property
+    def dtype(self) -> np.dtype:
+        # fx2lafw streams 8 channels as bytes, 16 as little-endian words
+        return np.dtype(np.uint8 if max(p.bit for p in self.probes) < 8 else "<u2")
+
+    @property
+    def mask(self) -> int:
+        return sum(1 << p.bit for p in self.probes)
+
+    def dump(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "probes": [asdict(p) for p in self.probes],
+            "patterns": {
+                name: {"hold": p.hold, "words": p.words.tolist()}
+                for name, p in self.patterns.items()
+            },
+        }
+        path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        logger.info(f"Wrote loopback test vectors to {path}")
+
+    @classmethod
+    def load(cls, path: Path) -> "TestVectors":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return cls(
+            probes=[Probe(**p) for p in data["probes"]],
+            patterns={
+                name: Pattern(np.array(p["words"], dtype=np.uint16), p["hold"])
+                for name, p in data["patterns"].items()
+            },
+        )
+
+
+# ----------------------------------------
+#               Captures
+# ----------------------------------------
+def synthesize(
+    path: Path,
+    vectors: TestVectors,
+    pattern: str,
+    samples: int,
+    phase: int = 0,
+    step: int = 0,
+    stuck: dict[int, int] | None = None,
+    flips: int = 0,
+    seed: int = 0,
+):
+    """
+    Write a capture of `pattern` starting at `step`, `phase` samples in, with
+    bits stuck at a level and `flips` random bit errors
+    """
+    p = vectors.patterns[pattern]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    out = np.memmap(path, dtype=vectors.dtype, mode="w+", shape=(samples,))
+    for start in range(0, samples, CHUNK):
+        stop = min(start + CHUNK, samples)
+        words, _ = p.expected(start, stop, phase=phase, step=step)
+        for bit, level in (stuck or {}).items():
+            words = words | (1 << bit) if level else words & (0xFFFF ^ (1 << bit))
+        out[start:stop] = words
+
+    rng = np.random.default_rng(seed)
+    bits = [probe.bit for probe in vectors.probes]
+    at = rng.integers(0, samples, flips)
+    out[at] ^= (1 << rng.choice(bits, flips)).astype(vectors.dtype)
+    out.flush()
+
+
+def align(capture: "NDArray", pattern: Pattern, mask: int) -> tuple[int, int]:
+    """
+    Phase (first sample of a step) and step of the pattern at that sample, from
+    the start of the capture
+    """
+    hold, words = pattern.hold, pattern.words
+    head = np.asarray(capture[: 2 * pattern.period + hold]).astype(np.uint16) & mask
+
+    # transitions of the working channels are all at the same phase
+    edges = np.flatnonzero(head[1:] != head[:-1]) + 1
+    phase = int(np.bincount(edges % hold).argmax()) if len(edges) else 0
+
+    # the step the words in the middle of the steps fit best
+    seen = head[phase + hold // 2 :: hold][: len(words)]
+    steps = (np.arange(len(words))[:, None] + np.arange(len(seen))) % len(words)
+    step = int((words[steps] == seen).sum(axis=1).argmax())
+    return phase, step
+
+
+@dataclass
+class Verification:
+    pattern: str
+    probes: list[Probe]
+    samples: int
+    checked: int
+    # per probe
+    errors: list[int]
+    first_error: int | None
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return self.checked > 0 and not any(self.errors)
+
+    def report(self) -> str:
+        lines = [
+            f"{self.pattern}: {self.checked}/{self.samples} samples checked"
+            f" in {self.seconds:.2f}s"
+            f" ({self.samples / max(self.seconds, 1e-9) / 1e6:.0f} MS/s)",
+            f"{'pin':>4s} {'net':12s} {'ch':>3s} {'bit':>3s} {'errors':>9s}",
+        ]
+        for probe, errors in zip(self.probes, self.errors):
+            lines.append(
+                f"{probe.pin:>4s} {probe.net:12s} {probe.channel:3d} {probe.bit:3d}"
+                f" {errors:9d}"
+            )
+        if self.first_error is not None:
+            lines.append(f"first error at sample {self.first_error}")
+        lines.append("PASS" if self.ok else "FAIL")
+        return "\n".join(lines)
+
+
+def verify(
+    path: Path, vectors: TestVectors, pattern: str, guard: int = 1
+) -> Verification:
+    """
+    Compare the capture at `path` with `pattern`, chunk by chunk
+    """
+    start_time = time.perf_counter()
+    p = vectors.patterns[pattern]
+    capture = np.memmap(path, dtype=vectors.dtype, mode="r")
+    phase, step = align(capture, p, vectors.mask)
+
+    # the expected samples repeat every period, chunks of whole periods all
+    # expect the same words
+    size = max(CHUNK // p.period, 1) * p.period
+    expected, valid = p.expected(0, size, phase, step, guard)
+    expected = expected.astype(capture.dtype)
+    check = np.where(valid, vectors.mask, 0).astype(capture.dtype)
+
+    bits = [probe.bit for probe in vectors.probes]
+    bit_errors = np.zeros(16, dtype=np.int64)
+    checked = 0
+    first_error = None
+    for start in range(0, len(capture), size):
+        chunk = capture[start : start + size]
+        n = len(chunk)
+        diff = (chunk ^ expected[:n]) & check[:n]
+        checked += int(np.count_nonzero(valid[:n]))
+        if not diff.any():
+            continue
+        if first_error is None:
+            first_error = start + int(np.flatnonzero(diff)[0])
+        for bit in bits:
+            bit_errors[bit] += np.count_nonzero(diff & (1 << bit))
+
+    return Verification(
+        pattern=pattern,
+        probes=vectors.probes,
+        samples=len(capture),
+        checked=checked,
+        errors=[int(bit_errors[probe.bit]) for probe in vectors.probes],
+        first_error=first_error,
+        seconds=time.perf_counter() - start_time,
+    )
+
+
+# ----------------------------------------
+#               CLI
+# ----------------------------------------
+cli = typer.Typer()
+
+VectorsOption = Annotated[Path, typer.Option(help="Test vectors json")]
+PatternOption = Annotated[str, typer.Option(help="Pattern name")]
+
+
+@cli.command()
+def export(
+    path: VectorsOption = DEFAULT_PATH,
+    hold: Annotated[int, typer.Option(help="Samples per pattern step")] = 4,
+):
+    from faebrylyzer.main import make_app
+
+    app = make_app()
+    assert isinstance(app, faebrylyzerApp)
+    vectors = TestVectors.from_app(app, hold)
+    for probe in vectors.probes:
+        print(probe)
+    vectors.dump(path)
+
+
+@cli.command()
+def synth(
+    capture: Annotated[Path, typer.Argument(help="Capture file to write")],
+    vectors: VectorsOption = DEFAULT_PATH,
+    pattern: PatternOption = "prbs7",
+    samples: Annotated[int, typer.Option()] = 100_000_000,
+    phase: Annotated[int, typer.Option(help="Sample the first step starts")] = 0,
+    step: Annotated[int, typer.Option(help="Step the capture starts with")] = 0,
+    stuck_low: Annotated[list[int], typer.Option(help="Bits stuck low")] = [],
+    stuck_high: Annotated[list[int], typer.Option(help="Bits stuck high")] = [],
+    flips: Annotated[int, typer.Option(help="Random bit errors")] = 0,
+    seed: Annotated[int, typer.Option()] = 0,
+):
+    synthesize(
+        capture,
+        TestVectors.load(vectors),
+        pattern,
+        samples,
+        phase=phase,
+        step=step,
+        stuck={**{b: 0 for b in stuck_low}, **{b: 1 for b in stuck_high}},
+        flips=flips,
+        seed=seed,
+    )
+
+
+@cli.command("verify")
+def verify_capture(
+    capture: Annotated[Path, typer.Argument(help="Raw capture file")],
+    vectors: VectorsOption = DEFAULT_PATH,
+    pattern: PatternOption = "prbs7",
+    guard: Annotated[
+        int, typer.Option(help="Samples around transitions not checked")
+    ] = 1,
+):
+    result = verify(capture, TestVectors.load(vectors), pattern, guard)
+    print(result.report())
+    if not result.ok:
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    setup_basic_logging()
+    cli()
@@ -1,128 +1,651 @@
 import logging
+import shutil
 import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Callable
 
 import faebryk.libs.picker.lcsc as lcsc
 import typer
+from faebryk.core.graphinterface import Graph
 from faebryk.core.module import Module
 from faebryk.exporters.esphome.esphome import dump_esphome_config, make_esphome_config
+from faebryk.exporters.netlist.graph import attach_nets_and_kicad_info
 from faebryk.exporters.parameters.parameters_to_file import export_parameters_to_file
 from faebryk.exporters.pcb.kicad.artifacts import export_svg
+from faebryk.exporters.pcb.kicad.transformer import PCB_Transformer
+from faebryk.importers.netlist.kicad.netlist_kicad import to_faebryk_t2_netlist
 from faebryk.libs.app.checks import run_checks
+from faebryk.libs.app.designators import (
+    attach_random_designators,
+    load_designators_from_netlist,
+    override_names_with_designators,
+)
 from faebryk.libs.app.manufacturing import export_pcba_artifacts
 from faebryk.libs.app.parameters import replace_tbd_with_any
 from faebryk.libs.app.pcb import apply_design
+from faebryk.libs.kicad.fileformats import C_kicad_pcb_file
 from faebryk.libs.logging import setup_basic_logging
-from faebryk.libs.picker.jlcpcb.pickers import add_jlcpcb_pickers
-from faebryk.libs.picker.picker import pick_part_recursively
+from faebryk.libs.picker.jlcpcb.jlcpcb import JLCPCB_DB
+from faebryk.libs.picker.picker import PickError, pick_part_recursively
 from rich.traceback import install
 from typing_extensions import Annotated
 
 from faebrylyzer.app import faebrylyzerApp
-from faebrylyzer.pcb import transform_pcb
-from faebrylyzer.pickers import add_app_pickers
+from faebrylyzer.artifact_cache import ArtifactCache, Fingerprint, code_fingerprint
+from faebrylyzer.drc import check_placement, log_violations
+from faebrylyzer.locking import locked_jlcpcb_db, locked_lcsc
+from faebrylyzer.loopback import TestVectors
+from faebrylyzer.parts_lock import PartsLock, get_constraints
+from faebrylyzer.parts_shard import has_shard, use_full_database, use_shard
+from faebrylyzer.pcb import (
+    BOARD_SIZE,
+    DRC_ALLOWLIST,
+    get_outline_coordinates,
+    transform_pcb,
+)
+from faebrylyzer.pick_search import BoundedPartPicker, PickBudget
+from faebrylyzer.picker_trace import PickTrace
+from faebrylyzer.pickers import attach_pickers
+from faebrylyzer.placement import PlacementProblem
+from faebrylyzer.signal_integrity import channel_resistances, sweep
+from faebrylyzer.throughput import ThroughputBudget
+from faebrylyzer.wirelength import Ratsnest
 
 # logging settings
 logger = logging.getLogger(__name__)
 
 
-def main(
-    export_manufacturing_artifacts: Annotated[
-        bool, typer.Option(help="Export manufacturing artifacts (gerbers, BOM, etc.)")
-    ] = False,
-    export_esphome_config: Annotated[
-        bool, typer.Option(help="Export ESPHome config yaml")
-    ] = False,
-    export_visuals: Annotated[
-        bool, typer.Option(help="Export project visuals (e.g. SVG)")
-    ] = False,
-    export_parameters: Annotated[
-        bool, typer.Option(help="Export project parameters to a file")
-    ] = False,
-):
-    # rich traceback settings --------------------------------
-    install(
-        width=550,
-        show_locals=True,
+@dataclass
+class BuildPaths:
+    root: Path
+    build_dir: Path
+    # paths of the parts lock, libs and caches, if shared with other builds
+    shared: "BuildPaths | None" = None
+    # parts lock below `root` even if shared
+    own_parts_lock: bool = False
+
+    @classmethod
+    def default(cls) -> "BuildPaths":
+        return cls(root=Path(__file__).parent.parent.parent, build_dir=Path("./build"))
+
+    @classmethod
+    def isolated(
+        cls,
+        output_root: Path,
+        shared: "BuildPaths | None" = None,
+        own_parts_lock: bool = False,
+    ) -> "BuildPaths":
+        """
+        Paths of a build writing only below `output_root`, so that builds can run
+        concurrently (in separate processes, see `build`)
+
+        The kicad project is copied to `output_root/source` (the pcb is updated
+        in place), the parts lock, libs and caches of `shared` (the default
+        paths) are shared with the other builds. With `own_parts_lock` the build
+        starts from a copy of the shared parts lock instead, for builds that
+        pick other parts than the others.
+        """
+        shared = shared or cls.default()
+        paths = cls(
+            root=output_root,
+            build_dir=output_root.joinpath("build"),
+            shared=shared,
+            own_parts_lock=own_parts_lock,
+        )
+        shutil.copytree(shared.kicad_prj_path, paths.kicad_prj_path, dirs_exist_ok=True)
+        if own_parts_lock and shared.parts_lock.exists():
+            output_root.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(shared.parts_lock, paths.parts_lock)
+        # the project refers to its libs as ${KIPRJMOD}/../libs
+        libs = output_root.joinpath("libs")
+        if not libs.exists():
+            libs.symlink_to(shared.lib_dir.resolve(), target_is_directory=True)
+        return paths
+
+    @property
+    def _shared(self) -> "BuildPaths":
+        return self.shared or self
+
+    @property
+    def kicad_prj_path(self) -> Path:
+        return self.root.joinpath("source")
+
+    @property
+    def pcbfile(self) -> Path:
+        return self.kicad_prj_path.joinpath("main.kicad_pcb")
+
+    @property
+    def parts_lock(self) -> Path:
+        root = self.root if self.own_parts_lock else self._shared.root
+        return root.joinpath("parts.lock")
+
+    @property
+    def lib_dir(self) -> Path:
+        return self._shared.root.joinpath("libs")
+
+    @property
+    def cache_dir(self) -> Path:
+        return self._shared.build_dir.joinpath("cache")
+
+    @property
+    def lcsc_lock(self) -> Path:
+        return self.cache_dir.joinpath("lcsc")
+
+    @property
+    def faebryk_build_dir(self) -> Path:
+        return self.build_dir.joinpath("faebryk")
+
+    @property
+    def parts_shard_dir(self) -> Path:
+        return self.cache_dir.joinpath("jlcpcb_shard")
+
+    @property
+    def jlcpcb_db_dir(self) -> Path:
+        return self.cache_dir.joinpath("jlcpcb_part_database")
+
+    @property
+    def netlist_path(self) -> Path:
+        return self.faebryk_build_dir.joinpath("faebryk.net")
+
+    @property
+    def pick_trace_json(self) -> Path:
+        return self.faebryk_build_dir.joinpath("pick_trace.json")
+
+    @property
+    def pick_trace_csv(self) -> Path:
+        return self.faebryk_build_dir.joinpath("pick_trace.csv")
+
+    @property
+    def esphome_config_path(self) -> Path:
+        return self.build_dir.joinpath("esphome", "esphome.yaml")
+
+    @property
+    def manufacturing_artifacts_path(self) -> Path:
+        return self.build_dir.joinpath("manufacturing")
+
+    @property
+    def parameters_path(self) -> Path:
+        # .txt is also possible
+        return self.build_dir.joinpath("parameters", "parameters.md")
+
+    @property
+    def throughput_path(self) -> Path:
+        return self.build_dir.joinpath("parameters", "throughput.md")
+
+    @property
+    def visuals_dir(self) -> Path:
+        return self.build_dir.joinpath("visuals")
+
+    @property
+    def test_vectors_path(self) -> Path:
+        return self.build_dir.joinpath("factory", "loopback.json")
+
+    @property
+    def layout_table_path(self) -> Path:
+        return self.build_dir.joinpath("layout", "layout_table.md")
+
+    def artifacts(self) -> list[Path]:
+        """
+        Existing output files of a build
+        """
+        outputs = [
+            self.netlist_path,
+            self.pcbfile,
+            self.pick_trace_json,
+            self.pick_trace_csv,
+            self.parameters_path,
+            self.throughput_path,
+            self.test_vectors_path,
+            self.layout_table_path,
+            self.esphome_config_path,
+        ]
+        for directory in (self.manufacturing_artifacts_path, self.visuals_dir):
+            if directory.is_dir():
+                outputs.extend(sorted(p for p in directory.rglob("*") if p.is_file()))
+        return [p for p in outputs if p.is_file()]
+
+
+class StageTimer:
+    """
+    Records the wall time of each named build stage
+    """
+
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+
+    @contextmanager
+    def __call__(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            logger.debug(f"Stage {name} took {self.timings[name]:.3f}s")
+
+
+# ----------------------------------------
+#               Stages
+# ----------------------------------------
+def make_app(app_factory: Callable[[], Module] = faebrylyzerApp) -> Module:
+    sys.setrecursionlimit(20000)  # TODO needs optimization
+    return app_factory()
+
+
+def fill_unspecified_parameters(app: Module):
+    # no loglvl, emitting a record per replaced parameter took longer than replacing
+    replace_tbd_with_any(app, recursive=True)
+
+
+def add_pickers(
+    app: Module, jlcpcb: bool = True, jlcpcb_fallback: bool = False
+) -> list[Module]:
+    """
+    Add the app pickers and, for modules not covered by them (or all modules with
+    `jlcpcb_fallback`), the JLCPCB pickers
+
+    Returns the modules sorted by name, so that picking, the parts lock and the
+    pick trace don't depend on set iteration order.
+    """
+    children = sorted(
+        app.get_children(direct_only=False, types=Module),
+        key=lambda n: n.get_full_name(),
     )
+    modules = list(dict.fromkeys(n.get_most_special() for n in children))
 
-    # paths --------------------------------------------------
-    root = Path(__file__).parent.parent.parent
-    kicad_prj_path = root.joinpath("source")
-    pcbfile = kicad_prj_path.joinpath("main.kicad_pcb")
-    build_dir = Path("./build")
-    faebryk_build_dir = build_dir.joinpath("faebryk")
-    faebryk_build_dir.mkdir(parents=True, exist_ok=True)
-    netlist_path = faebryk_build_dir.joinpath("faebryk.net")
-    esphome_path = build_dir.joinpath("esphome")
-    esphome_config_path = esphome_path.joinpath("esphome.yaml")
-    manufacturing_artifacts_path = build_dir.joinpath("manufacturing")
-    parameter_dir = build_dir.joinpath("parameters")
-    parameters_path = parameter_dir.joinpath("parameters.md")  # .txt is also possible
-    visuals_dir = build_dir.joinpath("visuals")
-
-    lcsc.BUILD_FOLDER = build_dir
-    lcsc.LIB_FOLDER = root.joinpath("libs")
+    # from faebryk.libs.picker.picker import logger as picker_logger
+    # picker_logger.setLevel(logging.DEBUG)
+
+    covered = attach_pickers(modules, jlcpcb=jlcpcb, jlcpcb_fallback=jlcpcb_fallback)
+    logger.info(
+        f"Added pickers for {len(modules)} modules,"
+        f" {len(covered)} covered by the app pickers"
+    )
+
+    return modules
+
+
+def pick_parts(
+    app: Module, pick_budget: PickBudget | None = None, full_db: Path | None = None
+):
+    """
+    Pick the parts of all modules of `app`, with the bounded search if a
+    `pick_budget` is given
+
+    With `full_db` the JLCPCB pickers run against the parts shard, parts that
+    can't be picked from it are picked again from the full database at `full_db`.
+    """
+
+    def pick():
+        if pick_budget is None:
+            pick_part_recursively(app)
+        else:
+            BoundedPartPicker(pick_budget).pick(app)
 
-    # App ----------------------------------------------------
-    logger.info("Make app")
     try:
-        sys.setrecursionlimit(20000)  # TODO needs optimization
-        app = faebrylyzerApp()
-    except RecursionError:
-        logger.error("RECURSION ERROR ABORTING")
+        pick()
+    except PickError as e:
+        if full_db is None:
+            raise
+        logger.warning(
+            f"Could not pick all parts from the parts shard"
+            f" ({str(e).splitlines()[0]}), picking the remaining parts from"
+            f" the full JLCPCB database {full_db}"
+        )
+        use_full_database(full_db)
+        pick()
+
+
+def _cached(
+    cache: ArtifactCache | None,
+    inputs: Fingerprint,
+    outputs: dict[str, Path],
+    fn: Callable[[], Any],
+):
+    if cache is None:
+        fn()
         return
+    cache.run(inputs.hexdigest(), outputs, fn)
+
+
+def relink_design(G: Graph, netlist_path: Path):
+    """
+    Graph side effects of `apply_design` for a netlist restored from the cache:
+    the kicad designators and names, and the nets
+    """
+    comps = to_faebryk_t2_netlist(netlist_path).comps
+    load_designators_from_netlist(G, {c.name: c for c in comps})
+    attach_random_designators(G)
+    override_names_with_designators(G)
+    attach_nets_and_kicad_info(G)
+
+
+def build(
+    paths: BuildPaths,
+    export_manufacturing_artifacts: bool = False,
+    export_esphome_config: bool = False,
+    export_visuals: bool = False,
+    export_parameters: bool = False,
+    optimize_placement: bool = False,
+    export_test_vectors: bool = False,
+    app_factory: Callable[[], Module] = faebrylyzerApp,
+    transform: Callable[[PCB_Transformer], Any] | None = transform_pcb,
+    jlcpcb_pickers: bool = True,
+    jlcpcb_fallback: bool = False,
+    parts_shard: bool = True,
+    update_parts: bool = False,
+    pick_budget: PickBudget | None = None,
+    stage: StageTimer | None = None,
+    cache: ArtifactCache | None = None,
+) -> Module:
+    """
+    Run the full build pipeline, timing every stage with `stage` if given
+
+    Parts locked in `paths.parts_lock` are reused unless `update_parts` is set.
+    With a `pick_budget` parts are picked by the bounded search of `pick_search`.
+    With `optimize_placement` a layout table is suggested by `placement`.
+    With `export_test_vectors` the factory loopback vectors of `loopback` are
+    written.
+    Outputs are written below `paths.build_dir`, for concurrent builds use
+    `BuildPaths.isolated`. The lcsc folders (`lcsc.BUILD_FOLDER`,
+    `lcsc.LIB_FOLDER`) and the JLCPCB database config are process-wide, and the
+    database stays open for the process, so the isolation only holds between
+    processes: run concurrent builds in separate processes, builds with other
+    shared paths in a new one.
+    With a `cache` the netlist, pcb, manufacturing artifacts and visuals are
+    restored from it if the inputs of their stage didn't change.
+    """
+    stage = stage or StageTimer()
+
+    paths.faebryk_build_dir.mkdir(parents=True, exist_ok=True)
+    # cache/easyeda below the shared build dir
+    lcsc.BUILD_FOLDER = paths.cache_dir.parent
+    lcsc.LIB_FOLDER = paths.lib_dir
+
+    shard = jlcpcb_pickers and parts_shard and has_shard(paths.parts_shard_dir)
+    if shard:
+        logger.info(f"Picking from parts shard {paths.parts_shard_dir}")
+        use_shard(paths.parts_shard_dir)
+    else:
+        JLCPCB_DB.config.db_path = paths.jlcpcb_db_dir
+
+    # App ----------------------------------------------------
+    logger.info("Make app")
+    with stage("app"):
+        app = make_app(app_factory)
 
     # fill unspecified parameters ----------------------------
     logger.info("Filling unspecified parameters")
-    replace_tbd_with_any(app, recursive=True, loglvl=logging.DEBUG)
+    with stage("fill_tbd"):
+        fill_unspecified_parameters(app)
 
     # pick parts ---------------------------------------------
     logger.info("Picking parts")
-    modules = {
-        n.get_most_special() for n in app.get_children(direct_only=False, types=Module)
-    }
+    pick_trace = PickTrace()
+    with stage("pickers"):
+        modules = add_pickers(
+            app, jlcpcb=jlcpcb_pickers, jlcpcb_fallback=jlcpcb_fallback
+        )
+        pick_trace.instrument(modules)
+    # the parts lock is shared, builds reuse the picks of the builds before them
+    # and merge their own picks into it (see `PartsLock.dump`)
+    with stage("parts_lock"):
+        lock = PartsLock.load(paths.parts_lock)
+        if update_parts:
+            # all parts are picked again and replace their entries in `dump`
+            lock.parts = {}
+        constraints = get_constraints(modules)
+        lock.apply(modules, constraints)
+    # picked parts are downloaded into the shared lcsc cache and libs, the JLCPCB
+    # database is downloaded on first use
+    with locked_lcsc(paths.lcsc_lock), locked_jlcpcb_db():
+        with stage("pick"):
+            try:
+                pick_parts(app, pick_budget, paths.jlcpcb_db_dir if shard else None)
+            except PickError:
+                pick_trace.log_summary()
+                raise
+            finally:
+                pick_trace.to_json(paths.pick_trace_json)
+                pick_trace.to_csv(paths.pick_trace_csv)
+    lock.update(modules, constraints)
+    lock.dump(paths.parts_lock)
+    if JLCPCB_DB._instance is None:
+        logger.info("Picked all parts without opening the JLCPCB database")
 
-    # from faebryk.libs.picker.picker import logger as picker_logger
-    # picker_logger.setLevel(logging.DEBUG)
+    # signal integrity ---------------------------------------
+    if isinstance(app, faebrylyzerApp):
+        with stage("signal_integrity"):
+            logger.info(
+                "Channel signal integrity:\n" + sweep(channel_resistances(app)).report()
+            )
 
-    for n in modules:
-        logger.info(f"Adding pickers for {n}")
-        add_jlcpcb_pickers(n, base_prio=10)
-        add_app_pickers(n)
-    pick_part_recursively(app)
+    # capture throughput -------------------------------------
+    if isinstance(app, faebrylyzerApp):
+        with stage("throughput"):
+            budget = ThroughputBudget.from_app(app)
+            budget.check()
+            budget.write(paths.throughput_path)
 
     # graph --------------------------------------------------
     logger.info("Make graph")
-    G = app.get_graph()
+    with stage("graph"):
+        G = app.get_graph()
 
     # checks -------------------------------------------------
     logger.info("Running checks")
-    run_checks(app, G)
+    with stage("checks"):
+        run_checks(app, G)
 
     # pcb ----------------------------------------------------
     logger.info("Make netlist & pcb")
-    apply_design(pcbfile, netlist_path, G, app, transform_pcb)
+    # placement needs the footprints linked and the layouts applied by the stage
+    if cache is None or optimize_placement:
+        with stage("apply_design"):
+            apply_design(paths.pcbfile, paths.netlist_path, G, app, transform)
+    else:
+        key = (
+            Fingerprint(code_fingerprint())
+            .add("stage", "apply_design")
+            .add("app", app_factory)
+            .add("transform", transform)
+            .add("parts_lock", paths.parts_lock)
+            .add("libs", paths.lib_dir)
+            # designators are carried over from the previous netlist
+            .add("netlist", paths.netlist_path)
+            .add("pcb", paths.pcbfile)
+            .hexdigest()
+        )
+        with stage("apply_design"):
+            hit = cache.run(
+                key,
+                {"netlist": paths.netlist_path, "pcb": paths.pcbfile},
+                lambda: apply_design(
+                    paths.pcbfile, paths.netlist_path, G, app, transform
+                ),
+            )
+            if hit:
+                relink_design(G, paths.netlist_path)
+
+    # placement check ----------------------------------------
+    logger.info("Checking placement")
+    pcb = C_kicad_pcb_file.loads(paths.pcbfile).kicad_pcb
+    with stage("drc"):
+        log_violations(
+            check_placement(
+                pcb, get_outline_coordinates(BOARD_SIZE), allow=DRC_ALLOWLIST
+            )
+        )
+
+    with stage("wirelength"):
+        # a single estimate, the approximation only pays off in loops
+        ratsnest = Ratsnest.from_pcb(pcb, max_exact_pads=None)
+        logger.info(
+            f"Ratsnest wirelength [mm]:\n{ratsnest.report(ratsnest.estimate())}"
+        )
+
+    if optimize_placement:
+        logger.info("Optimizing placement")
+        with stage("optimize_placement"):
+            PlacementProblem.from_app(
+                app, pcb, outline=get_outline_coordinates(BOARD_SIZE)
+            ).optimize().write(paths.layout_table_path)
 
     # generate pcba manufacturing and other artifacts ---------
     if export_manufacturing_artifacts:
-        export_pcba_artifacts(manufacturing_artifacts_path, pcbfile, app)
+        with stage("export_manufacturing"):
+            _cached(
+                cache,
+                Fingerprint(code_fingerprint())
+                .add("stage", "export_manufacturing")
+                .add("parts_lock", paths.parts_lock)
+                .add("libs", paths.lib_dir)
+                .add("pcb", paths.pcbfile),
+                {"manufacturing": paths.manufacturing_artifacts_path},
+                lambda: export_pcba_artifacts(
+                    paths.manufacturing_artifacts_path, paths.pcbfile, app
+                ),
+            )
 
     # generate visuals ---------------------------------------
     if export_visuals:
-        export_svg(pcbfile, visuals_dir.joinpath("pcba.svg"))
+        svg_path = paths.visuals_dir.joinpath("pcba.svg")
+        with stage("export_visuals"):
+            _cached(
+                cache,
+                Fingerprint(code_fingerprint())
+                .add("stage", "export_visuals")
+                .add("pcb", paths.pcbfile),
+                {"svg": svg_path},
+                lambda: export_svg(paths.pcbfile, svg_path),
+            )
 
     # export parameter report --------------------------------
     if export_parameters:
-        export_parameters_to_file(app, parameters_path)
+        with stage("export_parameters"):
+            export_parameters_to_file(app, paths.parameters_path)
+
+    # factory test vectors -----------------------------------
+    if export_test_vectors and isinstance(app, faebrylyzerApp):
+        with stage("export_test_vectors"):
+            TestVectors.from_app(app).dump(paths.test_vectors_path)
 
     # esphome config -----------------------------------------
     if export_esphome_config:
         logger.info("Generating esphome config")
-        esphome_config = make_esphome_config(G)
-        esphome_config_path.write_text(
-            dump_esphome_config(esphome_config), encoding="utf-8"
+        with stage("export_esphome"):
+            esphome_config = make_esphome_config(G)
+            paths.esphome_config_path.parent.mkdir(parents=True, exist_ok=True)
+            paths.esphome_config_path.write_text(
+                dump_esphome_config(esphome_config), encoding="utf-8"
+            )
+
+    # summary ------------------------------------------------
+    pick_trace.log_summary()
+    if cache is not None:
+        logger.info(f"Artifact cache: {cache.hits} hits, {cache.misses} misses")
+
+    return app
+
+
+def main(
+    export_manufacturing_artifacts: Annotated[
+        bool, typer.Option(help="Export manufacturing artifacts (gerbers, BOM, etc.)")
+    ] = False,
+    export_esphome_config: Annotated[
+        bool, typer.Option(help="Export ESPHome config yaml")
+    ] = False,
+    export_visuals: Annotated[
+        bool, typer.Option(help="Export project visuals (e.g. SVG)")
+    ] = False,
+    export_parameters: Annotated[
+        bool, typer.Option(help="Export project parameters to a file")
+    ] = False,
+    optimize_placement: Annotated[
+        bool,
+        typer.Option(help="Suggest a layout table with shorter wires (build/layout)"),
+    ] = False,
+    export_test_vectors: Annotated[
+        bool,
+        typer.Option(help="Export loopback test vectors for the factory rig"),
+    ] = False,
+    parts_shard: Annotated[
+        bool,
+        typer.Option(help="Pick from the local parts shard if it has been built"),
+    ] = True,
+    update_parts: Annotated[
+        bool, typer.Option(help="Ignore parts.lock and pick all parts again")
+    ] = False,
+    jlcpcb_fallback: Annotated[
+        bool,
+        typer.Option(
+            help="Also try JLCPCB for modules covered by the app pickers,"
+            " if none of their parts fit"
+        ),
+    ] = False,
+    bounded_pick: Annotated[
+        bool,
+        typer.Option(
+            help="Pick parts with the dependency-ordered search of pick_search"
+            " (experimental), within the budget below"
+        ),
+    ] = False,
+    pick_timeout: Annotated[
+        float,
+        typer.Option(help="Bounded pick: give up after this many seconds"),
+    ] = 300,
+    pick_max_evaluations: Annotated[
+        int,
+        typer.Option(help="Bounded pick: give up after this many picker runs"),
+    ] = 20000,
+    cache_dir: Annotated[
+        Path | None,
+        typer.Option(
+            help="Restore and store stage outputs in this artifact cache"
+            " (may be shared between machines)",
+            envvar="FAEBRYLYZER_CACHE_DIR",
+        ),
+    ] = None,
+    output_root: Annotated[
+        Path | None,
+        typer.Option(
+            help="Build into this directory, with its own copy of the pcb,"
+            " so that builds can run concurrently"
+        ),
+    ] = None,
+):
+    # rich traceback settings --------------------------------
+    install(
+        width=550,
+        show_locals=True,
+    )
+
+    try:
+        build(
+            BuildPaths.isolated(output_root) if output_root else BuildPaths.default(),
+            export_manufacturing_artifacts=export_manufacturing_artifacts,
+            export_esphome_config=export_esphome_config,
+            export_visuals=export_visuals,
+            export_parameters=export_parameters,
+            optimize_placement=optimize_placement,
+            export_test_vectors=export_test_vectors,
+            parts_shard=parts_shard,
+            update_parts=update_parts,
+            jlcpcb_fallback=jlcpcb_fallback,
+            pick_budget=(
+                PickBudget(
+                    max_evaluations=pick_max_evaluations, max_seconds=pick_timeout
+                )
+                if bounded_pick
+                else None
+            ),
+            cache=ArtifactCache(cache_dir) if cache_dir else None,
         )
+    except RecursionError:
+        logger.error("RECURSION ERROR ABORTING")
+        return
 
 
 if __name__ == "__main__":
@@ -0,0 +1,372 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Lockfile for picked parts.
+
+After a successful pick, `parts.lock` records for every picked module (by its path
+in the app) the LCSC part, footprint, pinmap and picked parameter values, together
+with a fingerprint of the parameter constraints the module had before picking.
+
+On the next build locked parts are attached directly, as long as the constraints
+of the module did not change and the locked part still satisfies them. All other
+modules are picked as usual.
+
+Concurrent builds share the lockfile, but only hold its lock to load it and to
+merge their changes into it (see `PartsLock.dump`), not while picking.
+"""
+
+import hashlib
+import importlib
+import json
+import logging
+from dataclasses import asdict, dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Any, Iterable
+
+import faebryk.library._F as F
+from faebryk.core.module import Module
+from faebryk.core.node import Node
+from faebryk.core.parameter import Parameter
+from faebryk.libs.picker.lcsc import LCSC_Part
+from faebryk.libs.picker.picker import (
+    PickerOption,
+    PickError,
+    has_part_picked,
+    has_part_picked_remove,
+    pick_module_by_params,
+)
+from faebryk.libs.units import P, Quantity
+from faebryk.libs.util import NotNone
+
+from faebrylyzer.locking import atomic_write_text, file_lock
+
+logger = logging.getLogger(__name__)
+
+LOCK_VERSION = 1
+REMOVE = "REMOVE"
+
+
+# ----------------------------------------
+#         Parameter serialization
+# ----------------------------------------
+def _serialize_value(value: Any) -> Any:
+    if isinstance(value, Parameter):
+        return serialize_param(value)
+    if isinstance(value, Quantity):
+        return {"magnitude": value.magnitude, "units": f"{value.units:D}"}
+    if isinstance(value, Enum):
+        cls = type(value)
+        return {"enum": f"{cls.__module__}:{cls.__qualname__}", "name": value.name}
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    raise ValueError(f"Can't serialize {value!r}")
+
+
+def _deserialize_value(value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+    if "type" in value:
+        return deserialize_param(value)
+    if "units" in value:
+        return P.Quantity(value["magnitude"], value["units"])
+    if "enum" in value:
+        module, qualname = value["enum"].split(":")
+        cls: Any = importlib.import_module(module)
+        for name in qualname.split("."):
+            cls = getattr(cls, name)
+        return cls[value["name"]]
+    raise ValueError(f"Can't deserialize {value!r}")
+
+
+def serialize_param(param: Parameter) -> dict[str, Any]:
+    """
+    JSON representation of the most narrow value of `param`
+    """
+    param = param.get_most_narrow()
+    if isinstance(param, F.ANY):
+        return {"type": "ANY"}
+    if isinstance(param, F.TBD):
+        return {"type": "TBD"}
+    if isinstance(param, F.Constant):
+        return {"type": "Constant", "value": _serialize_value(param.value)}
+    if isinstance(param, F.Range):
+        return {"type": "Range", "bounds": [serialize_param(b) for b in param.bounds]}
+    if isinstance(param, F.Set):
+        return {"type": "Set", "params": [serialize_param(p) for p in param.params]}
+    raise ValueError(f"Can't serialize {param!r}")
+
+
+def deserialize_param(data: dict[str, Any]) -> Parameter:
+    match data["type"]:
+        case "ANY":
+            return F.ANY()
+        case "TBD":
+            return F.TBD()
+        case "Constant":
+            return F.Constant(_deserialize_value(data["value"]))
+        case "Range":
+            return F.Range(*(deserialize_param(b) for b in data["bounds"]))
+        case "Set":
+            return F.Set(deserialize_param(p) for p in data["params"])
+    raise ValueError(f"Can't deserialize {data!r}")
+
+
+def get_params(module: Module) -> dict[str, Parameter]:
+    return {
+        NotNone(p.get_parent())[1]: p
+        for p in module.get_children(direct_only=True, types=Parameter)
+    }
+
+
+def constraints_fingerprint(module: Module) -> str:
+    """
+    Hash of the current constraints of all parameters of `module`
+    """
+    constraints = {}
+    for name, p in get_params(module).items():
+        try:
+            constraints[name] = serialize_param(p)
+        except ValueError:
+            constraints[name] = repr(p.get_most_narrow())
+
+    return hashlib.sha1(
+        json.dumps(
+            {"type": type(module).__qualname__, "params": constraints},
+            sort_keys=True,
+        ).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def get_constraints(modules: Iterable[Module]) -> dict[Module, str]:
+    """
+    Constraint fingerprints of all modules that have a picker
+    """
+    return {m: constraints_fingerprint(m) for m in modules if m.has_trait(F.has_picker)}
+
+
+def get_path(node: Node) -> str:
+    """
+    Path of `node` relative to the root of its hierarchy
+    """
+    return ".".join(name for _, name in node.get_hierarchy()[1:])
+
+
+# ----------------------------------------
+#               Lockfile
+# ----------------------------------------
+@dataclass
+class LockedPart:
+    partno: str
+    constraints: str
+    params: dict[str, Any]
+    footprint: str | None = None
+    pinmap: dict[str, str] | None = None
+    info: dict[str, str] | None = None
+
+    @classmethod
+    def from_module(cls, module: Module, constraints: str) -> "LockedPart":
+        part = module.get_trait(has_part_picked).get_part()
+        if isinstance(part, has_part_picked_remove.RemovePart):
+            return cls(partno=REMOVE, constraints=constraints, params={})
+
+        params = {}
+        for name, p in get_params(module).items():
+            try:
+                params[name] = serialize_param(p)
+            except ValueError:
+                logger.debug(f"Not locking parameter {name} of {module}")
+
+        footprint = None
+        if module.has_trait(F.has_footprint):
+            fp = module.get_trait(F.has_footprint).get_footprint()
+            if fp.has_trait(F.has_kicad_footprint):
+                footprint = fp.get_trait(F.has_kicad_footprint).get_kicad_footprint()
+
+        pinmap = None
+        if module.has_trait(F.can_attach_to_footprint):
+            attach = module.get_trait(F.can_attach_to_footprint)
+            if isinstance(attach, F.can_attach_to_footprint_via_pinmap):
+                pinmap = {
+                    no: get_path(intf)
+                    for no, intf in attach.pinmap.items()
+                    if intf is not None
+                }
+
+        info = None
+        if module.has_trait(F.has_descriptive_properties):
+            info = module.get_trait(F.has_descriptive_properties).get_properties()
+
+        return cls(
+            partno=part.partno,
+            constraints=constraints,
+            params=params,
+            footprint=footprint,
+            pinmap=pinmap,
+            info=info,
+        )
+
+
+class PartsLock:
+    def __init__(self, parts: dict[str, LockedPart] | None = None):
+        self.parts = parts or {}
+        # entries as loaded, the base of the merge in `dump`
+        self.loaded = dict(self.parts)
+
+    @classmethod
+    def load(cls, path: Path) -> "PartsLock":
+        with file_lock(path):
+            return cls._read(path)
+
+    @classmethod
+    def _read(cls, path: Path) -> "PartsLock":
+        if not path.exists():
+            return cls()
+
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") != LOCK_VERSION:
+            logger.warning(f"Ignoring {path} with unsupported version")
+            return cls()
+
+        return cls(
+            {
+                module: LockedPart(**locked)
+                for module, locked in data.get("parts", {}).items()
+            }
+        )
+
+    def dumps(self) -> str:
+        return (
+            json.dumps(
+                {
+                    "version": LOCK_VERSION,
+                    "parts": {k: asdict(v) for k, v in sorted(self.parts.items())},
+                },
+                indent=2,
+                sort_keys=True,
+            )
+            + "\n"
+        )
+
+    def dump(self, path: Path):
+        """
+        Merge the entries changed since `load` into the lockfile and write it, only
+        touching it if its content changed
+
+        Entries of other builds that wrote the file in the meantime are kept,
+        unless this build changed (or removed) the same entry. Holds
+        `file_lock(path)` from reading to writing, the file is replaced
+        atomically.
+        """
+        with file_lock(path):
+            on_disk = self._read(path).parts
+            changed = {
+                module
+                for module in self.loaded.keys() | self.parts.keys()
+                if self.loaded.get(module) != self.parts.get(module)
+            }
+            self.parts = {
+                **{k: v for k, v in on_disk.items() if k not in changed},
+                **{k: v for k, v in self.parts.items() if k in changed},
+            }
+            self.loaded = dict(self.parts)
+
+            content = self.dumps()
+            if path.exists() and path.read_text(encoding="utf-8") == content:
+                return
+            atomic_write_text(path, content)
+        logger.info(
+            f"Wrote {len(self.parts)} locked parts to {path}"
+            f" ({len(changed)} changed by this build)"
+        )
+
+    # --------------------------------------------------------------------------
+    def apply(
+        self, modules: Iterable[Module], constraints: dict[Module, str]
+    ) -> set[Module]:
+        """
+        Attach the locked part to every module that still matches its lock entry.
+
+        Returns the modules that got their part from the lock.
+        """
+        attached: set[Module] = set()
+        stale: list[str] = []
+
+        for module in modules:
+            if module not in constraints or module.has_trait(has_part_picked):
+                continue
+            path = get_path(module)
+            locked = self.parts.get(path)
+            if locked is None:
+                continue
+            if locked.constraints != constraints[module]:
+                stale.append(f"{path}: constraints changed")
+                continue
+
+            try:
+                self._attach(module, locked)
+            except (PickError, LookupError, ValueError) as e:
+                stale.append(f"{path}: {type(e).__name__}")
+                continue
+            attached.add(module)
+
+        logger.info(
+            f"Attached {len(attached)} locked parts, {len(stale)} need to be re-picked"
+        )
+        for s in stale:
+            logger.info(f"  {s}")
+
+        return attached
+
+    def update(self, modules: Iterable[Module], constraints: dict[Module, str]):
+        """
+        Replace the lock entries with the current picks of `modules`, `dump`
+        merges them into the lockfile
+        """
+        self.parts = {
+            get_path(module): LockedPart.from_module(module, constraints[module])
+            for module in modules
+            if module in constraints and module.has_trait(has_part_picked)
+        }
+
+    @staticmethod
+    def _attach(module: Module, locked: LockedPart):
+        if locked.partno == REMOVE:
+            module.add(has_part_picked_remove())
+            return
+
+        pinmap = None
+        if locked.pinmap is not None:
+            pins = {
+                get_path(intf): intf
+                for intf in module.get_children(direct_only=False, types=F.Electrical)
+            }
+            missing = set(locked.pinmap.values()) - set(pins)
+            if missing:
+                raise LookupError(f"Pins {missing} not found in {module}")
+            pinmap = {no: pins[path] for no, path in locked.pinmap.items()}
+
+        # validates the locked values against the current constraints
+        pick_module_by_params(
+            module,
+            [
+                PickerOption(
+                    part=LCSC_Part(locked.partno),
+                    params={k: deserialize_param(v) for k, v in locked.params.items()},
+                    pinmap=pinmap,
+                    info=locked.info,
+                )
+            ],
+        )
+
+        if locked.footprint and module.has_trait(F.has_footprint):
+            fp = module.get_trait(F.has_footprint).get_footprint()
+            if (
+                fp.has_trait(F.has_kicad_footprint)
+                and fp.get_trait(F.has_kicad_footprint).get_kicad_footprint()
+                != locked.footprint
+            ):
+                logger.warning(
+                    f"Footprint of {locked.partno} changed for {get_path(module)}"
+                )
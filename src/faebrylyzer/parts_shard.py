@@ -0,0 +1,236 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Compact local shard of the JLCPCB parts database.
+
+Only contains the categories, packages and value ranges this design picks from,
+with indexes on the columns the pickers query (category/stock, package, stock).
+The shard keeps the schema of the full database, so the JLCPCB pickers run
+against it unchanged.
+
+Usage:
+    python -m faebrylyzer.parts_shard --source <jlcpcb db> --out <shard dir>
+
+`main` picks from the shard in `build/cache/jlcpcb_shard` whenever it exists, and
+picks the parts it can't find there from the full database.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import typer
+from faebryk.libs.logging import setup_basic_logging
+from faebryk.libs.picker.jlcpcb.jlcpcb import JLCPCB_DB
+from typing_extensions import Annotated
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR = Path("./build/cache/jlcpcb_shard")
+DB_FILE = "cache.sqlite3"
+
+
+@dataclass
+class ShardCategory:
+    """
+    Components to extract, matched like ComponentQuery.filter_by_category
+    ("" matches any)
+    """
+
+    category: str
+    subcategory: str
+    packages: list[str] = field(default_factory=list)
+    value_attribute: str | None = None
+    value_range: tuple[float, float] | None = None
+
+
+SHARD_CATEGORIES = [
+    ShardCategory(
+        "Resistors",
+        "Chip Resistor - Surface Mount",
+        packages=["0402"],
+        value_attribute="Resistance",
+        value_range=(1, 10e6),
+    ),
+    ShardCategory(
+        "Resistors",
+        "Resistor Networks",
+        packages=["0402"],
+        value_attribute="Resistance",
+        value_range=(1, 10e6),
+    ),
+    ShardCategory(
+        "Capacitors",
+        "Multilayer Ceramic Capacitors MLCC - SMD/SMT",
+        packages=["0402"],
+        value_attribute="Capacitance",
+        value_range=(1e-12, 100e-6),
+    ),
+    ShardCategory("", "Light Emitting Diodes (LED)"),
+    ShardCategory("", "LDO"),
+    ShardCategory("", "TVS"),
+    ShardCategory("", "EEPROM"),
+    ShardCategory("", "Crystals"),
+    ShardCategory("", "Buffer"),
+]
+
+SI_PREFIXES = {
+    "p": 1e-12,
+    "n": 1e-9,
+    "u": 1e-6,
+    "µ": 1e-6,
+    "m": 1e-3,
+    "": 1,
+    "k": 1e3,
+    "M": 1e6,
+    "G": 1e9,
+}
+SI_VALUE = re.compile(r"^\s*([0-9]*\.?[0-9]+)\s*([pnuµmkMG]?)")
+
+
+def parse_si_value(value: str) -> float | None:
+    """
+    Parse the leading number of an attribute like "4.7kΩ" or "100nF"
+    """
+    match = SI_VALUE.match(value)
+    if not match:
+        return None
+    number, prefix = match.groups()
+    return float(number) * SI_PREFIXES[prefix]
+
+
+def _attribute_value(extra: str | None, attribute: str | None) -> float | None:
+    if not extra or not attribute:
+        return None
+    try:
+        value = json.loads(extra)["attributes"][attribute]
+    except (ValueError, KeyError, TypeError):
+        return None
+    return parse_si_value(value) if isinstance(value, str) else None
+
+
+def build_shard(
+    source: Path,
+    out_dir: Path = SHARD_DIR,
+    categories: list[ShardCategory] = SHARD_CATEGORIES,
+    min_stock: int = 1,
+) -> Path:
+    """
+    Extract the given categories from the JLCPCB database at `source` into an
+    indexed shard at `out_dir`
+    """
+    if not source.is_file():
+        raise FileNotFoundError(f"No JLCPCB database found at {source}")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out = out_dir.joinpath(DB_FILE)
+    tmp = out.with_suffix(".tmp")
+    tmp.unlink(missing_ok=True)
+
+    con = sqlite3.connect(tmp)
+    con.create_function("attribute_value", 2, _attribute_value, deterministic=True)
+    con.execute("ATTACH DATABASE ? AS src", (str(source),))
+
+    # same schema as the full database
+    for (sql,) in con.execute(
+        "SELECT sql FROM src.sqlite_master WHERE type = 'table'"
+        " AND name IN ('categories', 'manufacturers', 'components')"
+    ).fetchall():
+        con.execute(sql)
+
+    con.execute("INSERT INTO categories SELECT * FROM src.categories")
+
+    for c in categories:
+        where = ["cat.category LIKE ?", "cat.subcategory LIKE ?", "c.stock >= ?"]
+        params: list = [f"%{c.category}%", f"%{c.subcategory}%", min_stock]
+        if c.packages:
+            where.append(
+                "(" + " OR ".join("c.package LIKE ?" for _ in c.packages) + ")"
+            )
+            params += [f"%{p}%" for p in c.packages]
+        if c.value_range:
+            where.append("attribute_value(c.extra, ?) BETWEEN ? AND ?")
+            params += [c.value_attribute, *c.value_range]
+
+        cur = con.execute(
+            "INSERT OR IGNORE INTO components"
+            " SELECT c.* FROM src.components c"
+            " JOIN src.categories cat ON c.category_id = cat.id"
+            f" WHERE {' AND '.join(where)}",
+            params,
+        )
+        logger.info(f"{c.category}/{c.subcategory}: {cur.rowcount} components")
+
+    con.execute(
+        "INSERT INTO manufacturers SELECT * FROM src.manufacturers"
+        " WHERE id IN (SELECT DISTINCT manufacturer_id FROM components)"
+    )
+
+    con.execute(
+        "CREATE INDEX components_category_stock ON components (category_id, stock)"
+    )
+    con.execute("CREATE INDEX components_package ON components (package)")
+    con.execute("CREATE INDEX components_stock ON components (stock)")
+
+    con.commit()
+    con.execute("DETACH DATABASE src")
+    con.execute("ANALYZE")
+    con.execute("VACUUM")
+    con.close()
+
+    tmp.replace(out)
+    logger.info(f"Wrote parts shard {out} ({out.stat().st_size / 1e6:.1f} MB)")
+    return out
+
+
+def has_shard(shard_dir: Path = SHARD_DIR) -> bool:
+    return shard_dir.joinpath(DB_FILE).is_file()
+
+
+def use_shard(shard_dir: Path = SHARD_DIR):
+    """
+    Point the JLCPCB pickers at the shard instead of the full database
+    """
+    if not has_shard(shard_dir):
+        raise FileNotFoundError(f"No parts shard found at {shard_dir}")
+
+    JLCPCB_DB.config.db_path = shard_dir
+    # never replace the shard with a download of the full database
+    JLCPCB_DB.config.no_download_prompt = True
+    JLCPCB_DB.config.force_db_update = False
+
+
+def use_full_database(db_path: Path):
+    """
+    Point the JLCPCB pickers back at the full database at `db_path`, closing the
+    shard if it is open
+    """
+    db = JLCPCB_DB._instance
+    if db is not None and db.connected:
+        asyncio.run(db._close_db())
+    JLCPCB_DB.close()
+
+    JLCPCB_DB.config.db_path = db_path
+    JLCPCB_DB.config.no_download_prompt = JLCPCB_DB.Config.no_download_prompt
+
+
+def main(
+    source: Annotated[
+        Path, typer.Option(help="Full JLCPCB database (cache.sqlite3)")
+    ] = JLCPCB_DB.config.db_path.joinpath(DB_FILE),
+    out: Annotated[Path, typer.Option(help="Output directory of the shard")] = (
+        SHARD_DIR
+    ),
+    min_stock: Annotated[int, typer.Option(help="Minimum stock of a part")] = 1,
+):
+    build_shard(source, out, min_stock=min_stock)
+
+
+if __name__ == "__main__":
+    setup_basic_logging()
+    typer.run(main)
@@ -7,8 +7,6 @@ import subprocess
 import faebryk.library._F as F
 from faebryk.exporters.pcb.kicad.transformer import Font, PCB_Transformer
 from faebryk.exporters.pcb.layout.absolute import LayoutAbsolute
-from faebryk.exporters.pcb.layout.extrude import LayoutExtrude
-from faebryk.exporters.pcb.layout.matrix import LayoutMatrix
 from faebryk.exporters.pcb.layout.typehierarchy import LayoutTypeHierarchy
 from faebryk.libs.geometry.basic import Geometry
 from faebryk.libs.kicad.fileformats import (
@@ -19,23 +17,118 @@ from faebryk.libs.kicad.fileformats import (
 )
 
 from faebrylyzer.app import faebrylyzerApp
+from faebrylyzer.drc import Allow, ItemClass, ItemKind
+from faebrylyzer.footprints import DesignatorEdit, FootprintEditor
 from faebrylyzer.library.faebrykLogo import faebrykLogo
 from faebrylyzer.library.faebrylyzerModule import faebrylyzerModule
 from faebrylyzer.library.ResistorArray import ResistorArray
+from faebrylyzer.placement import LayoutParams, TunableLayout
+from faebrylyzer.routing import has_pcb_routing_strategy_grid
 
 Point2D = Geometry.Point2D
 
 logger = logging.getLogger(__name__)
 
 
+BOARD_SIZE = (45, 18)
+
+# values of the repeated layouts in apply_root_layout, suggestions for these are
+# made by `placement`
+LAYOUT_TABLE = {
+    "leds": LayoutParams(base=(3.5, -6.75, 0), vector=(0, 4.5, 0)),
+    "mcu_caps": LayoutParams(base=(-5.5, 2.25, 90), vector=(4.5, 0, 180)),
+    "xtal_caps": LayoutParams(base=(-2, 0, 270), vector=(0, -4, 180)),
+    "resistor_arrays": LayoutParams(base=(24, 1.75, 270), vector=(2.75, 12, 0)),
+    "ldo_caps": LayoutParams(base=(-3, 0, 0), vector=(6, 0, 90)),
+    "ldo_diodes": LayoutParams(base=(-8.5, 2, 0), vector=(0, 9, 0)),
+    "eeprom_resistors": LayoutParams(base=(1.5, -1.8, 0), vector=(0, 3.6, 180)),
+}
+
+# intentional problems of this board found by the placement check (see `drc`)
+_DESIGNATOR = ItemClass(ItemKind.SILKSCREEN, name="Reference")
+DRC_ALLOWLIST = [
+    # the card edge connector and the mounting slot reach over the board edge
+    Allow("outside outline", ItemClass(footprint="custom:SFP_Edge")),
+    Allow("outside outline", ItemClass(footprint="custom:MountingSlot")),
+    # the board name is as high as the board
+    Allow("outside outline", ItemClass(footprint=None, name="faebrylyzer")),
+    # the LED labels frame the light holes (unnamed pads) of the reverse mount LEDs
+    Allow(
+        "silkscreen on pad",
+        ItemClass(ItemKind.PAD, footprint="lcsc:LED-*", name=""),
+        ItemClass(ItemKind.SILKSCREEN, footprint=None, name="[[] ] *"),
+    ),
+    # designators are 0.5 mm text at a fixed offset (see add_graphical_elements),
+    # the fab clips silkscreen at pads and the board edge
+    Allow("silkscreen on pad", _DESIGNATOR),
+    Allow("silkscreen overlap", _DESIGNATOR),
+    Allow("outside outline", _DESIGNATOR),
+    # footprint outlines may touch each other and the pads of neighbours
+    Allow(
+        "silkscreen overlap",
+        ItemClass(ItemKind.SILKSCREEN, name="graphic"),
+        ItemClass(ItemKind.SILKSCREEN, name="graphic"),
+    ),
+    Allow("silkscreen on pad", ItemClass(ItemKind.SILKSCREEN, name="graphic")),
+]
+
+
 # ----------------------------------------
 #               Functions
 # ----------------------------------------
+def get_outline_coordinates(
+    board_size: tuple[float, float],
+) -> list[tuple[float, float]]:
+    board_width, board_height = board_size
+    return [
+        (0, 0),
+        (board_width, 0),
+        (board_width, 3),
+        (board_width - 6.5, 3),
+        # (board_width - 6.5, 0),
+        (board_width - 6.5, 4.6),
+        (board_width, 4.6),
+        (board_width, board_height / 2 + 4.6),
+        (board_width - 6.5, board_height / 2 + 4.6),
+        # (board_width - 6.5, board_height),
+        (board_width - 6.5, board_height - 3),
+        (board_width, board_height - 3),
+        (board_width, board_height),
+        (0, board_height),
+    ]
+
+
+def get_channel_nets(app: faebrylyzerApp) -> list[F.Net]:
+    """
+    Nets of the channel signal chains: connector -> resistor array -> buffer ->
+    resistor array -> mcu
+    """
+    signals = [
+        *(channel.signal for channel in app.faebrylyzer_module.channels),
+        *(a.signal for a in app.buffer.A),
+        *(y.signal for y in app.buffer.Y),
+        *(pb.signal for pb in app.mcu.PB),
+    ]
+    return [net for signal in signals if (net := signal.get_net()) is not None]
+
+
 def apply_routing(transformer: PCB_Transformer):
-    pass
+    app = transformer.app
+    assert isinstance(app, faebrylyzerApp)
+
+    # routed after the footprints have been placed
+    app.add(
+        has_pcb_routing_strategy_grid(
+            get_channel_nets(app), outline=get_outline_coordinates(BOARD_SIZE)
+        )
+    )
 
 
-def apply_root_layout(app: faebrylyzerApp, board_size: tuple[float, float]):
+def apply_root_layout(
+    app: faebrylyzerApp,
+    board_size: tuple[float, float],
+    table: dict[str, LayoutParams] = LAYOUT_TABLE,
+):
     Point = F.has_pcb_position.Point
     L = F.has_pcb_position.layer_type
     LVL = LayoutTypeHierarchy.Level
@@ -54,10 +147,7 @@ def apply_root_layout(app: faebrylyzerApp, board_size: tuple[float, float]):
         ),
         LVL(
             mod_type=F.PoweredLED,
-            layout=LayoutExtrude(
-                base=Point((3.5, -6.75, 0, L.BOTTOM_LAYER)),
-                vector=(0, 4.5, 0),
-            ),
+            layout=TunableLayout.extrude(table, "leds", L.BOTTOM_LAYER),
             children_layout=LayoutTypeHierarchy(
                 layouts=[
                     LVL(
@@ -83,10 +173,8 @@ def apply_root_layout(app: faebrylyzerApp, board_size: tuple[float, float]):
                             layouts=[
                                 LVL(
                                     mod_type=F.Capacitor,
-                                    layout=LayoutExtrude(
-                                        base=Point((-5.5, 2.25, 90, L.NONE)),
-                                        vector=(4.5, 0, 180),
-                                        dynamic_rotation=True,
+                                    layout=TunableLayout.extrude(
+                                        table, "mcu_caps", dynamic_rotation=True
                                     ),
                                 ),
                             ]
@@ -98,7 +186,7 @@ def apply_root_layout(app: faebrylyzerApp, board_size: tuple[float, float]):
                     ),
                     LVL(
                         mod_type=F.Resistor,
-                        layout=LayoutAbsolute(Point((-3.25, 5.75, 0, L.NONE))),
+                        layout=LayoutAbsolute(Point((-3.25, 5.75, 270, L.NONE))),
                     ),
                     LVL(
                         mod_type=F.Crystal_Oscillator,
@@ -111,10 +199,8 @@ def apply_root_layout(app: faebrylyzerApp, board_size: tuple[float, float]):
                                 ),
                                 LVL(
                                     mod_type=F.Capacitor,
-                                    layout=LayoutExtrude(
-                                        base=Point((-2, 0, 270, L.NONE)),
-                                        vector=(0, -4, 180),
-                                        dynamic_rotation=True,
+                                    layout=TunableLayout.extrude(
+                                        table, "xtal_caps", dynamic_rotation=True
                                     ),
                                 ),
                             ]
@@ -137,10 +223,8 @@ def apply_root_layout(app: faebrylyzerApp, board_size: tuple[float, float]):
         ),
         LVL(
             mod_type=ResistorArray,
-            layout=LayoutMatrix(
-                base=Point((24, 1.75, 270, L.TOP_LAYER)),
-                vector=(2.75, 12, 0),
-                distribution=(2, 3),
+            layout=TunableLayout.matrix(
+                table, "resistor_arrays", distribution=(2, 3), layer=L.TOP_LAYER
             ),
         ),
         LVL(
@@ -150,17 +234,12 @@ def apply_root_layout(app: faebrylyzerApp, board_size: tuple[float, float]):
                 layouts=[
                     LVL(
                         mod_type=F.Capacitor,
-                        layout=LayoutExtrude(
-                            base=Point((-3, 0, 0, L.NONE)),
-                            vector=(6, 0, 90),
-                        ),
+                        layout=TunableLayout.extrude(table, "ldo_caps"),
                     ),
                     LVL(
                         mod_type=F.Diode,
-                        layout=LayoutExtrude(
-                            base=Point((-8.5, 2, 0, L.NONE)),
-                            vector=(0, 9, 0),
-                            reverse_order=True,
+                        layout=TunableLayout.extrude(
+                            table, "ldo_diodes", reverse_order=True
                         ),
                     ),
                 ]
@@ -173,10 +252,8 @@ def apply_root_layout(app: faebrylyzerApp, board_size: tuple[float, float]):
                 layouts=[
                     LVL(
                         mod_type=F.Resistor,
-                        layout=LayoutExtrude(
-                            base=Point((1.5, -1.8, 0, L.NONE)),
-                            vector=(0, 3.6, 180),
-                            reverse_order=True,
+                        layout=TunableLayout.extrude(
+                            table, "eeprom_resistors", reverse_order=True
                         ),
                     ),
                     LVL(
@@ -306,14 +383,16 @@ def add_graphical_elements(
     )
 
     # move all reference designators to the same position
-    transformer.set_designator_position(
-        offset=0.75,
-        displacement=C_xy(0, 0),
-        offset_side=PCB_Transformer.Side.BOTTOM,
-        layer=None,
-        font=Font(size=C_wh(0.5, 0.5), thickness=0.1),
-        knockout=None,
+    editor = FootprintEditor(transformer)
+    editor.add(
+        DesignatorEdit(
+            offset=0.75,
+            displacement=C_xy(0, 0),
+            side=PCB_Transformer.Side.BOTTOM,
+            font=Font(size=C_wh(0.5, 0.5), thickness=0.1),
+        )
     )
+    editor.apply()
 
 
 def transform_pcb(transformer: PCB_Transformer):
@@ -323,24 +402,8 @@ def transform_pcb(transformer: PCB_Transformer):
     # ----------------------------------------
     #               PCB outline
     # ----------------------------------------
-    board_width = 45
-    board_height = 18
-    outline_coordinates = [
-        (0, 0),
-        (board_width, 0),
-        (board_width, 3),
-        (board_width - 6.5, 3),
-        # (board_width - 6.5, 0),
-        (board_width - 6.5, 4.6),
-        (board_width, 4.6),
-        (board_width, board_height / 2 + 4.6),
-        (board_width - 6.5, board_height / 2 + 4.6),
-        # (board_width - 6.5, board_height),
-        (board_width - 6.5, board_height - 3),
-        (board_width, board_height - 3),
-        (board_width, board_height),
-        (0, board_height),
-    ]
+    board_width, board_height = BOARD_SIZE
+    outline_coordinates = get_outline_coordinates(BOARD_SIZE)
     # TODO reenable
     # transformer.insert_pcb_outline(
     #    outline_coordinates,
@@ -0,0 +1,306 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Bounded part picking.
+
+Drop-in replacement for faebryk's `pick_part_recursively` that
+- picks modules whose parameters constrain others (e.g. a crystal and the load
+  capacitors of its oscillator) before the modules they constrain, so constraints
+  are concrete when the dependent modules are evaluated
+- never retries a picker with the exact constraints (and values of the
+  parameters they are computed from) it already failed with
+- stops after a time/evaluation budget with a report of where the search got stuck
+
+Picker options are not pruned ahead of the pickers yet, each picker still matches
+all of its options. The search is opt-in (`main --bounded-pick`).
+"""
+
+import graphlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+
+import faebryk.library._F as F
+from faebryk.core.module import Module
+from faebryk.core.moduleinterface import ModuleInterface
+from faebryk.core.node import Node
+from faebryk.core.parameter import Parameter
+from faebryk.libs.picker.picker import (
+    PickerProgress,
+    PickError,
+    PickErrorChildren,
+    _get_mif_top_level_modules,
+    has_part_picked,
+)
+
+from faebrylyzer.parts_lock import constraints_fingerprint, serialize_param
+
+logger = logging.getLogger(__name__)
+
+
+class PickBudgetExceeded(PickError): ...
+
+
+@dataclass
+class PickBudget:
+    max_evaluations: int | None = 20000
+    max_seconds: float | None = 300
+
+    evaluations: int = 0
+    attempts: dict[Module, int] = field(default_factory=dict)
+    _start: float = field(default_factory=time.perf_counter)
+
+    def start(self):
+        self._start = time.perf_counter()
+        self.evaluations = 0
+        self.attempts.clear()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def spend(self, module: Module):
+        self.evaluations += 1
+        self.attempts[module] = self.attempts.get(module, 0) + 1
+
+        if self.max_evaluations is not None and self.evaluations > self.max_evaluations:
+            raise PickBudgetExceeded(
+                self.report(f"more than {self.max_evaluations} picker evaluations"),
+                module,
+            )
+        if self.max_seconds is not None and self.elapsed > self.max_seconds:
+            raise PickBudgetExceeded(
+                self.report(f"more than {self.max_seconds}s"), module
+            )
+
+    def report(self, reason: str, top: int = 10) -> str:
+        most_attempted = sorted(
+            self.attempts.items(), key=lambda x: x[1], reverse=True
+        )[:top]
+        return "\n".join(
+            [
+                f"Picking aborted after {reason}"
+                f" ({self.evaluations} evaluations in {self.elapsed:.1f}s)",
+                "Most attempted modules:",
+                *(f"  {n:5d}x {m}" for m, n in most_attempted),
+            ]
+        )
+
+
+# ----------------------------------------
+#       Constraint dependencies
+# ----------------------------------------
+def _owner(param: Parameter) -> Module | None:
+    node: Node = param
+    while parent := node.get_parent():
+        node = parent[0]
+        if isinstance(node, Module):
+            return node
+    return None
+
+
+def _constraining_params(param: Parameter) -> set[Parameter]:
+    """
+    All parameters that appear as operands in the constraints of `param`, also
+    inside the bounds of ranges and the members of sets
+    """
+    out: set[Parameter] = set()
+    stack = [param]
+    while stack:
+        for p in stack.pop().get_narrowing_chain():
+            if isinstance(p, F.Operation):
+                operands = p.operands
+            elif isinstance(p, F.Range):
+                operands = p.bounds
+            elif isinstance(p, F.Set):
+                operands = p.params
+            else:
+                continue
+            for operand in operands:
+                if operand not in out:
+                    out.add(operand)
+                    stack.append(operand)
+    return out
+
+
+def get_dependencies(modules: set[Module]) -> dict[Module, set[Module]]:
+    """
+    For every pickable module, the modules whose parameters constrain it
+    """
+    out: dict[Module, set[Module]] = {}
+    for m in modules:
+        if not m.has_trait(F.has_picker):
+            continue
+        deps = {
+            owner
+            for p in m.get_children(direct_only=True, types=Parameter)
+            for operand in _constraining_params(p)
+            if (owner := _owner(operand)) is not None and owner is not m
+        }
+        if deps:
+            out[m] = deps
+    return out
+
+
+def _operand_values(module: Module) -> str | None:
+    """
+    Current values of all parameters the constraints of `module` are computed
+    from, None if one of them can't be serialized
+    """
+    operands = {
+        operand
+        for p in module.get_children(direct_only=True, types=Parameter)
+        for operand in _constraining_params(p)
+    }
+    values = []
+    for operand in operands:
+        try:
+            value = serialize_param(operand)
+        except ValueError:
+            if isinstance(operand.get_most_narrow(), (F.Operation, F.Range, F.Set)):
+                # composed of other operands, which are in the set as well
+                continue
+            return None
+        values.append(json.dumps([operand.get_full_name(), value], sort_keys=True))
+    return "\n".join(sorted(values))
+
+
+def _ancestor_in[T: Node](node: Node, candidates: set[T]) -> T | None:
+    for n, _ in reversed(node.get_hierarchy()):
+        if n in candidates:
+            return n  # type: ignore
+    return None
+
+
+# ----------------------------------------
+#               Search
+# ----------------------------------------
+class BoundedPartPicker:
+    def __init__(self, budget: PickBudget | None = None):
+        self.budget = budget or PickBudget()
+        self.dependencies: dict[Module, set[Module]] = {}
+        self.failed: dict[tuple[Module, str, str], PickError] = {}
+
+    def pick(self, module: Module):
+        self.budget.start()
+        self.failed.clear()
+        self.dependencies = get_dependencies(
+            module.get_children_modules(direct_only=False) | {module.get_most_special()}
+        )
+        if self.dependencies:
+            logger.info(
+                f"Picking {len(self.dependencies)} modules after the modules"
+                " constraining them"
+            )
+
+        pp = PickerProgress.from_module(module)
+        try:
+            with pp.context():
+                self._pick(module, pp)
+        except PickErrorChildren as e:
+            for m, sube in e.get_all_children().items():
+                logger.error(f"Could not find pick for {m}:\n {sube.message}")
+            raise
+
+        for m in module.get_children_modules(direct_only=False):
+            if (
+                m.has_trait(F.has_picker)
+                and not m.has_trait(has_part_picked)
+                and not m.get_children_modules(direct_only=True)
+            ):
+                logger.warning(f"Part without pick {m}")
+
+        logger.info(
+            f"Picked parts with {self.budget.evaluations} evaluations"
+            f" in {self.budget.elapsed:.1f}s"
+        )
+
+    def _order(self, children: set[Module]) -> list[Module]:
+        """
+        Order `children` so that subtrees constraining others come first
+        """
+        ordered = sorted(children, key=lambda c: c.get_full_name())
+        sorter = graphlib.TopologicalSorter({c: set() for c in ordered})
+        for m, deps in self.dependencies.items():
+            dependent = _ancestor_in(m, children)
+            if dependent is None:
+                continue
+            for d in deps:
+                producer = _ancestor_in(d, children)
+                if producer is not None and producer is not dependent:
+                    sorter.add(dependent, producer)
+        try:
+            return list(sorter.static_order())
+        except graphlib.CycleError:
+            return ordered
+
+    def _pick(self, module: Module, progress: PickerProgress):
+        module = module.get_most_special()
+
+        if module.has_trait(has_part_picked):
+            return
+
+        for mif in module.get_children(direct_only=True, types=ModuleInterface):
+            for mod in _get_mif_top_level_modules(mif):
+                self._pick(mod, progress)
+
+        if module.has_trait(F.has_picker):
+            # the fingerprint only has the constraints as far as they are resolved,
+            # so the values of their operands are part of the key, and modules
+            # with unresolved operands are never memoised
+            operands = _operand_values(module)
+            key = (
+                (module, constraints_fingerprint(module), operands)
+                if operands is not None
+                else None
+            )
+            if key in self.failed and not module.get_children_modules(direct_only=True):
+                # deterministic pickers, same constraints -> same result
+                raise self.failed[key]
+
+            self.budget.spend(module)
+            try:
+                module.get_trait(F.has_picker).pick()
+            except PickError as e:
+                if key is not None:
+                    self.failed[key] = e
+                if not module.get_children_modules(direct_only=True):
+                    raise e
+
+        if module.has_trait(has_part_picked):
+            progress.advance(module)
+            return
+
+        if module.get_most_special() != module:
+            self._pick(module, progress)
+            return
+
+        to_pick = self._order(
+            {
+                c
+                for c in module.get_children(types=Module, direct_only=True)
+                if not c.has_trait(has_part_picked)
+            }
+        )
+        failed: dict[Module, PickError] = {}
+
+        # try repicking as long as progress is being made
+        while to_pick:
+            for child in to_pick:
+                try:
+                    self._pick(child, progress)
+                except PickBudgetExceeded:
+                    raise
+                except PickError as e:
+                    failed[child] = e
+
+            # no progress or last one failed as only
+            if len(failed) == len(to_pick) or (
+                len(failed) == 1 and to_pick[-1] in failed
+            ):
+                raise PickErrorChildren(module, failed)
+
+            to_pick = [c for c in to_pick if c in failed]
+            failed.clear()
@@ -0,0 +1,287 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Diagnostics for part picking.
+
+Records per module: time spent, pickers tried in priority order, options
+evaluated/rejected (with the reason) and how often picking was retried because of
+backtracking in `pick_part_recursively`.
+"""
+
+import csv
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+import faebryk.library._F as F
+from faebryk.core.module import Module
+from faebryk.core.parameter import Parameter
+from faebryk.libs.picker.jlcpcb.pickers import JLCPCBPicker
+from faebryk.libs.picker.picker import (
+    PickerOption,
+    PickErrorParams,
+    has_part_picked,
+)
+from faebryk.libs.picker.picker import (
+    pick_module_by_params as _pick_module_by_params,
+)
+from faebryk.libs.util import NotNone
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OptionRejection:
+    part: str
+    reason: str
+
+
+@dataclass
+class PickerAttempt:
+    picker: str
+    source: str
+    prio: int
+    duration: float = 0
+    success: bool = False
+    error: str | None = None
+    options_evaluated: int = 0
+    rejections: list[OptionRejection] = field(default_factory=list)
+
+
+@dataclass
+class ModulePickRecord:
+    module: str
+    type: str
+    rounds: int = 0
+    attempts: list[PickerAttempt] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return sum(a.duration for a in self.attempts)
+
+    @property
+    def backtracks(self) -> int:
+        return max(self.rounds - 1, 0)
+
+    @property
+    def options_evaluated(self) -> int:
+        return sum(a.options_evaluated for a in self.attempts)
+
+    @property
+    def options_rejected(self) -> int:
+        return sum(len(a.rejections) for a in self.attempts)
+
+    @property
+    def winner(self) -> PickerAttempt | None:
+        return next((a for a in self.attempts if a.success), None)
+
+
+class PickTrace:
+    """
+    Collects ModulePickRecords of all pickers instrumented with `instrument`
+    """
+
+    # trace of the picker running right now, only set while it runs
+    _active: "PickTrace | None" = None
+
+    def __init__(self):
+        self.records: dict[Module, ModulePickRecord] = {}
+        self._current: PickerAttempt | None = None
+
+    @classmethod
+    def current_attempt(cls) -> PickerAttempt | None:
+        return cls._active._current if cls._active else None
+
+    def instrument(self, modules: Iterable[Module]):
+        """
+        Wrap all registered pickers of the given modules, so they report to this
+        trace
+        """
+        for m in modules:
+            if not m.has_trait(F.has_picker):
+                continue
+            multi_picker = m.get_trait(F.has_picker)
+            if not isinstance(multi_picker, F.has_multi_picker):
+                continue
+            multi_picker.pickers = [
+                (
+                    prio,
+                    picker
+                    if isinstance(picker, TracedPicker)
+                    else TracedPicker(self, picker, prio, first=i == 0),
+                )
+                for i, (prio, picker) in enumerate(multi_picker.pickers)
+            ]
+
+    def record(self, module: Module) -> ModulePickRecord:
+        if module not in self.records:
+            self.records[module] = ModulePickRecord(
+                module=module.get_full_name(), type=type(module).__name__
+            )
+        return self.records[module]
+
+    # export -------------------------------------------------------------------
+    def to_json(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(
+                [
+                    asdict(r) | {"duration": r.duration, "backtracks": r.backtracks}
+                    for r in self.sorted_records()
+                ],
+                indent=2,
+            )
+        )
+
+    def to_csv(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                [
+                    "module",
+                    "type",
+                    "duration",
+                    "pickers_tried",
+                    "options_evaluated",
+                    "options_rejected",
+                    "backtracks",
+                    "winner",
+                    "winner_source",
+                    "winner_prio",
+                ]
+            )
+            for r in self.sorted_records():
+                winner = r.winner
+                writer.writerow(
+                    [
+                        r.module,
+                        r.type,
+                        f"{r.duration:.6f}",
+                        len(r.attempts),
+                        r.options_evaluated,
+                        r.options_rejected,
+                        r.backtracks,
+                        winner.picker if winner else "",
+                        winner.source if winner else "",
+                        winner.prio if winner else "",
+                    ]
+                )
+
+    def sorted_records(self) -> list[ModulePickRecord]:
+        return sorted(self.records.values(), key=lambda r: r.duration, reverse=True)
+
+    def log_summary(self, top: int = 10):
+        records = self.sorted_records()
+        if not records:
+            return
+
+        wins: dict[str, int] = {}
+        for r in records:
+            source = r.winner.source if r.winner else "none"
+            wins[source] = wins.get(source, 0) + 1
+
+        logger.info(
+            f"Picked {len(records)} modules in {sum(r.duration for r in records):.2f}s"
+            f", wins by source: {wins}"
+            f", backtracks: {sum(r.backtracks for r in records)}"
+        )
+        for r in records[:top]:
+            winner = r.winner
+            logger.info(
+                f"  {r.duration:8.3f}s {r.module} [{r.type}]"
+                f" pickers={len(r.attempts)} options={r.options_evaluated}"
+                f" rejected={r.options_rejected} backtracks={r.backtracks}"
+                f" winner={winner.picker if winner else None}"
+            )
+
+
+class TracedPicker(F.has_multi_picker.Picker):
+    def __init__(
+        self,
+        trace: PickTrace,
+        picker: F.has_multi_picker.Picker,
+        prio: int,
+        first: bool,
+    ):
+        self.trace = trace
+        self.picker = picker
+        self.prio = prio
+        self.first = first
+        self.source = "jlcpcb" if isinstance(picker, JLCPCBPicker) else "app"
+
+    def pick(self, module: Module):
+        record = self.trace.record(module)
+        if self.first:
+            record.rounds += 1
+
+        attempt = PickerAttempt(
+            picker=repr(self.picker), source=self.source, prio=self.prio
+        )
+        record.attempts.append(attempt)
+
+        # restored afterwards, so no trace (and app graph) outlives picking
+        previous = PickTrace._active, self.trace._current
+        PickTrace._active, self.trace._current = self.trace, attempt
+        start = time.perf_counter()
+        try:
+            self.picker.pick(module)
+            attempt.success = True
+        except Exception as e:
+            attempt.error = str(e).splitlines()[0] if str(e) else type(e).__name__
+            raise
+        finally:
+            attempt.duration = time.perf_counter() - start
+            PickTrace._active, self.trace._current = previous
+
+    def __repr__(self) -> str:
+        return repr(self.picker)
+
+
+def pick_module_by_params(module: Module, options: Iterable[PickerOption]):
+    """
+    Same as faebryk's pick_module_by_params, but reports evaluated and rejected
+    options to the active PickTrace
+
+    Options are matched against the module parameters like faebryk does, a
+    rejection records the filter or the first parameter that did not match. The
+    matching option is attached by faebryk.
+    """
+    attempt = PickTrace.current_attempt()
+    if attempt is None or module.has_trait(has_part_picked):
+        return _pick_module_by_params(module, options)
+
+    params = {
+        NotNone(p.get_parent())[1]: p.get_most_narrow()
+        for p in module.get_children(direct_only=True, types=Parameter)
+    }
+
+    options = list(options)
+    for option in options:
+        attempt.options_evaluated += 1
+        reason = _mismatch(module, params, option)
+        if reason is None:
+            return _pick_module_by_params(module, [option])
+        attempt.rejections.append(OptionRejection(option.part.partno, reason))
+
+    raise PickErrorParams(module, options)
+
+
+def _mismatch(
+    module: Module, params: dict[str, Parameter], option: PickerOption
+) -> str | None:
+    """
+    Why `option` does not match the module `params`, None if it does
+    """
+    if option.filter and not option.filter(module):
+        return "filter"
+    for k, v in (option.params or {}).items():
+        if k.startswith("_"):
+            continue
+        if not v.is_subset_of(params.get(k, F.ANY())):
+            return f"{k}={v} not in {params[k]}"
+    return None
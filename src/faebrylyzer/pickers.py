@@ -2,14 +2,16 @@
 # SPDX-License-Identifier: MIT
 
 import logging
+from typing import Callable, Iterable, Mapping
 
 import faebryk.library._F as F
+import faebryk.libs.picker.jlcpcb.picker_lib as jlcpcb_picker_lib
 from faebryk.core.module import Module
+from faebryk.libs.picker.jlcpcb.pickers import JLCPCBPicker
 from faebryk.libs.picker.lcsc import LCSC_Part
 from faebryk.libs.picker.picker import (
     PickerOption,
     has_part_picked_remove,
-    pick_module_by_params,
 )
 from faebryk.libs.units import P
 
@@ -17,6 +19,7 @@ from faebrylyzer.library.faebrykLogo import faebrykLogo
 from faebrylyzer.library.MountingSlot import MountingSlot
 from faebrylyzer.library.ResistorArray import ResistorArray
 from faebrylyzer.library.SFPEdgeConnector import SFPEdgeConnector
+from faebrylyzer.picker_trace import pick_module_by_params
 
 logger = logging.getLogger(__name__)
 
@@ -316,7 +319,18 @@ def pick_diode(module: F.Diode):
                     "reverse_leakage_current": F.Constant(1 * P.uA),
                 },
                 pinmap={"1": module.cathode, "2": module.anode},
-            )
+            ),
+            # FR107 F7
+            PickerOption(
+                part=LCSC_Part(partno="C2902909"),
+                params={
+                    "forward_voltage": F.Constant(1.3 * P.V),
+                    "max_current": F.Constant(1 * P.A),
+                    "reverse_working_voltage": F.Constant(1 * P.kV),
+                    "reverse_leakage_current": F.Constant(1 * P.uA),
+                },
+                pinmap={"1": module.cathode, "2": module.anode},
+            ),
         ],
     )
 
@@ -619,9 +633,52 @@ def pick_manual_footprint(module: Module):
 
 # ----------------------------------------------------------
 
+# modules without a part of their own, they are pads of their parent's footprint
+PARTLESS_TYPES: tuple[type[Module], ...] = (ResistorArray.Element,)
+
+
+type PickerEntry = tuple[int, F.has_multi_picker.Picker]
 
-def add_app_pickers(module: Module):
-    lookup = {
+
+class PickerRegistry[T]:
+    """
+    Type-to-picker lookup, resolved once per module type.
+
+    Like `F.has_multi_picker.add_pickers_by_type`, only the most specific entry is
+    used, which here is the first type in the MRO of the module that is in the
+    lookup.
+    """
+
+    def __init__(
+        self,
+        lookup: Mapping[type, T],
+        picker_factory: Callable[[T], F.has_multi_picker.Picker],
+        prio: int = 0,
+    ):
+        self.lookup = dict(lookup)
+        self.picker_factory = picker_factory
+        self.prio = prio
+        self._resolved: dict[type, F.has_multi_picker.Picker | None] = {}
+
+    def resolve(self, module_type: type) -> F.has_multi_picker.Picker | None:
+        if module_type not in self._resolved:
+            self._resolved[module_type] = next(
+                (
+                    self.picker_factory(self.lookup[t])
+                    for t in module_type.__mro__
+                    if t in self.lookup
+                ),
+                None,
+            )
+        return self._resolved[module_type]
+
+    def get_pickers(self, module: Module) -> list[PickerEntry]:
+        picker = self.resolve(type(module))
+        return [(self.prio, picker)] if picker else []
+
+
+APP_PICKERS = PickerRegistry(
+    {
         F.Resistor: pick_resistor,
         ResistorArray: pick_resistor_array,
         F.LED: pick_led,
@@ -630,16 +687,85 @@ def add_app_pickers(module: Module):
         F.CBM9002A_56ILG: pick_cbm9002A,
         F.EEPROM: pick_eeprom,
         F.TVS: pick_tvs,
-        # F.Diode: pick_diode,
+        F.Diode: pick_diode,
         F.Crystal: pick_crystal,
         F.Capacitor: pick_capacitor,
         SFPEdgeConnector: pick_manual_footprint,
         MountingSlot: pick_manual_footprint,
         F.GenericBusProtection: pick_no_footprint,
         faebrykLogo: pick_manual_footprint,
-    }
-    F.has_multi_picker.add_pickers_by_type(
-        module,
-        lookup,
-        F.has_multi_picker.FunctionPicker,
-    )
+    },
+    F.has_multi_picker.FunctionPicker,
+)
+
+
+def get_jlcpcb_pickers(module: Module, base_prio: int = 0) -> list[PickerEntry]:
+    """
+    Same pickers as faebryk's add_jlcpcb_pickers, but without opening the JLCPCB
+    database. The database is only opened by the first picker that actually
+    queries it.
+    """
+    return [
+        (base_prio, _JLCPCB_GENERIC_PICKERS[0]),
+        (base_prio, _JLCPCB_GENERIC_PICKERS[1]),
+    ] + [
+        (base_prio + 1, picker)
+        for _, picker in _JLCPCB_TYPE_PICKERS.get_pickers(module)
+    ]
+
+
+_JLCPCB_GENERIC_PICKERS = (
+    JLCPCBPicker(jlcpcb_picker_lib.find_and_attach_by_lcsc_id),
+    JLCPCBPicker(jlcpcb_picker_lib.find_and_attach_by_mfr),
+)
+_JLCPCB_TYPE_PICKERS = PickerRegistry(
+    jlcpcb_picker_lib.TYPE_SPECIFIC_LOOKUP, JLCPCBPicker
+)
+
+
+def attach_pickers(
+    modules: Iterable[Module],
+    jlcpcb: bool = True,
+    jlcpcb_fallback: bool = False,
+    jlcpcb_prio: int = 10,
+) -> set[Module]:
+    """
+    Attach the app pickers and, for modules not covered by them (or all modules with
+    `jlcpcb_fallback`), the JLCPCB pickers, with a single trait per module
+
+    Modules of `PARTLESS_TYPES` get no pickers.
+
+    Returns the modules covered by the app pickers
+    """
+    covered: set[Module] = set()
+    for module in modules:
+        if isinstance(module, PARTLESS_TYPES):
+            continue
+        pickers = APP_PICKERS.get_pickers(module)
+        if pickers:
+            covered.add(module)
+        if jlcpcb and (not pickers or jlcpcb_fallback):
+            pickers += get_jlcpcb_pickers(module, jlcpcb_prio)
+        if not pickers:
+            continue
+
+        pickers.sort(key=lambda x: x[0])
+        trait = F.has_multi_picker(*pickers[0])
+        trait.pickers = pickers
+        module.add(trait)
+
+    return covered
+
+
+def add_app_pickers(module: Module) -> bool:
+    """
+    Add the pickers of this file to `module`
+
+    Returns whether `module` is covered by one of them
+    """
+    return bool(attach_pickers([module], jlcpcb=False))
+
+
+def add_jlcpcb_pickers(module: Module, base_prio: int = 0):
+    for prio, picker in get_jlcpcb_pickers(module, base_prio):
+        module.add(F.has_multi_picker(prio, picker))
@@ -0,0 +1,514 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Placement optimizer over the tunable layouts of the root layout.
+
+The base and vector (x, y, rotation) of the `LayoutExtrude`/`LayoutMatrix` entries
+of `pcb.LAYOUT_TABLE` are searched by simulated annealing for the shortest
+ratsnest (weighted HPWL, see `wirelength`) without courtyard overlaps. A move
+changes one value of one layout, so only the footprints placed by that layout and
+the nets on their pads are evaluated again.
+
+The result is a suggested layout table, to be copied into `LAYOUT_TABLE`.
+"""
+
+import logging
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import faebryk.library._F as F
+import numpy as np
+from faebryk.core.module import Module
+from faebryk.core.node import Node
+from faebryk.exporters.pcb.kicad.transformer import PCB_Transformer
+from faebryk.exporters.pcb.layout.extrude import LayoutExtrude
+from faebryk.exporters.pcb.layout.layout import Layout
+from faebryk.exporters.pcb.layout.matrix import LayoutMatrix
+from faebryk.exporters.pcb.layout.typehierarchy import LayoutTypeHierarchy
+from faebryk.libs.kicad.fileformats import C_kicad_pcb_file
+
+from faebrylyzer.drc import ItemKind, get_items
+from faebrylyzer.layouts import BatchLayout, compose, relative
+from faebrylyzer.wirelength import NetClass, Ratsnest
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+logger = logging.getLogger(__name__)
+
+PCB = C_kicad_pcb_file.C_kicad_pcb
+Point = F.has_pcb_position.Point
+L = F.has_pcb_position.layer_type
+
+# positions are searched on this grid [mm], rotations in steps of 90°
+GRID = 0.05
+
+# power nets are connected by the zones, their ratsnest matters less
+NET_WEIGHTS = {
+    NetClass.CHANNEL: 1.0,
+    NetClass.USB: 1.0,
+    NetClass.POWER: 0.25,
+    NetClass.OTHER: 1.0,
+}
+
+
+@dataclass(frozen=True)
+class LayoutParams:
+    """
+    Tunable values of a LayoutExtrude/LayoutMatrix: base and vector as x, y, r
+    """
+
+    base: tuple[float, float, float]
+    vector: tuple[float, float, float]
+
+
+@dataclass(frozen=True, eq=True)
+class TunableLayout(BatchLayout):
+    """
+    Layout of a layout table entry, records the nodes it places and with which
+    multiple of the layout vector
+    """
+
+    key: str = ""
+    placed: list[tuple[Node, tuple[float, float, float]]] = field(
+        default_factory=list, compare=False, repr=False
+    )
+
+    @classmethod
+    def extrude(
+        cls,
+        table: dict[str, LayoutParams],
+        key: str,
+        layer: L = L.NONE,
+        **kwargs,
+    ) -> "TunableLayout":
+        params = table[key]
+        return cls(
+            LayoutExtrude(
+                base=Point((*params.base, layer)), vector=params.vector, **kwargs
+            ),
+            key=key,
+        )
+
+    @classmethod
+    def matrix(
+        cls,
+        table: dict[str, LayoutParams],
+        key: str,
+        distribution: tuple[int, int],
+        layer: L = L.NONE,
+    ) -> "TunableLayout":
+        params = table[key]
+        return cls(
+            LayoutMatrix(
+                base=Point((*params.base, layer)),
+                vector=params.vector,
+                distribution=distribution,
+            ),
+            key=key,
+        )
+
+    @property
+    def params(self) -> LayoutParams:
+        vector = (*self.layout.vector, 0)[:3]
+        return LayoutParams(
+            base=tuple(self.layout.base[:3]),  # type: ignore
+            vector=vector,  # type: ignore
+        )
+
+    def apply(self, *node: Node):
+        nodes = self.order(node)
+        self.placed.extend(zip(nodes, map(tuple, self.multiples(len(nodes)).tolist())))
+        super().apply(*nodes)
+
+
+def find_tunable_layouts(layout: Layout) -> list[TunableLayout]:
+    if isinstance(layout, TunableLayout):
+        return [layout]
+    if isinstance(layout, LayoutTypeHierarchy):
+        return [
+            tunable
+            for level in layout.layouts
+            for sub in (level.layout, level.children_layout)
+            if sub is not None
+            for tunable in find_tunable_layouts(sub)
+        ]
+    return []
+
+
+# ----------------------------------------
+#               Geometry
+# ----------------------------------------
+def _boxes(
+    at: "NDArray[np.float64]", local: "NDArray[np.float64]"
+) -> "NDArray[np.float64]":
+    """
+    Bounding boxes (x0, y0, x1, y1) of the `local` boxes of footprints at `at`
+    """
+    corners = local[:, [[0, 1], [2, 1], [2, 3], [0, 3]]]
+    placed = compose(
+        at[:, None, :], np.concatenate([corners, np.zeros((*corners.shape[:2], 1))], 2)
+    )
+    return np.concatenate([placed[..., :2].min(axis=1), placed[..., :2].max(axis=1)], 1)
+
+
+def _intersection(
+    a: "NDArray[np.float64]", b: "NDArray[np.float64]"
+) -> "NDArray[np.float64]":
+    """
+    Intersection areas of all boxes in `a` with all boxes in `b`
+    """
+    w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(
+        a[:, None, 0], b[None, :, 0]
+    )
+    h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(
+        a[:, None, 1], b[None, :, 1]
+    )
+    return np.clip(w, 0, None) * np.clip(h, 0, None)
+
+
+def _area(boxes: "NDArray[np.float64]") -> "NDArray[np.float64]":
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+# ----------------------------------------
+#               Optimizer
+# ----------------------------------------
+@dataclass
+class _Group:
+    """
+    Footprints placed by one tunable layout
+    """
+
+    fps: "NDArray[np.intp]"
+    # position of the parent of the placed node, the multiple of the layout
+    # vector and the footprint relative to the placed node
+    parent: "NDArray[np.float64]"
+    multiple: "NDArray[np.float64]"
+    offset: "NDArray[np.float64]"
+    # pads of all nets on the footprints, sorted by net
+    nets: "NDArray[np.intp]"
+    pads: "NDArray[np.intp]"
+    starts: "NDArray[np.intp]"
+
+    def place(self, params: "NDArray[np.float64]") -> "NDArray[np.float64]":
+        relative = compose(params[None, :3], self.multiple * params[None, 3:])
+        return compose(compose(self.parent, relative), self.offset)
+
+
+@dataclass
+class PlacementResult:
+    initial: dict[str, LayoutParams]
+    suggested: dict[str, LayoutParams]
+    wirelength: tuple[float, float]
+    overlap: tuple[float, float]
+
+    def to_markdown(self) -> str:
+        def fmt(values: tuple[float, ...]) -> str:
+            return "(" + ", ".join(f"{v:g}" for v in values) + ")"
+
+        lines = [
+            "# Suggested layout table",
+            "",
+            "Weighted HPWL: "
+            f"{self.wirelength[0]:.1f} mm -> {self.wirelength[1]:.1f} mm",
+            "Courtyard overlap: "
+            f"{self.overlap[0]:.2f} mm² -> {self.overlap[1]:.2f} mm²",
+            "",
+            "| Layout | Base (x, y, r) | Vector (x, y, r) |",
+            "| --- | --- | --- |",
+        ]
+        for key, params in self.suggested.items():
+            old = self.initial[key]
+            lines.append(
+                f"| {key} | {fmt(old.base)} -> {fmt(params.base)}"
+                f" | {fmt(old.vector)} -> {fmt(params.vector)} |"
+            )
+        lines += ["", "```python", "LAYOUT_TABLE = {"]
+        for key, params in self.suggested.items():
+            lines.append(
+                f'    "{key}": LayoutParams('
+                f"base={fmt(params.base)}, vector={fmt(params.vector)}),"
+            )
+        lines += ["}", "```", ""]
+        return "\n".join(lines)
+
+    def write(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.to_markdown(), encoding="utf-8")
+        logger.info(f"Wrote suggested layout table to {path}")
+
+
+class PlacementProblem:
+    def __init__(
+        self,
+        pcb: PCB,
+        groups: dict[str, tuple["NDArray[np.float64]", _Group]],
+        outline: list[tuple[float, float]] | None = None,
+        clearance: float = 0,
+        overlap_weight: float = 1000,
+    ):
+        """
+        `groups` maps the layout table keys to their params (base and vector as
+        six values) and footprints (indices into `Ratsnest.from_pcb(pcb)`)
+        """
+        self.ratsnest = Ratsnest.from_pcb(pcb)
+        self.keys = list(groups)
+        self.params = np.array([p for p, _ in groups.values()], dtype=np.float64)
+        self.groups = [g for _, g in groups.values()]
+        self.overlap_weight = overlap_weight
+
+        rs = self.ratsnest
+        self.weights = np.array([NET_WEIGHTS[c] for c in rs.classes])
+        for g in self.groups:
+            g.nets = np.unique(rs.pad_net[np.isin(rs.pad_fp, g.fps)])
+            g.pads = np.flatnonzero(np.isin(rs.pad_net, g.nets))
+            net_of = rs.pad_net[g.pads]
+            g.starts = np.flatnonzero(np.r_[True, net_of[1:] != net_of[:-1]])
+
+        # courtyards as boxes in the footprint frame, empty without courtyard
+        index = {ref: i for i, ref in enumerate(rs.footprints)}
+        self.local = np.zeros((len(rs.footprints), 4))
+        seen = set()
+        for item in get_items(pcb):
+            if item.kind != ItemKind.COURTYARD or item.owner not in index:
+                continue
+            i = index[item.owner]
+            points = np.array(item.polygon, dtype=np.float64)
+            points = relative(
+                np.broadcast_to(rs.fp_at[i], (len(points), 3)),
+                np.c_[points, np.zeros(len(points))],
+            )[:, :2]
+            box = np.r_[points.min(axis=0), points.max(axis=0)]
+            if i in seen:
+                box = np.r_[
+                    np.minimum(box[:2], self.local[i, :2]),
+                    np.maximum(box[2:], self.local[i, 2:]),
+                ]
+            seen.add(i)
+            self.local[i] = box + np.array([-1, -1, 1, 1]) * clearance / 2
+        self.side = np.array([fp.layer.startswith("B.") for fp in pcb.footprints])
+
+        if outline:
+            xs, ys = zip(*outline)
+            self.board = np.array([[min(xs), min(ys), max(xs), max(ys)]])
+        else:
+            self.board = None
+
+        # state
+        self.fp_at = rs.fp_at.copy()
+        for params, g in zip(self.params, self.groups):
+            self.fp_at[g.fps] = g.place(params)
+        self.boxes = _boxes(self.fp_at, self.local)
+        self.hpwl = rs.hpwl(rs.pad_positions(self.fp_at))
+
+    @classmethod
+    def from_app(cls, app: Module, pcb: PCB, **kwargs) -> "PlacementProblem":
+        """
+        Problem of the tunable layouts of an app after its layouts are applied
+        """
+        refs = [
+            fp.propertys["Reference"].value if "Reference" in fp.propertys else fp.name
+            for fp in pcb.footprints
+        ]
+        index = {ref: i for i, ref in enumerate(refs)}
+        layout = app.get_trait(F.has_pcb_layout)
+        assert isinstance(layout, F.has_pcb_layout_defined)
+        tunables = find_tunable_layouts(layout.layout)
+
+        groups: dict[str, tuple[NDArray[np.float64], _Group]] = {}
+        owner: dict[int, str] = {}
+        for tunable in tunables:
+            params = tunable.params
+            base, vector = np.array(params.base), np.array(params.vector)
+            fps, parent, multiple, offset = [], [], [], []
+            for node, mult in tunable.placed:
+                position = np.array(
+                    node.get_trait(F.has_pcb_position).get_position()[:3]
+                )
+                # undo the position of the node relative to its parent
+                in_parent = compose(base, np.array(mult) * vector)
+                parent_position = compose(position, relative(in_parent, np.zeros(3)))
+                modules = [node, *node.get_children(direct_only=False, types=Module)]
+                for module in modules:
+                    if not module.has_trait(
+                        PCB_Transformer.has_linked_kicad_footprint
+                    ) or not module.has_trait(F.has_pcb_position):
+                        continue
+                    fp = module.get_trait(PCB_Transformer.has_linked_kicad_footprint)
+                    ref = fp.get_fp().propertys["Reference"].value
+                    i = index[ref]
+                    if i in owner:
+                        if owner[i] == tunable.key:
+                            continue
+                        raise ValueError(
+                            f"{ref} is placed by the nested layouts {owner[i]}"
+                            f" and {tunable.key}"
+                        )
+                    owner[i] = tunable.key
+                    fps.append(i)
+                    parent.append(parent_position)
+                    multiple.append(mult)
+                    offset.append(
+                        relative(
+                            position,
+                            np.array(
+                                module.get_trait(F.has_pcb_position).get_position()[:3]
+                            ),
+                        )
+                    )
+            if not fps:
+                logger.warning(f"Layout {tunable.key} places no footprints")
+                continue
+            groups[tunable.key] = (
+                np.array([*params.base, *params.vector], dtype=np.float64),
+                _Group(
+                    fps=np.array(fps, dtype=np.intp),
+                    parent=np.array(parent, dtype=np.float64),
+                    multiple=np.array(multiple, dtype=np.float64),
+                    offset=np.array(offset, dtype=np.float64),
+                    nets=np.zeros(0, dtype=np.intp),
+                    pads=np.zeros(0, dtype=np.intp),
+                    starts=np.zeros(0, dtype=np.intp),
+                ),
+            )
+        return cls(pcb, groups, **kwargs)
+
+    # --------------------------------------------------------------------------
+    def _group_overlap(self, g: _Group, boxes: "NDArray[np.float64]") -> float:
+        """
+        Courtyard overlap and area outside the board of the footprints of `g` at
+        `boxes`, with the other footprints at their current boxes
+        """
+        side = self.side[g.fps]
+        others = _intersection(boxes, self.boxes) * (side[:, None] == self.side)
+        others[:, g.fps] = 0
+        inner = _intersection(boxes, boxes) * (side[:, None] == side)
+        np.fill_diagonal(inner, 0)
+        overlap = others.sum() + inner.sum() / 2
+        if self.board is not None:
+            overlap += (_area(boxes) - _intersection(boxes, self.board)[:, 0]).sum()
+        return float(overlap)
+
+    def overlap(self) -> float:
+        """
+        Courtyard overlap of all footprints and area outside the board of the
+        tunable footprints
+        """
+        inner = _intersection(self.boxes, self.boxes) * (
+            self.side[:, None] == self.side
+        )
+        np.fill_diagonal(inner, 0)
+        overlap = inner.sum() / 2
+        if self.board is not None:
+            for g in self.groups:
+                boxes = self.boxes[g.fps]
+                overlap += (_area(boxes) - _intersection(boxes, self.board)[:, 0]).sum()
+        return float(overlap)
+
+    def wirelength(self) -> float:
+        return float(self.weights @ self.hpwl)
+
+    def _try(self, k: int, params: "NDArray[np.float64]") -> tuple[float, tuple]:
+        """
+        Cost delta of moving group `k` to `params`, `fp_at` is left at the move
+        """
+        g = self.groups[k]
+        at = g.place(params)
+        old_at = self.fp_at[g.fps].copy()
+        self.fp_at[g.fps] = at
+
+        rs = self.ratsnest
+        hpwl = rs.hpwl(rs.pad_positions(self.fp_at, g.pads), g.starts)
+        boxes = _boxes(at, self.local[g.fps])
+        delta = float(self.weights[g.nets] @ (hpwl - self.hpwl[g.nets]))
+        delta += self.overlap_weight * (
+            self._group_overlap(g, boxes) - self._group_overlap(g, self.boxes[g.fps])
+        )
+        return delta, (old_at, hpwl, boxes)
+
+    def _move(self, rng: np.random.Generator, step: float) -> tuple[int, "NDArray"]:
+        k = int(rng.integers(len(self.groups)))
+        params = self.params[k].copy()
+        p = int(rng.integers(6))
+        if p in (2, 5):
+            params[p] = (params[p] + 90 * rng.integers(1, 4)) % 360
+        else:
+            params[p] = round((params[p] + rng.normal(0, step)) / GRID) * GRID
+        return k, params
+
+    def optimize(
+        self,
+        steps: int = 20000,
+        max_step: float = 3,
+        seed: int = 0,
+    ) -> PlacementResult:
+        rng = np.random.default_rng(seed)
+        initial = self.table()
+        start = (self.wirelength(), self.overlap())
+
+        # initial temperature from the median uphill move, overlapping moves
+        # are orders of magnitude more expensive
+        deltas = []
+        for _ in range(100):
+            k, params = self._move(rng, max_step)
+            delta, (old_at, *_) = self._try(k, params)
+            self.fp_at[self.groups[k].fps] = old_at
+            deltas.append(delta)
+        uphill = [d for d in deltas if d > 0]
+        t0 = float(np.median(uphill)) if uphill else 1.0
+        cooling = 1e-4 ** (1 / steps)
+
+        cost = 0.0
+        best, best_params = 0.0, self.params.copy()
+        temperature = t0
+        accepted = 0
+        for _ in range(steps):
+            step = max(GRID, max_step * math.sqrt(temperature / t0))
+            k, params = self._move(rng, step)
+            delta, (old_at, hpwl, boxes) = self._try(k, params)
+            g = self.groups[k]
+            if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                self.params[k] = params
+                self.hpwl[g.nets] = hpwl
+                self.boxes[g.fps] = boxes
+                cost += delta
+                accepted += 1
+                if cost < best - 1e-9:
+                    best, best_params = cost, self.params.copy()
+            else:
+                self.fp_at[g.fps] = old_at
+            temperature *= cooling
+
+        logger.info(
+            f"Placement: {accepted}/{steps} moves accepted,"
+            f" cost {best:+.1f} from the initial layout"
+        )
+
+        self.set_params(best_params)
+        return PlacementResult(
+            initial=initial,
+            suggested=self.table(),
+            wirelength=(start[0], self.wirelength()),
+            overlap=(start[1], self.overlap()),
+        )
+
+    def set_params(self, params: "NDArray[np.float64]"):
+        self.params = params.copy()
+        for p, g in zip(self.params, self.groups):
+            self.fp_at[g.fps] = g.place(p)
+        self.boxes = _boxes(self.fp_at, self.local)
+        rs = self.ratsnest
+        self.hpwl = rs.hpwl(rs.pad_positions(self.fp_at))
+
+    def table(self) -> dict[str, LayoutParams]:
+        def values(v: "NDArray[np.float64]") -> tuple[float, float, float]:
+            return tuple(round(float(x), 3) for x in v)  # type: ignore
+
+        return {
+            key: LayoutParams(base=values(p[:3]), vector=values(p[3:]))
+            for key, p in zip(self.keys, self.params)
+        }
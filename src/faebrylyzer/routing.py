@@ -0,0 +1,633 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Grid based autorouter.
+
+Rasterizes the copper of the placed board (pads, tracks, vias) and the board
+outline into NumPy occupancy grids, one cell per `RoutingRules.resolution`, and
+routes nets with A* on two layers with vias. Every cell of a grid holds the net
+that may use it (0: free, -1: blocked for all). Obstacles are inflated by the
+clearance plus half a trace (track grid) or half a via (via grid), so the search
+only has to check single cells.
+
+Multi-pad nets are connected as a tree: starting from one pad, the closest
+remaining pad is connected to everything routed so far.
+
+Nets that already have tracks or vias on the board are left to the manual routing.
+"""
+
+import heapq
+import logging
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Sequence
+
+import faebryk.library._F as F
+import numpy as np
+from faebryk.exporters.pcb.kicad.transformer import PCB_Transformer
+from faebryk.exporters.pcb.routing.util import (
+    DEFAULT_VIA_SIZE_DRILL,
+    Path,
+    Route,
+    get_pads_pos_of_mifs,
+)
+from faebryk.libs.kicad.fileformats import C_kicad_pcb_file
+from scipy import ndimage
+
+from faebrylyzer.drc import ItemKind, get_items
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+logger = logging.getLogger(__name__)
+
+PCB = C_kicad_pcb_file.C_kicad_pcb
+
+Point = tuple[float, float]
+
+FREE = 0
+BLOCKED = -1
+
+# (dx, dy, cost) of the moves on one layer
+MOVES = [
+    (1, 0, 10),
+    (-1, 0, 10),
+    (0, 1, 10),
+    (0, -1, 10),
+    (1, 1, 14),
+    (1, -1, 14),
+    (-1, 1, 14),
+    (-1, -1, 14),
+]
+
+
+@dataclass
+class RoutingRules:
+    resolution: float = 0.1
+    trace_width: float = 0.15
+    clearance: float = 0.15
+    via_size_drill: tuple[float, float] = DEFAULT_VIA_SIZE_DRILL
+    layers: tuple[str, ...] = ("F.Cu", "B.Cu")
+    # costs relative to a straight step of 10
+    via_cost: int = 200
+    turn_cost: int = 5
+    # > 1 trades the shortest route for a faster search
+    heuristic_weight: float = 1.5
+    max_expansions: int = 200_000
+
+
+class RoutingError(Exception): ...
+
+
+# ----------------------------------------
+#             Rasterization
+# ----------------------------------------
+def _segment_polygon(p0: Point, p1: Point, width: float) -> list[Point]:
+    (x0, y0), (x1, y1) = p0, p1
+    length = math.hypot(x1 - x0, y1 - y0)
+    if length == 0:
+        ux, uy = 1.0, 0.0
+    else:
+        ux, uy = (x1 - x0) / length, (y1 - y0) / length
+    # extend by half the width at both ends
+    hw = width / 2
+    ax, ay = x0 - ux * hw, y0 - uy * hw
+    bx, by = x1 + ux * hw, y1 + uy * hw
+    nx, ny = -uy * hw, ux * hw
+    return [
+        (ax + nx, ay + ny),
+        (bx + nx, by + ny),
+        (bx - nx, by - ny),
+        (ax - nx, ay - ny),
+    ]
+
+
+def _square(center: Point, size: float) -> list[Point]:
+    (x, y), h = center, size / 2
+    return [(x - h, y - h), (x + h, y - h), (x + h, y + h), (x - h, y + h)]
+
+
+class Grid:
+    """
+    Occupancy grid of the copper layers over the bounding box of the board
+    """
+
+    def __init__(
+        self, outline: Sequence[Point], resolution: float, layers: Sequence[str]
+    ):
+        xs, ys = zip(*outline)
+        self.origin = (min(xs), min(ys))
+        self.resolution = resolution
+        self.layers = list(layers)
+        self.width = math.ceil((max(xs) - min(xs)) / resolution) + 1
+        self.height = math.ceil((max(ys) - min(ys)) / resolution) + 1
+        self.cells: "NDArray[np.int32]" = np.zeros(
+            (len(self.layers), self.height, self.width), dtype=np.int32
+        )
+
+    @property
+    def plane(self) -> int:
+        return self.width * self.height
+
+    def to_cell(self, p: Point) -> tuple[int, int]:
+        return (
+            round((p[0] - self.origin[0]) / self.resolution),
+            round((p[1] - self.origin[1]) / self.resolution),
+        )
+
+    def to_point(self, x: int, y: int) -> Point:
+        return (
+            round(self.origin[0] + x * self.resolution, 4),
+            round(self.origin[1] + y * self.resolution, 4),
+        )
+
+    def polygon_cells(
+        self, polygon: Sequence[Point], margin: float = 0
+    ) -> tuple["NDArray[np.intp]", "NDArray[np.intp]"]:
+        """
+        (y, x) indices of all cells within `margin` of the convex `polygon`
+        """
+        pxs, pys = zip(*polygon)
+        x0, y0 = self.to_cell((min(pxs) - margin, min(pys) - margin))
+        x1, y1 = self.to_cell((max(pxs) + margin, max(pys) + margin))
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width - 1), min(y1, self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        gx = self.origin[0] + np.arange(x0, x1 + 1) * self.resolution
+        gy = self.origin[1] + np.arange(y0, y1 + 1) * self.resolution
+        X, Y = np.meshgrid(gx, gy)
+        inside = np.ones(X.shape, dtype=bool)
+
+        cx, cy = sum(pxs) / len(pxs), sum(pys) / len(pys)
+        for i in range(len(polygon)):
+            (ax, ay), (bx, by) = polygon[i - 1], polygon[i]
+            nx, ny = by - ay, ax - bx
+            norm = math.hypot(nx, ny)
+            if norm == 0:
+                continue
+            nx, ny = nx / norm, ny / norm
+            # normals point away from the center
+            if (cx - ax) * nx + (cy - ay) * ny > 0:
+                nx, ny = -nx, -ny
+            inside &= (X - ax) * nx + (Y - ay) * ny <= margin + 1e-9
+
+        ys, xs = np.nonzero(inside)
+        return ys + y0, xs + x0
+
+    def claim(
+        self,
+        polygon: Sequence[Point],
+        layers: Sequence[int],
+        net: int,
+        margin: float,
+    ):
+        """
+        Mark the cells around `polygon` as usable only by `net`
+        """
+        ys, xs = self.polygon_cells(polygon, margin)
+        for layer in layers:
+            cells = self.cells[layer, ys, xs]
+            self.cells[layer, ys, xs] = np.where(
+                (cells == FREE) | (cells == net), net, BLOCKED
+            )
+
+    def block_outside(self, outline: Sequence[Point], margin: float):
+        """
+        Block all cells closer than `margin` to the outside of `outline`
+        """
+        gx = self.origin[0] + np.arange(self.width) * self.resolution
+        gy = self.origin[1] + np.arange(self.height) * self.resolution
+        X, Y = np.meshgrid(gx, gy)
+
+        inside = np.zeros(X.shape, dtype=bool)
+        for i in range(len(outline)):
+            (ax, ay), (bx, by) = outline[i - 1], outline[i]
+            if ay == by:
+                continue
+            crosses = (ay > Y) != (by > Y)
+            inside ^= crosses & (X < ax + (Y - ay) * (bx - ax) / (by - ay))
+
+        outside = ~inside
+        for _ in range(math.ceil(margin / self.resolution)):
+            grown = outside.copy()
+            grown[1:, :] |= outside[:-1, :]
+            grown[:-1, :] |= outside[1:, :]
+            grown[:, 1:] |= outside[:, :-1]
+            grown[:, :-1] |= outside[:, 1:]
+            outside = grown
+
+        self.cells[:, outside] = BLOCKED
+
+
+# ----------------------------------------
+#                Router
+# ----------------------------------------
+@dataclass
+class _Pad:
+    name: str
+    layers: list[int]
+    polygon: Sequence[Point]
+
+
+class GridRouter:
+    def __init__(
+        self,
+        pcb: PCB,
+        outline: Sequence[Point],
+        rules: RoutingRules | None = None,
+    ):
+        self.rules = rules = rules or RoutingRules()
+        self.layer_ids = {name: i for i, name in enumerate(rules.layers)}
+        self.track_margin = rules.clearance + rules.trace_width / 2
+        self.via_margin = rules.clearance + rules.via_size_drill[0] / 2
+
+        # cells usable by the center of a track / via of a net
+        self.tracks = Grid(outline, rules.resolution, rules.layers)
+        self.vias = Grid(outline, rules.resolution, rules.layers)
+
+        self.pads: dict[int, list[_Pad]] = {}
+        pad_items: dict[tuple[str, str, int | None], _Pad] = {}
+        for item in get_items(pcb):
+            if item.kind != ItemKind.PAD or item.layer not in self.layer_ids:
+                continue
+            net = item.net if item.net is not None else BLOCKED
+            self._claim(item.polygon, [self.layer_ids[item.layer]], net)
+            if item.net is None:
+                continue
+            key = (item.owner or "", item.name, item.net)
+            if key not in pad_items:
+                pad_items[key] = _Pad(f"{item.owner}:{item.name}", [], item.polygon)
+                self.pads.setdefault(item.net, []).append(pad_items[key])
+            pad_items[key].layers.append(self.layer_ids[item.layer])
+
+        self.routed_nets: set[int] = set()
+        for segment in [*pcb.segments, *pcb.arcs]:
+            if segment.layer in self.layer_ids:
+                self._claim(
+                    _segment_polygon(
+                        (segment.start.x, segment.start.y),
+                        (segment.end.x, segment.end.y),
+                        segment.width,
+                    ),
+                    [self.layer_ids[segment.layer]],
+                    segment.net,
+                )
+            self.routed_nets.add(segment.net)
+        for via in pcb.vias:
+            self._claim(
+                _square((via.at.x, via.at.y), via.size),
+                list(self.layer_ids.values()),
+                via.net,
+            )
+            self.routed_nets.add(via.net)
+
+        self.tracks.block_outside(outline, self.track_margin)
+        self.vias.block_outside(outline, self.via_margin)
+
+    def _claim(self, polygon: Sequence[Point], layers: list[int], net: int):
+        # copper without net connects to nothing
+        net = net or BLOCKED
+        self.tracks.claim(polygon, layers, net, self.track_margin)
+        self.vias.claim(polygon, layers, net, self.via_margin)
+
+    # --------------------------------------------------------------------------
+    def _pad_cells(self, pad: _Pad, net: int) -> set[int]:
+        grid = self.tracks
+        ys, xs = grid.polygon_cells(pad.polygon)
+        cells = set()
+        for layer in pad.layers:
+            free = grid.cells[layer, ys, xs]
+            ok = (free == FREE) | (free == net)
+            cells |= set((layer * grid.plane + ys[ok] * grid.width + xs[ok]).tolist())
+        return cells
+
+    def _usable(self, net: int) -> tuple["NDArray[np.bool_]", "NDArray[np.bool_]"]:
+        """
+        Cells a track of `net` may use, and (x, y) positions it may place a via at
+        """
+        tracks, vias = self.tracks.cells, self.vias.cells
+        usable = (tracks == FREE) | (tracks == net)
+        via_usable = np.all((vias == FREE) | (vias == net), axis=0)
+        return usable, via_usable
+
+    @staticmethod
+    def _connected(
+        usable: "NDArray[np.bool_]",
+        via_usable: "NDArray[np.bool_]",
+        sources: set[int],
+        targets: set[int],
+    ) -> bool:
+        """
+        Whether any target can be reached from the sources at all
+        """
+        labels = np.zeros(usable.shape, dtype=np.int64)
+        offset = 0
+        for layer in range(usable.shape[0]):
+            # 4-connected, diagonal moves need both orthogonal cells free anyway
+            layer_labels, n = ndimage.label(usable[layer])
+            labels[layer] = np.where(layer_labels > 0, layer_labels + offset, 0)
+            offset += n
+
+        parent = list(range(offset + 1))
+
+        def find(a: int) -> int:
+            while parent[a] != a:
+                parent[a] = parent[parent[a]]
+                a = parent[a]
+            return a
+
+        # vias connect the components of all layers at their position
+        via_labels = labels[:, via_usable]
+        for layer in range(1, usable.shape[0]):
+            pairs = np.unique(via_labels[0] * (offset + 1) + via_labels[layer])
+            for first, other in zip(*np.divmod(pairs, offset + 1)):
+                if first and other:
+                    parent[find(int(other))] = find(int(first))
+
+        flat = labels.reshape(-1)
+        source_components = {find(int(flat[c])) for c in sources}
+        return any(find(int(flat[c])) in source_components for c in targets)
+
+    def _search(
+        self, net: int, sources: set[int], targets: set[int]
+    ) -> list[int] | None:
+        """
+        A* from any of `sources` to any of `targets`, returns the cell path
+        """
+        rules = self.rules
+        W, H, plane = self.tracks.width, self.tracks.height, self.tracks.plane
+        n_layers = len(rules.layers)
+
+        usable_grid, via_grid = self._usable(net)
+        if not self._connected(usable_grid, via_grid, sources, targets):
+            return None
+        usable = usable_grid.reshape(-1).tolist()
+        via_usable = via_grid.reshape(-1).tolist()
+
+        target_xy = [((t % plane) % W, (t % plane) // W) for t in targets]
+        tx0, tx1 = min(x for x, _ in target_xy), max(x for x, _ in target_xy)
+        ty0, ty1 = min(y for _, y in target_xy), max(y for _, y in target_xy)
+
+        def heuristic(x: int, y: int) -> int:
+            dx = tx0 - x if x < tx0 else x - tx1 if x > tx1 else 0
+            dy = ty0 - y if y < ty0 else y - ty1 if y > ty1 else 0
+            return weight * (10 * dx + 4 * dy if dx > dy else 10 * dy + 4 * dx)
+
+        moves = [
+            (move, dx, dy, dy * W + dx, step)
+            for move, (dx, dy, step) in enumerate(MOVES)
+        ]
+        turn_cost, via_cost = rules.turn_cost, rules.via_cost
+        weight = rules.heuristic_weight
+
+        g: dict[int, int] = {}
+        came: dict[int, int] = {}
+        came_move: dict[int, int] = {}
+        heap: list[tuple[int, int, int]] = []
+        for s in sources:
+            g[s] = 0
+            x, y = (s % plane) % W, (s % plane) // W
+            heapq.heappush(heap, (heuristic(x, y), 0, s))
+
+        expansions = 0
+        while heap:
+            _, cost, cell = heapq.heappop(heap)
+            if cost > g[cell]:
+                continue
+            if cell in targets:
+                path = [cell]
+                while path[-1] in came:
+                    path.append(came[path[-1]])
+                return path[::-1]
+
+            expansions += 1
+            if expansions > rules.max_expansions:
+                return None
+
+            layer, rest = divmod(cell, plane)
+            y, x = divmod(rest, W)
+            last_move = came_move.get(cell)
+
+            for move, dx, dy, offset, step in moves:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < W and 0 <= ny < H):
+                    continue
+                nxt = cell + offset
+                if not usable[nxt]:
+                    continue
+                # no diagonals past the corner of an obstacle
+                if dx and dy and not (usable[cell + dx] and usable[cell + dy * W]):
+                    continue
+                new = cost + step
+                if last_move is not None and last_move != move:
+                    new += turn_cost
+                if new < g.get(nxt, new + 1):
+                    g[nxt] = new
+                    came[nxt] = cell
+                    came_move[nxt] = move
+                    heapq.heappush(heap, (new + heuristic(nx, ny), new, nxt))
+
+            # via to the other layers
+            if via_usable[rest]:
+                h = heuristic(x, y)
+                for other in range(n_layers):
+                    if other == layer:
+                        continue
+                    nxt = other * plane + rest
+                    new = cost + via_cost
+                    if new < g.get(nxt, new + 1):
+                        g[nxt] = new
+                        came[nxt] = cell
+                        came_move.pop(nxt, None)
+                        heapq.heappush(heap, (new + h, new, nxt))
+
+        return None
+
+    def _to_path(self, cells: list[int], net: int) -> Path:
+        """
+        Convert a cell path to tracks and vias, and claim their copper for `net`
+        """
+        rules = self.rules
+        W, plane = self.tracks.width, self.tracks.plane
+        path = Path()
+
+        def flush(run: list[tuple[int, int]], layer: int):
+            # keep only the corners
+            points = [run[0]]
+            for prev, cur, nxt in zip(run, run[1:], run[2:]):
+                if (cur[0] - prev[0], cur[1] - prev[1]) != (
+                    nxt[0] - cur[0],
+                    nxt[1] - cur[1],
+                ):
+                    points.append(cur)
+            if len(run) > 1:
+                points.append(run[-1])
+            if len(points) < 2:
+                return
+            coords = [self.tracks.to_point(x, y) for x, y in points]
+            path.add(
+                Path.Track(
+                    width=rules.trace_width,
+                    layer=rules.layers[layer],
+                    points=[(x, y, 0, 0) for x, y in coords],
+                )
+            )
+            for a, b in zip(coords, coords[1:]):
+                self._claim(_segment_polygon(a, b, rules.trace_width), [layer], net)
+
+        run: list[tuple[int, int]] = []
+        run_layer = cells[0] // plane
+        for cell in cells:
+            layer, rest = divmod(cell, plane)
+            xy = (rest % W, rest // W)
+            if layer != run_layer:
+                flush(run, run_layer)
+                center = self.tracks.to_point(*xy)
+                path.add(Path.Via(pos=(*center, 0, 0), size_drill=rules.via_size_drill))
+                self._claim(
+                    _square(center, rules.via_size_drill[0]),
+                    list(range(len(rules.layers))),
+                    net,
+                )
+                run, run_layer = [], layer
+            run.append(xy)
+        flush(run, run_layer)
+
+        return path
+
+    def route_net(self, net: int) -> Path | None:
+        """
+        Connect all pads of `net`, returns None if there is nothing to route
+        """
+        pads = self.pads.get(net, [])
+        if len(pads) < 2:
+            return None
+
+        pad_cells = {pad.name: self._pad_cells(pad, net) for pad in pads}
+        for name, cells in pad_cells.items():
+            if not cells:
+                raise RoutingError(f"Pad {name} of net {net} is not reachable")
+
+        first, *remaining = pads
+        tree = set(pad_cells[first.name])
+        path = Path()
+
+        while remaining:
+            targets = {cell: pad for pad in remaining for cell in pad_cells[pad.name]}
+            cells = self._search(net, tree, set(targets))
+            if cells is None:
+                raise RoutingError(
+                    f"No route for net {net} to {', '.join(p.name for p in remaining)}"
+                )
+            reached = targets[cells[-1]]
+            remaining.remove(reached)
+            path += self._to_path(cells, net)
+            tree |= set(cells) | pad_cells[reached.name]
+
+        return path
+
+    def net_length(self, net: int) -> float:
+        """
+        Half perimeter of the bounding box of the pads of `net`
+        """
+        points = [p for pad in self.pads.get(net, []) for p in pad.polygon]
+        if not points:
+            return 0
+        xs, ys = zip(*points)
+        return max(xs) - min(xs) + max(ys) - min(ys)
+
+    def route(
+        self, nets: Sequence[int], passes: int = 4
+    ) -> tuple[dict[int, Path], dict[int, RoutingError]]:
+        """
+        Route `nets`, short ones first.
+
+        If nets fail, they are routed first in another pass from a clean grid.
+        The pass routing the most nets is kept.
+        """
+        base = self.tracks.cells.copy(), self.vias.cells.copy()
+        order = sorted(nets, key=lambda n: (self.net_length(n), n))
+        best: tuple[dict[int, Path], dict[int, RoutingError], tuple] | None = None
+
+        for i in range(passes):
+            self.tracks.cells[:], self.vias.cells[:] = base
+            paths: dict[int, Path] = {}
+            failed: dict[int, RoutingError] = {}
+            for net in order:
+                try:
+                    path = self.route_net(net)
+                except RoutingError as e:
+                    failed[net] = e
+                    continue
+                if path is not None:
+                    paths[net] = path
+
+            if best is None or len(failed) < len(best[1]):
+                best = paths, failed, (self.tracks.cells.copy(), self.vias.cells.copy())
+            if not failed:
+                break
+            logger.debug(f"Routing pass {i} failed for {len(failed)} nets")
+            order = [*failed, *(n for n in order if n not in failed)]
+
+        assert best is not None
+        paths, failed, (self.tracks.cells[:], self.vias.cells[:]) = best
+        return paths, failed
+
+
+# ----------------------------------------
+#            Routing strategy
+# ----------------------------------------
+class has_pcb_routing_strategy_grid(F.has_pcb_routing_strategy.impl()):
+    """
+    Routes `nets` with the `GridRouter` once the footprints are placed
+    """
+
+    def __init__(
+        self,
+        nets: Sequence[F.Net],
+        outline: Sequence[Point],
+        rules: RoutingRules | None = None,
+    ):
+        super().__init__()
+        self.nets = nets
+        self.outline = outline
+        self.rules = rules
+
+    def calculate(self, transformer: PCB_Transformer) -> list[Route]:
+        router = GridRouter(transformer.pcb, self.outline, self.rules)
+
+        pcb_nets = {net: transformer.get_net(net) for net in self.nets}
+        names = {pcb_net.number: pcb_net.name for pcb_net in pcb_nets.values()}
+        manual = [
+            n for n, pcb_net in pcb_nets.items() if pcb_net.number in router.routed_nets
+        ]
+        if manual:
+            logger.info(f"Not routing {len(manual)} nets with manual tracks")
+
+        paths, failed = router.route(
+            [pcb_nets[n].number for n in self.nets if n not in manual]
+        )
+        for net, error in failed.items():
+            logger.warning(f"Could not route {names[net]}: {error}")
+
+        routes = []
+        for net, pcb_net in pcb_nets.items():
+            if pcb_net.number not in paths:
+                continue
+            mifs = [
+                mif
+                for mif in net.part_of.get_connected()
+                if isinstance(mif, F.Electrical)
+            ]
+            routes.append(
+                Route(
+                    pads=get_pads_pos_of_mifs(mifs).keys(),
+                    path=paths[pcb_net.number],
+                )
+            )
+
+        logger.info(f"Routed {len(routes)} nets, {len(failed)} failed")
+        return routes
@@ -0,0 +1,590 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Local build server, for integrating faebrylyzer into other tools (e.g. the
+factory test rig) without paying the import cost per build.
+
+Builds are submitted as jobs over HTTP on localhost, queued, and run by a pool
+of worker processes. The workers are forked from the server after faebryk and
+the app are imported, so a job starts with warm modules. A worker that dies
+(e.g. a segfault in a native library) fails its job and is replaced. Every job
+builds into its own `BuildPaths.isolated` output root, the parts lock, libs and
+caches are shared. Jobs that pick other parts than a regular build (with
+`parameters` or `update_parts`) start from a copy of the parts lock and leave
+the shared one alone. Progress is streamed back as newline delimited JSON events:
+
+    {"job": "3f2a...", "event": "queued"}
+    {"job": "3f2a...", "event": "started", "worker": 1}
+    {"job": "3f2a...", "event": "stage", "stage": "pick", "seconds": 4.2}
+    {"job": "3f2a...", "event": "done", "artifacts": [...], "timings": {...}}
+    {"job": "3f2a...", "event": "failed", "error": "..."}
+
+Endpoints:
+    POST /jobs              JobOptions as JSON, returns {"job": id}, e.g.
+                            {"export_visuals": true, "parameters": {
+                                "ldo.output_current": {"type": "Constant",
+                                "value": {"magnitude": 0.5, "units": "ampere"}}}}
+    GET  /jobs              status of all jobs
+    GET  /jobs/<id>/events  events of a job, streamed until it has finished
+
+Usage:
+    python -m faebrylyzer.server serve --workers 2
+    python -m faebrylyzer.server submit --export-manufacturing-artifacts
+    python -m faebrylyzer.server submit \
+        --parameter 'ldo.output_current={"type": "Constant", ...}'
+
+    client = BuildClient()
+    for event in client.build(export_visuals=True):
+        print(event)
+"""
+
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import threading
+import traceback
+import urllib.request
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import typer
+from faebryk.core.module import Module
+from faebryk.core.parameter import Parameter
+from faebryk.libs.logging import setup_basic_logging
+from typing_extensions import Annotated
+
+from faebrylyzer.app import faebrylyzerApp
+from faebrylyzer.artifact_cache import ArtifactCache
+from faebrylyzer.main import BuildPaths, StageTimer, build
+from faebrylyzer.parts_lock import deserialize_param, get_path
+from faebrylyzer.pick_search import PickBudget
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_ROOT = Path("./build/server")
+
+Event = dict[str, Any]
+# last event of a job
+FINISHED = ("done", "failed")
+
+
+@dataclass(frozen=True)
+class JobOptions:
+    """
+    Overrides of the build options, the defaults are the ones of the CLI
+
+    `parameters` are constraints (in the format of the parts lock, see
+    `parts_lock.serialize_param`) merged into the parameters of the app by their
+    path, e.g. "ldo.output_current". They narrow what the app sets, a
+    constraint the app contradicts fails the pick.
+    """
+
+    export_manufacturing_artifacts: bool = False
+    export_esphome_config: bool = False
+    export_visuals: bool = False
+    export_parameters: bool = False
+    optimize_placement: bool = False
+    export_test_vectors: bool = False
+    parts_shard: bool = True
+    update_parts: bool = False
+    jlcpcb_fallback: bool = False
+    bounded_pick: bool = False
+    pick_timeout: float = 300
+    pick_max_evaluations: int = 20000
+    parameters: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    @property
+    def own_parts_lock(self) -> bool:
+        """
+        Picks differ from the ones of a regular build, they must not end up in
+        the shared parts lock
+        """
+        return self.update_parts or bool(self.parameters)
+
+    @classmethod
+    def from_dict(cls, options: dict[str, Any]) -> "JobOptions":
+        types = {f.name: f.type for f in fields(cls)}
+        unknown = options.keys() - types.keys()
+        if unknown:
+            raise ValueError(f"Unknown build options: {', '.join(sorted(unknown))}")
+        parameters = options.get("parameters", {})
+        if not isinstance(parameters, dict):
+            raise ValueError("Build option parameters must be an object")
+        for name, constraint in parameters.items():
+            try:
+                deserialize_param(constraint)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(
+                    f"Invalid constraint of parameter {name}: {e!r}"
+                ) from e
+        # json has no int/float distinction, and bools are ints in python
+        accepted = {bool: (bool,), int: (int,), float: (int, float)}
+        for name, value in options.items():
+            if name == "parameters":
+                continue
+            t = types[name]
+            if not isinstance(value, accepted[t]) or (
+                t is not bool and isinstance(value, bool)
+            ):
+                raise ValueError(f"Build option {name} must be a {t.__name__}")
+        return cls(**options)
+
+
+# ----------------------------------------
+#               Worker
+# ----------------------------------------
+@dataclass
+class ConstrainedApp:
+    """
+    App factory merging `parameters` (constraints by parameter path, see
+    `JobOptions`) into the app of `app_factory`, its repr keys the artifact cache
+    """
+
+    parameters: dict[str, dict[str, Any]]
+    app_factory: Callable[[], Module] = faebrylyzerApp
+
+    def __call__(self) -> Module:
+        app = self.app_factory()
+        params = {
+            get_path(p): p for p in app.get_children(direct_only=False, types=Parameter)
+        }
+        unknown = self.parameters.keys() - params.keys()
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        for name, constraint in sorted(self.parameters.items()):
+            params[name].merge(deserialize_param(constraint))
+        return app
+
+
+class _ReportingStageTimer(StageTimer):
+    def __init__(self, report: Callable[[str, float], None]):
+        super().__init__()
+        self.report = report
+
+    @contextmanager
+    def __call__(self, name: str):
+        with super().__call__(name):
+            yield
+        self.report(name, self.timings[name])
+
+
+def run_job(
+    job_id: str,
+    options: JobOptions,
+    root: Path,
+    cache_dir: Path | None,
+    emit: Callable[[Event], None],
+):
+    """
+    Build `options` into `root/<job_id>`, emitting stage and result events
+    """
+    paths = BuildPaths.isolated(
+        root.joinpath(job_id), own_parts_lock=options.own_parts_lock
+    )
+    stage = _ReportingStageTimer(
+        lambda name, seconds: emit(
+            {"job": job_id, "event": "stage", "stage": name, "seconds": seconds}
+        )
+    )
+    try:
+        build(
+            paths,
+            export_manufacturing_artifacts=options.export_manufacturing_artifacts,
+            export_esphome_config=options.export_esphome_config,
+            export_visuals=options.export_visuals,
+            export_parameters=options.export_parameters,
+            optimize_placement=options.optimize_placement,
+            export_test_vectors=options.export_test_vectors,
+            app_factory=(
+                ConstrainedApp(options.parameters)
+                if options.parameters
+                else faebrylyzerApp
+            ),
+            parts_shard=options.parts_shard,
+            update_parts=options.update_parts,
+            jlcpcb_fallback=options.jlcpcb_fallback,
+            pick_budget=(
+                PickBudget(
+                    max_evaluations=options.pick_max_evaluations,
+                    max_seconds=options.pick_timeout,
+                )
+                if options.bounded_pick
+                else None
+            ),
+            stage=stage,
+            cache=ArtifactCache(cache_dir) if cache_dir else None,
+        )
+    except BaseException as e:
+        # also SystemExit from deep inside a build, the worker keeps serving
+        logger.error(f"Job {job_id} failed:\n{traceback.format_exc()}")
+        emit({"job": job_id, "event": "failed", "error": f"{type(e).__name__}: {e}"})
+        if isinstance(e, KeyboardInterrupt):
+            raise
+        return
+    emit(
+        {
+            "job": job_id,
+            "event": "done",
+            "artifacts": [str(p.absolute()) for p in paths.artifacts()],
+            "timings": stage.timings,
+        }
+    )
+
+
+def _worker(conn: Connection, root: Path, cache_dir: Path | None):
+    """
+    Run the jobs received on `conn` until None, sending back their events
+    """
+    while (job := conn.recv()) is not None:
+        job_id, options = job
+        run_job(job_id, options, root, cache_dir, conn.send)
+
+
+# ----------------------------------------
+#               Server
+# ----------------------------------------
+@dataclass
+class Job:
+    id: str
+    options: JobOptions
+    events: list[Event] = field(default_factory=list)
+
+    @property
+    def status(self) -> str:
+        return self.events[-1]["event"] if self.events else "queued"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+
+@dataclass
+class _Worker:
+    index: int
+    process: BaseProcess
+    # jobs to, events from the worker
+    conn: Connection
+    # id of the job it is running
+    job: str | None = None
+
+
+class BuildServer:
+    def __init__(
+        self,
+        workers: int = 1,
+        root: Path = DEFAULT_ROOT,
+        cache_dir: Path | None = None,
+    ):
+        self.root = root
+        self.cache_dir = cache_dir
+        self.jobs: dict[str, Job] = {}
+        self._changed = threading.Condition()
+        self._pending: deque[str] = deque()
+        self._closing = False
+
+        # fork, so the workers inherit the imported modules
+        self._ctx = multiprocessing.get_context("fork")
+        self._workers = [self._spawn(i) for i in range(workers)]
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def _spawn(self, index: int) -> _Worker:
+        conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker, args=(child_conn, self.root, self.cache_dir), daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(index, process, conn)
+
+    def _assign(self):
+        """
+        Hand pending jobs to idle workers, with `_changed` held
+        """
+        for worker in self._workers:
+            if not self._pending:
+                return
+            if worker.job is not None or not worker.process.is_alive():
+                continue
+            job = self.jobs[self._pending.popleft()]
+            worker.job = job.id
+            self._add_event({"job": job.id, "event": "started", "worker": worker.index})
+            try:
+                worker.conn.send((job.id, job.options))
+            except OSError:
+                # died in the meantime, the dispatcher fails the job
+                pass
+
+    def _receive(self, worker: _Worker):
+        while worker.conn.poll():
+            try:
+                event = worker.conn.recv()
+            except (EOFError, OSError):
+                return
+            self._add_event(event)
+            if event["event"] in FINISHED:
+                worker.job = None
+
+    def _dispatch(self):
+        """
+        Forward the events of the workers, fail the job of a worker that died
+        (e.g. segfault) and replace the worker
+        """
+        while True:
+            with self._changed:
+                workers = list(self._workers)
+            ready = multiprocessing.connection.wait(
+                [w.conn for w in workers] + [w.process.sentinel for w in workers]
+            )
+            with self._changed:
+                if self._closing:
+                    return
+                for worker in workers:
+                    self._receive(worker)
+                    if worker.process.sentinel not in ready:
+                        continue
+                    worker.process.join()
+                    exitcode = worker.process.exitcode
+                    logger.error(f"Worker {worker.index} died, exit code {exitcode}")
+                    if worker.job is not None:
+                        self._add_event(
+                            {
+                                "job": worker.job,
+                                "event": "failed",
+                                "error": f"Worker died with exit code {exitcode}",
+                            }
+                        )
+                    worker.conn.close()
+                    # forked from this thread, the worker only uses its end of the
+                    # pipe, none of the locks of the server threads
+                    self._workers[worker.index] = self._spawn(worker.index)
+                self._assign()
+
+    def _add_event(self, event: Event):
+        with self._changed:
+            self.jobs[event["job"]].events.append(event)
+            self._changed.notify_all()
+
+    def submit(self, options: JobOptions) -> str:
+        job = Job(id=uuid.uuid4().hex[:12], options=options)
+        with self._changed:
+            self.jobs[job.id] = job
+            self._add_event({"job": job.id, "event": "queued"})
+            self._pending.append(job.id)
+            self._assign()
+        logger.info(f"Queued job {job.id}: {options}")
+        return job.id
+
+    def events(self, job_id: str) -> Iterator[Event]:
+        """
+        All events of a job, blocks for new ones until the job has finished
+        """
+        job = self.jobs[job_id]
+        seen = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: len(job.events) > seen)
+                new = job.events[seen:]
+            seen += len(new)
+            yield from new
+            if new[-1]["event"] in FINISHED:
+                return
+
+    def status(self) -> list[Event]:
+        with self._changed:
+            return [
+                {"job": job.id, "status": job.status, "options": asdict(job.options)}
+                for job in self.jobs.values()
+            ]
+
+    def close(self):
+        with self._changed:
+            self._closing = True
+            workers = list(self._workers)
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=1)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        server = ThreadingHTTPServer((host, port), _handler(self))
+        logger.info(
+            f"Serving builds on http://{host}:{server.server_port}"
+            f" with {len(self._workers)} workers"
+        )
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            self.close()
+
+
+def _handler(build_server: BuildServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: HTTPStatus, body: Any):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if self.path != "/jobs":
+                self._send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                options = JobOptions.from_dict(
+                    json.loads(self.rfile.read(length) or b"{}")
+                )
+            except (ValueError, TypeError) as e:
+                self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+                return
+            job_id = build_server.submit(options)
+            self._send_json(HTTPStatus.ACCEPTED, {"job": job_id})
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if parts == ["jobs"]:
+                self._send_json(HTTPStatus.OK, build_server.status())
+                return
+            if (
+                len(parts) != 3
+                or parts[0] != "jobs"
+                or parts[2] != "events"
+                or parts[1] not in build_server.jobs
+            ):
+                self._send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+                return
+
+            # no content length, the stream ends with the connection
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for event in build_server.events(parts[1]):
+                self.wfile.write(json.dumps(event).encode() + b"\n")
+                self.wfile.flush()
+
+        def log_message(self, format: str, *args: Any):
+            logger.debug(format % args)
+
+    return Handler
+
+
+# ----------------------------------------
+#               Client
+# ----------------------------------------
+class BuildClient:
+    def __init__(self, url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"):
+        self.url = url.rstrip("/")
+
+    def submit(self, **options: Any) -> str:
+        """
+        Queue a build with `JobOptions` overrides, returns the job id
+        """
+        request = urllib.request.Request(
+            f"{self.url}/jobs",
+            data=json.dumps(options).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)["job"]
+
+    def events(self, job_id: str) -> Iterator[Event]:
+        with urllib.request.urlopen(f"{self.url}/jobs/{job_id}/events") as response:
+            for line in response:
+                yield json.loads(line)
+
+    def status(self) -> list[Event]:
+        with urllib.request.urlopen(f"{self.url}/jobs") as response:
+            return json.load(response)
+
+    def build(self, **options: Any) -> Iterator[Event]:
+        """
+        Submit a build and stream its events, the last one is `done` or `failed`
+        """
+        yield from self.events(self.submit(**options))
+
+
+# ----------------------------------------
+#               CLI
+# ----------------------------------------
+cli = typer.Typer()
+
+UrlOption = Annotated[str, typer.Option(help="URL of the build server")]
+
+
+@cli.command()
+def serve(
+    workers: Annotated[int, typer.Option(help="Builds running in parallel")] = 1,
+    host: Annotated[str, typer.Option()] = DEFAULT_HOST,
+    port: Annotated[int, typer.Option()] = DEFAULT_PORT,
+    root: Annotated[
+        Path, typer.Option(help="Jobs build into a directory per job below this")
+    ] = DEFAULT_ROOT,
+    cache_dir: Annotated[
+        Path | None,
+        typer.Option(
+            help="Artifact cache shared by the jobs", envvar="FAEBRYLYZER_CACHE_DIR"
+        ),
+    ] = None,
+):
+    BuildServer(workers=workers, root=root, cache_dir=cache_dir).serve(host, port)
+
+
+@cli.command()
+def submit(
+    url: UrlOption = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+    export_manufacturing_artifacts: bool = False,
+    export_esphome_config: bool = False,
+    export_visuals: bool = False,
+    export_parameters: bool = False,
+    export_test_vectors: bool = False,
+    parameter: Annotated[
+        list[str] | None,
+        typer.Option(help="Parameter constraint as <path>=<json>, repeatable"),
+    ] = None,
+):
+    """
+    Submit a build and print its events
+    """
+    parameters = {}
+    for p in parameter or []:
+        name, _, constraint = p.partition("=")
+        parameters[name] = json.loads(constraint)
+
+    event: Event = {}
+    for event in BuildClient(url).build(
+        export_manufacturing_artifacts=export_manufacturing_artifacts,
+        export_esphome_config=export_esphome_config,
+        export_visuals=export_visuals,
+        export_parameters=export_parameters,
+        export_test_vectors=export_test_vectors,
+        parameters=parameters,
+    ):
+        print(json.dumps(event))
+    if event.get("event") != "done":
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    setup_basic_logging()
+    cli()
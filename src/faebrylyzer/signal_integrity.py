@@ -0,0 +1,255 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Signal integrity of the logic channel inputs.
+
+Every channel runs from the connector through a series resistor (input array),
+with a pull-up (pull-up array), into the SNx4LVC541A buffer, and from the buffer
+output through another series resistor (mcu array) into a PB pin of the
+CBM9002A. Both nodes are modelled as first order RC low passes:
+
+    t_r = 2.2 * R * C                          10-90 % rise time of a node
+    t_r = sqrt(t_source² + t_in² + t_buffer² + t_out²)   whole channel
+    bandwidth = 0.35 / t_r
+    max sample rate = 1 / t_r                  a sample period per settled level
+
+Resistances are the resolved parameters of the app (the picked values, or the
+design ranges before picking), capacitances are typical datasheet values. The
+Monte Carlo sweep draws every resistor and capacitance uniformly within its
+tolerance, for all channels and samples at once.
+
+Usage:
+    python -m faebrylyzer.signal_integrity --samples 100000
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import faebryk.library._F as F
+import numpy as np
+import typer
+from faebryk.core.parameter import Parameter
+from faebryk.libs.logging import setup_basic_logging
+from faebryk.libs.units import P
+from typing_extensions import Annotated
+
+from faebrylyzer.app import faebrylyzerApp
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+logger = logging.getLogger(__name__)
+
+# 10-90 % rise time of a RC low pass in units of RC
+RISE_TIME_RC = 2.2
+# bandwidth * rise time of a first order system
+BANDWIDTH_RISE_TIME = 0.35
+
+# sample rates offered by fx2lafw [Hz]
+FX2LAFW_SAMPLE_RATES = [
+    *(k * 1e3 for k in (20, 25, 50, 100, 200, 250, 500)),
+    *(m * 1e6 for m in (1, 2, 3, 4, 6, 8, 12, 16, 24)),
+]
+
+
+@dataclass(frozen=True)
+class ChannelModel:
+    """
+    Typical values of everything but the resistor arrays [Ohm, F, s]
+    """
+
+    # driver of the measured signal
+    source_resistance: float = 50
+    source_rise_time: float = 0
+    # connector, trace and pad capacitance of each node
+    trace_capacitance: float = 2e-12
+    # SNx4LVC541A: input capacitance Ci, output resistance and transition time
+    buffer_capacitance: float = 4e-12
+    buffer_resistance: float = 25
+    buffer_rise_time: float = 1.5e-9
+    # CBM9002A (FX2) input pin capacitance
+    mcu_capacitance: float = 10e-12
+    # relative tolerance of all capacitances
+    capacitance_tolerance: float = 0.2
+
+
+# ----------------------------------------
+#               Parameters
+# ----------------------------------------
+def resistance_bounds(param: Parameter, tolerance: float) -> tuple[float, float]:
+    """
+    Lower and upper bound of a resolved resistance in Ohm
+
+    Picked parts resolve to a constant, their tolerance is not part of the
+    parameter, `tolerance` is used for them.
+    """
+    param = param.get_most_narrow()
+    if isinstance(param, F.Constant):
+        value = P.Quantity(param.value).to(P.ohm).magnitude
+        return value * (1 - tolerance), value * (1 + tolerance)
+    if isinstance(param, F.Range):
+        lo, hi = (
+            P.Quantity(b.get_most_narrow().value).to(P.ohm).magnitude
+            for b in (param.min, param.max)
+        )
+        return lo, hi
+    raise ValueError(f"Resistance {param!r} is not resolved")
+
+
+def channel_resistances(
+    app: faebrylyzerApp, tolerance: float = 0.05
+) -> dict[str, "NDArray[np.float64]"]:
+    """
+    (channels, 2) lower and upper bounds of the input, pull-up and mcu resistors
+    of every channel, in the order of `faebrylyzer_module.channels`
+    """
+    arrays = {
+        "input": app.input_current_limiting_resistor,
+        "pullup": app.input_pullup_resistor,
+        "mcu": app.mcu_current_limiting_resistor,
+    }
+    channels = len(app.faebrylyzer_module.channels)
+    return {
+        name: np.array(
+            [
+                # wiring of app.faebrylyzerApp
+                resistance_bounds(ras[i // 4].resistor[3 - i % 4].resistance, tolerance)
+                for i in range(channels)
+            ]
+        )
+        for name, ras in arrays.items()
+    }
+
+
+# ----------------------------------------
+#               Model
+# ----------------------------------------
+def rise_time(
+    r_input: "NDArray[np.float64]",
+    r_pullup: "NDArray[np.float64]",
+    r_mcu: "NDArray[np.float64]",
+    c_buffer: "NDArray[np.float64]",
+    c_mcu: "NDArray[np.float64]",
+    model: ChannelModel,
+) -> "NDArray[np.float64]":
+    """
+    10-90 % rise time at the mcu pin, all arguments broadcast
+    """
+    # the pull-up is in parallel to the driving path seen from the buffer input
+    r_drive = model.source_resistance + r_input
+    r_buffer_in = r_drive * r_pullup / (r_drive + r_pullup)
+    t_in = RISE_TIME_RC * r_buffer_in * c_buffer
+    t_out = RISE_TIME_RC * (model.buffer_resistance + r_mcu) * c_mcu
+    return np.sqrt(
+        model.source_rise_time**2 + t_in**2 + model.buffer_rise_time**2 + t_out**2
+    )
+
+
+@dataclass
+class Sweep:
+    # (channels,) at the center of all tolerances
+    nominal: "NDArray[np.float64]"
+    # (samples, channels)
+    samples: "NDArray[np.float64]"
+    # (channels,) at the slow corner of all tolerances
+    worst: "NDArray[np.float64]"
+
+    def quantile(self, q: float) -> "NDArray[np.float64]":
+        return np.quantile(self.samples, q, axis=0)
+
+    @staticmethod
+    def bandwidth(rise: "NDArray[np.float64]") -> "NDArray[np.float64]":
+        return BANDWIDTH_RISE_TIME / rise
+
+    @staticmethod
+    def max_sample_rate(rise: "NDArray[np.float64]") -> "NDArray[np.float64]":
+        return 1 / rise
+
+    def supported_sample_rate(self, q: float = 0.999) -> float:
+        """
+        Highest fx2lafw sample rate all channels reach with probability `q`
+        """
+        limit = self.max_sample_rate(self.quantile(q)).min()
+        return max((r for r in FX2LAFW_SAMPLE_RATES if r <= limit), default=0)
+
+    def report(self, q: float = 0.999) -> str:
+        quantile = self.quantile(q)
+        lines = [
+            f"{'channel':>7s} {'t_r nom':>9s} {f't_r p{q * 100:g}':>10s}"
+            f" {'t_r worst':>9s} {'bw':>9s} {'max rate':>9s}"
+        ]
+        for i, (nom, qu, worst) in enumerate(zip(self.nominal, quantile, self.worst)):
+            lines.append(
+                f"{i:7d} {nom * 1e9:7.2f}ns {qu * 1e9:8.2f}ns {worst * 1e9:7.2f}ns"
+                f" {self.bandwidth(qu) / 1e6:6.1f}MHz"
+                f" {self.max_sample_rate(qu) / 1e6:5.1f}MS/s"
+            )
+        rate = self.supported_sample_rate(q)
+        lines.append(f"supported fx2lafw sample rate: {rate / 1e6:g}MS/s")
+        return "\n".join(lines)
+
+
+def sweep(
+    resistances: dict[str, "NDArray[np.float64]"],
+    model: ChannelModel = ChannelModel(),
+    samples: int = 10000,
+    seed: int = 0,
+) -> Sweep:
+    rng = np.random.default_rng(seed)
+    channels = len(resistances["input"])
+    capacitances = {
+        "buffer": model.trace_capacitance + model.buffer_capacitance,
+        "mcu": model.trace_capacitance + model.mcu_capacitance,
+    }
+    tol = model.capacitance_tolerance
+
+    def draw(lo, hi):
+        return rng.uniform(lo, hi, size=(samples, channels))
+
+    # in the argument order of rise_time
+    resistances = {k: resistances[k] for k in ("input", "pullup", "mcu")}
+    r = {name: draw(b[:, 0], b[:, 1]) for name, b in resistances.items()}
+    c = {name: draw(v * (1 - tol), v * (1 + tol)) for name, v in capacitances.items()}
+
+    def at(r_weight: float, c_factor: float):
+        """
+        Rise time with resistances at `r_weight` between their bounds
+        """
+        return rise_time(
+            *(b[:, 0] + r_weight * (b[:, 1] - b[:, 0]) for b in resistances.values()),
+            *(np.full(channels, v * c_factor) for v in capacitances.values()),
+            model=model,
+        )
+
+    return Sweep(
+        nominal=at(0.5, 1),
+        samples=rise_time(*r.values(), *c.values(), model=model),
+        # all resistances and capacitances at their upper bound
+        worst=at(1, 1 + tol),
+    )
+
+
+def main(
+    samples: Annotated[int, typer.Option(help="Monte Carlo samples")] = 100000,
+    quantile: Annotated[
+        float, typer.Option(help="Rise time quantile the rates are based on")
+    ] = 0.999,
+    tolerance: Annotated[
+        float, typer.Option(help="Tolerance of picked (constant) resistances")
+    ] = 0.05,
+    seed: Annotated[int, typer.Option()] = 0,
+):
+    from faebrylyzer.main import make_app
+
+    # design ranges, the build reports the picked values (signal_integrity stage)
+    app = make_app()
+    assert isinstance(app, faebrylyzerApp)
+    result = sweep(channel_resistances(app, tolerance), samples=samples, seed=seed)
+    print(result.report(quantile))
+
+
+if __name__ == "__main__":
+    setup_basic_logging()
+    typer.run(main)
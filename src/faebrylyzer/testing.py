@@ -0,0 +1,120 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Test support for the faebrylyzer design.
+
+Constructing `faebrylyzerApp` (and picking its parts) takes tens of seconds, too
+long to repeat per test. `AppSnapshot` builds the app once and runs callables
+against isolated copies of it: every run happens in a forked child process, which
+starts with a copy-on-write copy of the constructed app and is thrown away after.
+
+Usage:
+    snapshot = AppSnapshot()
+    snapshot.run(lambda: len(snapshot.app.get_children_modules(direct_only=False)))
+
+The `faebrylyzer_app` fixture of tests/conftest.py runs tests this way.
+"""
+
+import gc
+import logging
+import os
+import pickle
+import sys
+import traceback
+from typing import Any, Callable
+
+import faebryk.libs.picker.lcsc as lcsc
+from faebryk.core.module import Module
+
+from faebrylyzer.app import faebrylyzerApp
+from faebrylyzer.locking import locked_lcsc
+from faebrylyzer.main import (
+    BuildPaths,
+    add_pickers,
+    fill_unspecified_parameters,
+    make_app,
+)
+from faebrylyzer.pick_search import BoundedPartPicker
+
+logger = logging.getLogger(__name__)
+
+
+class ForkedRunError(Exception):
+    """
+    Exception of a forked run that could not be transferred to the parent
+    """
+
+
+class AppSnapshot:
+    def __init__(
+        self,
+        app_factory: Callable[[], Module] = faebrylyzerApp,
+        pick: bool = False,
+        paths: BuildPaths | None = None,
+    ):
+        paths = paths or BuildPaths.default()
+
+        self.app = make_app(app_factory)
+        fill_unspecified_parameters(self.app)
+
+        if pick:
+            lcsc.BUILD_FOLDER = paths.cache_dir.parent
+            lcsc.LIB_FOLDER = paths.lib_dir
+            add_pickers(self.app, jlcpcb=False)
+            with locked_lcsc(paths.lcsc_lock):
+                BoundedPartPicker().pick(self.app)
+
+        # keep the garbage collector of forked children off the snapshot, so its
+        # pages stay shared with the parent
+        gc.collect()
+        gc.freeze()
+
+    def run[T](self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Call `fn(*args, **kwargs)` in a forked child and return its result.
+
+        Everything `fn` does to the app (or anything else) stays in the child.
+        The result and exceptions are transferred by pickling.
+        """
+        __tracebackhide__ = True
+
+        if not hasattr(os, "fork"):
+            # no cheap copies on this platform, fall back to working in place
+            return fn(*args, **kwargs)
+
+        read_fd, write_fd = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                payload = pickle.dumps((True, fn(*args, **kwargs)))
+            except BaseException as e:
+                e.add_note(f"In forked run:\n{traceback.format_exc()}")
+                try:
+                    payload = pickle.dumps((False, e))
+                except Exception:
+                    payload = pickle.dumps(
+                        (False, ForkedRunError(traceback.format_exc()))
+                    )
+            with os.fdopen(write_fd, "wb") as f:
+                f.write(payload)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as f:
+            payload = f.read()
+        _, status = os.waitpid(pid, 0)
+
+        if not payload:
+            raise ForkedRunError(f"Forked run died with status {status}")
+
+        success, result = pickle.loads(payload)
+        if not success:
+            raise result
+        return result
@@ -0,0 +1,192 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Capture throughput budget of the logic analyzer.
+
+Samples of all channels are clocked into the FIFO of the FX2 (CBM9002A) and
+streamed to the host as USB 2.0 high speed bulk transfers. A sample takes one
+FIFO word (8 or 16 bit wide), so the sustainable sample rate of a channel count
+is the lower of
+- the FIFO rate: one word per interface clock
+- the bus rate: sustained bulk bandwidth / bytes per sample
+
+The budget is computed for the channel count of the app and the common
+variants, every variant that can't sustain the target sample rate is flagged.
+
+Usage:
+    python -m faebrylyzer.throughput --target-rate 24e6
+"""
+
+import logging
+import math
+from dataclasses import dataclass
+from pathlib import Path
+
+import faebryk.library._F as F
+import typer
+from faebryk.core.module import Module
+from faebryk.libs.logging import setup_basic_logging
+from typing_extensions import Annotated
+
+from faebrylyzer.library.faebrylyzerModule import faebrylyzerModule
+from faebrylyzer.signal_integrity import FX2LAFW_SAMPLE_RATES
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_VARIANTS = (4, 8, 16, 24, 32)
+
+
+@dataclass(frozen=True)
+class Bus:
+    name: str
+    # bytes/s of the protocol: 13 bulk packets of 512 bytes per 125 us microframe
+    peak: float
+    # bytes/s a typical host sustains
+    sustained: float
+
+
+@dataclass(frozen=True)
+class Fifo:
+    name: str
+    # words/s
+    clock: float
+    # supported word widths in bytes
+    widths: tuple[int, ...]
+    # bytes of endpoint buffer (EP2 quad buffered 4x 512 bytes)
+    buffer: int
+
+
+BUSES: dict[type[Module], Bus] = {
+    F.USB2_0: Bus("USB 2.0 HS bulk", peak=13 * 512 / 125e-6, sustained=40e6),
+}
+FIFOS: dict[type[Module], Fifo] = {
+    F.CBM9002A_56ILG: Fifo("FX2 slave FIFO", clock=48e6, widths=(1, 2), buffer=2048),
+}
+
+
+@dataclass(frozen=True)
+class Variant:
+    channels: int
+    # bytes per sample, None if the FIFO has no word that wide
+    width: int | None
+    fifo_rate: float
+    bus_rate: float
+    # highest fx2lafw sample rate below both
+    sample_rate: float
+    # host latency the FIFO buffer covers at the target rate
+    buffer_time: float
+    ok: bool
+
+
+def _find[T](app: Module, types: dict[type[Module], T]) -> T:
+    for t, budget in types.items():
+        if isinstance(app, t) or app.get_children(direct_only=False, types=t):
+            return budget
+    raise ValueError(f"App has none of {', '.join(t.__name__ for t in types)}")
+
+
+@dataclass
+class ThroughputBudget:
+    bus: Bus
+    fifo: Fifo
+    channels: int
+    target_rate: float
+
+    @classmethod
+    def from_app(
+        cls, app: Module, target_rate: float = FX2LAFW_SAMPLE_RATES[-1]
+    ) -> "ThroughputBudget":
+        modules = app.get_children(direct_only=False, types=faebrylyzerModule)
+        return cls(
+            bus=_find(app, BUSES),
+            fifo=_find(app, FIFOS),
+            channels=sum(len(m.channels) for m in modules),
+            target_rate=target_rate,
+        )
+
+    def variant(self, channels: int) -> Variant:
+        needed = math.ceil(channels / 8)
+        width = min((w for w in self.fifo.widths if w >= needed), default=None)
+        if width is None:
+            return Variant(channels, None, 0, 0, 0, 0, ok=False)
+
+        fifo_rate = self.fifo.clock
+        bus_rate = self.bus.sustained / width
+        limit = min(fifo_rate, bus_rate)
+        sample_rate = max((r for r in FX2LAFW_SAMPLE_RATES if r <= limit), default=0)
+        return Variant(
+            channels=channels,
+            width=width,
+            fifo_rate=fifo_rate,
+            bus_rate=bus_rate,
+            sample_rate=sample_rate,
+            buffer_time=self.fifo.buffer / (self.target_rate * width),
+            ok=sample_rate >= self.target_rate,
+        )
+
+    def variants(self) -> list[Variant]:
+        return [self.variant(c) for c in sorted({self.channels, *CHANNEL_VARIANTS})]
+
+    def to_markdown(self) -> str:
+        lines = [
+            "# Capture throughput budget",
+            "",
+            f"Bus: {self.bus.name}, {self.bus.sustained / 1e6:g} MB/s sustained"
+            f" ({self.bus.peak / 1e6:g} MB/s peak)",
+            f"FIFO: {self.fifo.name}, {self.fifo.clock / 1e6:g} MHz,"
+            f" {self.fifo.buffer} bytes buffer",
+            f"Target sample rate: {self.target_rate / 1e6:g} MS/s",
+            "",
+            "| Channels | Bytes/sample | FIFO limit | Bus limit | Max sample rate"
+            " | Buffer at target | Status |",
+            "| --- | --- | --- | --- | --- | --- | --- |",
+        ]
+        for v in self.variants():
+            name = (
+                f"**{v.channels}** (app)" if v.channels == self.channels else v.channels
+            )
+            if v.width is None:
+                lines.append(f"| {name} | - | - | - | - | - | FIFO too narrow |")
+                continue
+            lines.append(
+                f"| {name} | {v.width} | {v.fifo_rate / 1e6:g} MS/s"
+                f" | {v.bus_rate / 1e6:g} MS/s | {v.sample_rate / 1e6:g} MS/s"
+                f" | {v.buffer_time * 1e6:.0f} us | {'ok' if v.ok else 'EXCEEDS'} |"
+            )
+        lines.append("")
+        return "\n".join(lines)
+
+    def check(self) -> bool:
+        """
+        Log whether the channel count of the app sustains the target rate
+        """
+        v = self.variant(self.channels)
+        if not v.ok:
+            logger.warning(
+                f"{self.channels} channels exceed the capture budget:"
+                f" {v.sample_rate / 1e6:g} MS/s < {self.target_rate / 1e6:g} MS/s"
+            )
+        return v.ok
+
+    def write(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.to_markdown(), encoding="utf-8")
+        logger.info(f"Wrote throughput budget to {path}")
+
+
+def main(
+    target_rate: Annotated[
+        float, typer.Option(help="Sample rate every channel has to sustain [S/s]")
+    ] = FX2LAFW_SAMPLE_RATES[-1],
+):
+    from faebrylyzer.main import make_app
+
+    budget = ThroughputBudget.from_app(make_app(), target_rate)
+    budget.check()
+    print(budget.to_markdown())
+
+
+if __name__ == "__main__":
+    setup_basic_logging()
+    typer.run(main)
@@ -0,0 +1,318 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Ratsnest wirelength estimates of a placed PCB.
+
+All pads of all nets are held in NumPy arrays, relative to their footprints, so
+the estimates for a new set of footprint positions are a few vectorized passes:
+- hpwl: half perimeter of the bounding box of each net
+- mst: length of the euclidean minimum spanning tree (KiCad's ratsnest)
+- manhattan: length of the rectilinear minimum spanning tree
+
+The MST of nets with more than `MAX_EXACT_PADS` pads (the zone-connected power
+nets) is approximated from their HPWL, an exact Prim over them costs as many
+passes as they have pads.
+
+Nets are grouped into classes (channels, usb, power) for the totals.
+
+Usage:
+    python -m faebrylyzer.wirelength <kicad_pcb>
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from enum import StrEnum, auto
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+import typer
+from faebryk.libs.kicad.fileformats import C_kicad_pcb_file
+from faebryk.libs.logging import setup_basic_logging
+from typing_extensions import Annotated
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+logger = logging.getLogger(__name__)
+
+PCB = C_kicad_pcb_file.C_kicad_pcb
+
+
+class NetClass(StrEnum):
+    CHANNEL = auto()
+    USB = auto()
+    POWER = auto()
+    OTHER = auto()
+
+
+NET_CLASSES = [
+    (NetClass.CHANNEL, re.compile(r"^(ch|buffer_in|buffer_out|mcu_logic)_\d+$")),
+    (NetClass.USB, re.compile(r"^usb_[PN]$")),
+    (NetClass.POWER, re.compile(r"^(gnd|vbus|3v3)$")),
+]
+
+
+def classify(net_name: str) -> NetClass:
+    for net_class, pattern in NET_CLASSES:
+        if pattern.match(net_name):
+            return net_class
+    return NetClass.OTHER
+
+
+# nets with more pads get the approximate MST
+MAX_EXACT_PADS = 16
+# net size correction of HPWL to rectilinear tree length (Cheng, RISA)
+_RISA_PADS = [3, 4, 5, 6, 7, 8, 9, 10, 15, 20, 25, 30, 35, 40, 45, 50]
+_RISA_FACTOR = [
+    1.0, 1.08, 1.15, 1.22, 1.28, 1.34, 1.4, 1.45,
+    1.69, 1.89, 2.07, 2.23, 2.39, 2.54, 2.66, 2.79,
+]  # fmt: skip
+
+
+def risa_factor(pads: "NDArray[np.intp]") -> "NDArray[np.float64]":
+    """
+    Ratio of rectilinear tree length to HPWL for nets of `pads` pads, linear
+    beyond 50 pads
+    """
+    return np.where(
+        pads > 50,
+        _RISA_FACTOR[-1] + 0.02616 * (pads - 50),
+        np.interp(pads, _RISA_PADS, _RISA_FACTOR),
+    )
+
+
+@dataclass
+class Estimate:
+    hpwl: "NDArray[np.float64]"
+    mst: "NDArray[np.float64]"
+    manhattan: "NDArray[np.float64]"
+
+
+def _mst(pts: "NDArray[np.float64]") -> "NDArray[np.float64]":
+    """
+    Euclidean and rectilinear MST length of every row of pads in `pts`
+    """
+    diff = np.abs(pts[:, :, None] - pts[:, None])
+    dist = np.stack([np.hypot(diff[..., 0], diff[..., 1]), diff.sum(axis=-1)])
+
+    width = pts.shape[1]
+    if width == 2:
+        return dist[:, :, 0, 1]
+    if width == 3:
+        edges = dist[:, :, [0, 0, 1], [1, 2, 2]]
+        return edges.sum(axis=-1) - edges.max(axis=-1)
+
+    # Prim over both metrics and all rows at once, each tree grows from pad 0
+    dist = dist.reshape(-1, width, width)
+    rows = np.arange(len(dist))
+    done = np.zeros((len(dist), width), dtype=bool)
+    done[:, 0] = True
+    best = np.where(done, np.inf, dist[:, 0])
+    total = np.zeros(len(dist))
+    for _ in range(width - 1):
+        j = np.argmin(best, axis=1)
+        total += best[rows, j]
+        done[rows, j] = True
+        np.minimum(best, dist[rows, j], out=best)
+        best[done] = np.inf
+    return total.reshape(2, -1)
+
+
+class Ratsnest:
+    """
+    Pads of all nets with at least two pads, sorted by net
+
+    Nets with more than `max_exact_pads` pads get an approximate MST, None
+    computes all of them exactly.
+    """
+
+    def __init__(
+        self,
+        nets: list[str],
+        footprints: list[str],
+        fp_at: "NDArray[np.float64]",
+        pad_net: "NDArray[np.intp]",
+        pad_fp: "NDArray[np.intp]",
+        pad_offset: "NDArray[np.float64]",
+        max_exact_pads: int | None = MAX_EXACT_PADS,
+    ):
+        self.nets = nets
+        self.classes = [classify(n) for n in nets]
+        self.footprints = footprints
+        # (x, y, rotation) of every footprint
+        self.fp_at = fp_at
+        self.pad_net = pad_net
+        self.pad_fp = pad_fp
+        self.pad_offset = pad_offset
+
+        self.starts = np.flatnonzero(np.r_[True, pad_net[1:] != pad_net[:-1]])
+        if not len(pad_net):
+            self.starts = self.starts[:0]
+        self.sizes = np.diff(np.r_[self.starts, len(pad_net)])
+
+        exact = self.sizes <= (max_exact_pads or len(pad_net))
+        self._approximate = np.flatnonzero(~exact)
+        self._approximate_factor = risa_factor(self.sizes[self._approximate])
+
+        # nets grouped by pad count for the batched MST: two, three and more
+        # pads, the latter padded to equal length with duplicates of their first
+        # pad, which join the tree at no cost
+        self._groups: list[tuple["NDArray[np.intp]", "NDArray[np.intp]"]] = []
+        group_of = np.where(exact, np.minimum(self.sizes, 4), 0)
+        for group in np.unique(group_of[exact]):
+            nets_in = np.flatnonzero(group_of == group)
+            width = self.sizes[nets_in].max()
+            index = np.repeat(self.starts[nets_in], width).reshape(-1, width)
+            for row, net in enumerate(nets_in):
+                start, size = self.starts[net], self.sizes[net]
+                index[row, :size] = np.arange(start, start + size)
+            self._groups.append((nets_in, index))
+
+    @classmethod
+    def from_pcb(
+        cls, pcb: PCB, max_exact_pads: int | None = MAX_EXACT_PADS
+    ) -> "Ratsnest":
+        net_names = {net.number: net.name for net in pcb.nets}
+        footprints: list[str] = []
+        fp_at = []
+        pads: list[tuple[int, int, float, float]] = []
+        for fp in pcb.footprints:
+            ref = fp.propertys.get("Reference")
+            footprints.append(ref.value if ref else fp.name)
+            fp_at.append((fp.at.x, fp.at.y, fp.at.r or 0))
+            seen = set()
+            for pad in fp.pads:
+                if not pad.net or not pad.net.number or pad.name in seen:
+                    continue
+                seen.add(pad.name)
+                pads.append((pad.net.number, len(footprints) - 1, pad.at.x, pad.at.y))
+
+        counts: dict[int, int] = {}
+        for net, *_ in pads:
+            counts[net] = counts.get(net, 0) + 1
+        numbers = sorted(n for n, c in counts.items() if c >= 2)
+        net_index = {n: i for i, n in enumerate(numbers)}
+        pads = sorted((p for p in pads if p[0] in net_index), key=lambda p: p[0])
+
+        return cls(
+            nets=[net_names.get(n, str(n)) for n in numbers],
+            footprints=footprints,
+            fp_at=np.array(fp_at, dtype=np.float64).reshape(-1, 3),
+            pad_net=np.array([net_index[p[0]] for p in pads], dtype=np.intp),
+            pad_fp=np.array([p[1] for p in pads], dtype=np.intp),
+            pad_offset=np.array([p[2:] for p in pads], dtype=np.float64).reshape(-1, 2),
+            max_exact_pads=max_exact_pads,
+        )
+
+    # --------------------------------------------------------------------------
+    def pad_positions(
+        self,
+        fp_at: "NDArray[np.float64] | None" = None,
+        pads: "NDArray[np.intp] | slice" = slice(None),
+    ) -> "NDArray[np.float64]":
+        """
+        Absolute positions of `pads` for footprints at `fp_at` (x, y, rotation)
+        """
+        at = (self.fp_at if fp_at is None else fp_at)[self.pad_fp[pads]]
+        # KiCad angles are counter-clockwise with y pointing down
+        a = np.radians(-at[:, 2])
+        c, s = np.cos(a), np.sin(a)
+        x, y = self.pad_offset[pads, 0], self.pad_offset[pads, 1]
+        return np.stack([at[:, 0] + x * c - y * s, at[:, 1] + x * s + y * c], axis=1)
+
+    def hpwl(
+        self,
+        xy: "NDArray[np.float64]",
+        starts: "NDArray[np.intp] | None" = None,
+    ) -> "NDArray[np.float64]":
+        """
+        HPWL of the nets starting at `starts` in `xy` (all nets by default)
+        """
+        starts = self.starts if starts is None else starts
+        if not len(starts):
+            return np.zeros(0)
+        extent = np.maximum.reduceat(xy, starts) - np.minimum.reduceat(xy, starts)
+        return extent.sum(axis=1)
+
+    def mst(
+        self,
+        xy: "NDArray[np.float64]",
+        hpwl: "NDArray[np.float64] | None" = None,
+    ) -> tuple["NDArray[np.float64]", "NDArray[np.float64]"]:
+        """
+        Euclidean and rectilinear MST length of every net (batched Prim), of the
+        large nets approximated from their HPWL (`hpwl` of all nets if known)
+        """
+        out = np.zeros((2, len(self.nets)))
+        for nets, index in self._groups:
+            out[:, nets] = _mst(xy[index])
+        if len(self._approximate):
+            hpwl = self.hpwl(xy) if hpwl is None else hpwl
+            manhattan = hpwl[self._approximate] * self._approximate_factor
+            # mean ratio of euclidean to manhattan length over all directions
+            out[:, self._approximate] = manhattan * np.pi / 4, manhattan
+        return out[0], out[1]
+
+    def estimate(self, fp_at: "NDArray[np.float64] | None" = None) -> Estimate:
+        xy = self.pad_positions(fp_at)
+        hpwl = self.hpwl(xy)
+        mst, manhattan = self.mst(xy, hpwl)
+        return Estimate(hpwl=hpwl, mst=mst, manhattan=manhattan)
+
+    # --------------------------------------------------------------------------
+    def totals(self, estimate: Estimate) -> dict[NetClass, dict[str, float]]:
+        classes = np.array([list(NetClass).index(c) for c in self.classes])
+        return {
+            net_class: {
+                "nets": int(np.sum(classes == i)),
+                **{
+                    metric: float(getattr(estimate, metric)[classes == i].sum())
+                    for metric in ("hpwl", "mst", "manhattan")
+                },
+            }
+            for i, net_class in enumerate(NetClass)
+        }
+
+    def report(self, estimate: Estimate) -> str:
+        lines = [
+            f"{'class':10s} {'nets':>5s} {'hpwl':>9s} {'mst':>9s} {'manhattan':>9s}"
+        ]
+        totals = self.totals(estimate)
+        for net_class, t in totals.items():
+            lines.append(
+                f"{net_class:10s} {t['nets']:5d} {t['hpwl']:9.1f} {t['mst']:9.1f}"
+                f" {t['manhattan']:9.1f}"
+            )
+        lines.append(
+            f"{'total':10s} {len(self.nets):5d}"
+            f" {estimate.hpwl.sum():9.1f} {estimate.mst.sum():9.1f}"
+            f" {estimate.manhattan.sum():9.1f}"
+        )
+        return "\n".join(lines)
+
+
+def main(
+    pcbfile: Annotated[Path, typer.Argument(help="KiCad PCB file")],
+    top: Annotated[int, typer.Option(help="Show the longest nets")] = 10,
+    approximate: Annotated[
+        bool, typer.Option(help="Approximate MST of the large (power) nets")
+    ] = False,
+):
+    ratsnest = Ratsnest.from_pcb(
+        C_kicad_pcb_file.loads(pcbfile).kicad_pcb,
+        max_exact_pads=MAX_EXACT_PADS if approximate else None,
+    )
+    estimate = ratsnest.estimate()
+    print(ratsnest.report(estimate))
+
+    print(f"\nLongest {top} nets (mst, mm):")
+    for i in np.argsort(-estimate.mst)[:top]:
+        print(f"  {ratsnest.nets[i]:24s} {estimate.mst[i]:7.1f}")
+
+
+if __name__ == "__main__":
+    setup_basic_logging()
+    typer.run(main)
@@ -0,0 +1,65 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+"""
+Tests requesting the `faebrylyzer_app` fixture share one app per session and each
+run in their own fork (see `faebrylyzer.testing.AppSnapshot`), so they can modify
+the app freely:
+
+    def test_buffer_is_powered(faebrylyzer_app):
+        assert faebrylyzer_app.buffer.power.is_connected_to(...)
+
+`--faebrylyzer-pick` also picks parts before snapshotting (needs the part caches
+in build/).
+"""
+
+import inspect
+from typing import TYPE_CHECKING
+
+import pytest
+
+if TYPE_CHECKING:
+    from faebryk.core.module import Module
+
+    from faebrylyzer.testing import AppSnapshot
+
+APP_FIXTURE = "faebrylyzer_app"
+
+
+def pytest_addoption(parser: pytest.Parser):
+    parser.addoption(
+        "--faebrylyzer-pick",
+        action="store_true",
+        help="Pick parts of the faebrylyzer app snapshot",
+    )
+
+
+@pytest.fixture(scope="session")
+def faebrylyzer_snapshot(request: pytest.FixtureRequest) -> "AppSnapshot":
+    # imports the app, only for sessions using it
+    from faebrylyzer.testing import AppSnapshot
+
+    return AppSnapshot(pick=request.config.getoption("--faebrylyzer-pick"))
+
+
+@pytest.fixture
+def faebrylyzer_app(faebrylyzer_snapshot: "AppSnapshot") -> "Module":
+    return faebrylyzer_snapshot.app
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem: pytest.Function) -> bool | None:
+    """
+    Run tests using the app in a fork of the session
+    """
+    if APP_FIXTURE not in pyfuncitem.fixturenames:
+        return None
+
+    snapshot: "AppSnapshot" = pyfuncitem.funcargs["faebrylyzer_snapshot"]  # type: ignore
+    kwargs = {
+        name: pyfuncitem.funcargs[name]
+        for name in inspect.signature(pyfuncitem.obj).parameters
+    }
+    __tracebackhide__ = True
+    snapshot.run(pyfuncitem.obj, **kwargs)
+    return True
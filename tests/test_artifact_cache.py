@@ -0,0 +1,215 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+import json
+import shutil
+from pathlib import Path
+
+import faebryk.library._F as F
+import faebryk.libs.picker.lcsc as lcsc
+import pytest
+from faebryk.core.module import Module
+from faebryk.libs.picker.jlcpcb.jlcpcb import JLCPCB_DB
+from faebryk.libs.picker.lcsc import LCSC_Part
+from faebryk.libs.picker.picker import has_part_picked_defined
+from faebryk.libs.units import P
+
+from faebrylyzer.artifact_cache import ArtifactCache, Fingerprint
+from faebrylyzer.main import BuildPaths, build
+
+
+@pytest.fixture
+def outputs(tmp_path: Path) -> dict[str, Path]:
+    single = tmp_path.joinpath("out", "single.txt")
+    single.parent.mkdir()
+    single.write_text("single")
+    folder = tmp_path.joinpath("out", "folder")
+    folder.joinpath("sub").mkdir(parents=True)
+    folder.joinpath("a.txt").write_text("a")
+    folder.joinpath("sub", "b.txt").write_text("b")
+    return {"single": single, "folder": folder}
+
+
+def _contents(path: Path) -> dict[str, str]:
+    if path.is_file():
+        return {"": path.read_text()}
+    return {
+        p.relative_to(path).as_posix(): p.read_text()
+        for p in sorted(path.rglob("*"))
+        if p.is_file()
+    }
+
+
+# ----------------------------------------
+#               Fingerprint
+# ----------------------------------------
+def test_fingerprint_is_stable(outputs: dict[str, Path]):
+    def key() -> str:
+        return (
+            Fingerprint("parent")
+            .add("single", outputs["single"])
+            .add("folder", outputs["folder"])
+            .add("fn", _contents)
+            .add("options", {"a": 1})
+            .hexdigest()
+        )
+
+    assert key() == key()
+
+
+def test_fingerprint_changes_with_inputs(outputs: dict[str, Path]):
+    def key(**kwargs) -> str:
+        inputs = {"a": "x", "b": outputs["folder"], **kwargs}
+        fingerprint = Fingerprint()
+        for name, value in inputs.items():
+            fingerprint.add(name, value)
+        return fingerprint.hexdigest()
+
+    before = key()
+    assert key(a="y") != before
+    assert key(c="x") != before
+    # inputs are named, the same values in other inputs are another key
+    assert key(a=outputs["folder"], b="x") != before
+
+    outputs["folder"].joinpath("sub", "b.txt").write_text("changed")
+    assert key() != before
+    outputs["folder"].joinpath("sub", "b.txt").rename(
+        outputs["folder"].joinpath("sub", "c.txt")
+    )
+    assert key() != before
+
+
+def test_fingerprint_of_missing_path_differs_from_empty_file(tmp_path: Path):
+    path = tmp_path / "missing"
+    missing = Fingerprint().add("path", path).hexdigest()
+    path.touch()
+
+    assert Fingerprint().add("path", path).hexdigest() != missing
+
+
+# ----------------------------------------
+#               ArtifactCache
+# ----------------------------------------
+def test_store_restore_round_trip(tmp_path: Path, outputs: dict[str, Path]):
+    cache = ArtifactCache(tmp_path / "cache")
+    expected = {name: _contents(path) for name, path in outputs.items()}
+    cache.store("0123abcd", outputs)
+
+    restored = {
+        "single": tmp_path.joinpath("restored", "single.txt"),
+        "folder": tmp_path.joinpath("restored", "folder"),
+    }
+    assert cache.restore("0123abcd", restored)
+    assert {name: _contents(path) for name, path in restored.items()} == expected
+    assert not cache.restore("4567abcd", restored)
+
+
+def test_run_produces_outputs_only_on_a_miss(tmp_path: Path, outputs: dict[str, Path]):
+    cache = ArtifactCache(tmp_path / "cache")
+    calls: list[int] = []
+
+    assert not cache.run("0123abcd", outputs, lambda: calls.append(1))
+    outputs["single"].unlink()
+    assert cache.run("0123abcd", outputs, lambda: calls.append(1))
+
+    assert calls == [1]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert outputs["single"].read_text() == "single"
+
+
+def test_incomplete_entry_is_ignored(tmp_path: Path, outputs: dict[str, Path]):
+    cache = ArtifactCache(tmp_path / "cache")
+    cache.store("0123abcd", outputs)
+    # e.g. an object cleaned up on the shared cache
+    objects = tmp_path.joinpath("cache", "objects")
+    next(p for p in objects.rglob("*") if p.is_file()).unlink()
+    outputs["single"].write_text("local")
+
+    assert not cache.restore("0123abcd", outputs)
+    assert outputs["single"].read_text() == "local"
+
+
+def test_entry_with_other_outputs_is_ignored(tmp_path: Path, outputs: dict[str, Path]):
+    cache = ArtifactCache(tmp_path / "cache")
+    cache.store("0123abcd", {"single": outputs["single"]})
+
+    assert not cache.restore("0123abcd", outputs)
+
+    manifest = next(tmp_path.joinpath("cache", "entries").rglob("*.json"))
+    assert json.loads(manifest.read_text()).keys() == {"single"}
+
+
+# ----------------------------------------
+#               Build
+# ----------------------------------------
+class _Divider(Module):
+    """
+    Picked parts with footprints of the project libs, builds without downloads
+    """
+
+    power: F.ElectricPower
+
+    def __preinit__(self):
+        resistors = self.add_to_container(2, F.Resistor)
+        resistors[0].unnamed[0].connect(self.power.hv)
+        resistors[0].unnamed[1].connect(resistors[1].unnamed[0])
+        resistors[1].unnamed[1].connect(self.power.lv)
+        for r in resistors:
+            r.resistance.merge(F.Constant(10 * P.kohm))
+            r.add(has_part_picked_defined(LCSC_Part("C25744")))
+            r.get_trait(F.can_attach_to_footprint).attach(
+                F.KicadFootprint("lcsc:R0402", ["1", "2"])
+            )
+
+
+def _design(app: Module) -> tuple[dict[str, str], dict[str, set[str]]]:
+    """
+    Designators by module and pads by net name (made of designators and pins)
+    """
+    designators = {
+        m.get_full_name(): m.get_trait(F.has_designator).get_designator()
+        for m in app.get_children(direct_only=False, types=Module)
+        if m.has_trait(F.has_designator)
+    }
+    nets = {
+        net.get_trait(F.has_overriden_name).get_name(): {
+            pad.get_full_name() for pad in net.get_fps()
+        }
+        for net in app.get_graph().nodes_of_type(F.Net)
+    }
+    return designators, nets
+
+
+def test_cached_apply_design_relinks_the_app(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    # process-wide paths set by build
+    monkeypatch.setattr(lcsc, "BUILD_FOLDER", lcsc.BUILD_FOLDER)
+    monkeypatch.setattr(lcsc, "LIB_FOLDER", lcsc.LIB_FOLDER)
+    monkeypatch.setattr(JLCPCB_DB.config, "db_path", JLCPCB_DB.config.db_path)
+    monkeypatch.setenv("FBRK_PCBNEW_AUTO", "0")
+
+    defaults = BuildPaths.default()
+    shared = BuildPaths(root=tmp_path / "shared", build_dir=tmp_path / "shared/build")
+    shutil.copytree(defaults.kicad_prj_path, shared.kicad_prj_path)
+    shared.lib_dir.symlink_to(defaults.lib_dir.resolve(), target_is_directory=True)
+    cache = ArtifactCache(tmp_path / "cache")
+
+    def run(name: str) -> Module:
+        return build(
+            BuildPaths.isolated(tmp_path / name, shared),
+            app_factory=_Divider,
+            transform=None,
+            jlcpcb_pickers=False,
+            cache=cache,
+        )
+
+    missed = _design(run("miss"))
+    assert (cache.hits, cache.misses) == (0, 1)
+    hit = _design(run("hit"))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    designators, nets = missed
+    assert sorted(designators.values()) == ["R1", "R2"]
+    assert "R1-2-R2-1" in nets
+    assert hit == missed
@@ -0,0 +1,59 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+
+import pytest
+from faebryk.libs.kicad.fileformats import C_kicad_pcb_file
+
+from faebrylyzer.drc import PCB, Allow, ItemClass, ItemKind, check_placement
+from faebrylyzer.pcb import BOARD_SIZE, DRC_ALLOWLIST, get_outline_coordinates
+
+PCB_FILE = Path(__file__).parent.parent / "source" / "main.kicad_pcb"
+OUTLINE = get_outline_coordinates(BOARD_SIZE)
+
+
+@pytest.fixture(scope="module")
+def pcb() -> PCB:
+    return C_kicad_pcb_file.loads(PCB_FILE).kicad_pcb
+
+
+def test_stock_board_passes(pcb: PCB):
+    assert [str(v) for v in check_placement(pcb, OUTLINE, allow=DRC_ALLOWLIST)] == []
+
+
+def test_mechanical_edge_lines_are_not_checked(pcb: PCB):
+    violations = check_placement(pcb, OUTLINE)
+
+    assert violations
+    assert not any("board:graphic" in str(v) for v in violations)
+
+
+def test_allow_matches_items_in_either_order(pcb: PCB):
+    violations = check_placement(pcb, OUTLINE)
+    allow = Allow(
+        "silkscreen on pad",
+        ItemClass(ItemKind.SILKSCREEN, footprint=None, name="[[] ] *"),
+        ItemClass(ItemKind.PAD, footprint="lcsc:LED-*"),
+    )
+
+    allowed = [str(v) for v in violations if allow.matches(v)]
+    remaining = check_placement(pcb, OUTLINE, allow=[allow])
+
+    assert len(allowed) == 4
+    assert len(remaining) == len(violations) - len(allowed)
+    assert not any(str(v) in allowed for v in remaining)
+
+
+def test_footprint_classes_do_not_match_board_items(pcb: PCB):
+    violations = check_placement(pcb, OUTLINE)
+    board_items = [
+        item
+        for v in violations
+        for item in (v.a, v.b)
+        if item is not None and item.footprint is None
+    ]
+
+    assert board_items
+    assert not any(ItemClass().matches(item) for item in board_items)
+    assert all(ItemClass(footprint=None).matches(item) for item in board_items)
@@ -0,0 +1,31 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+import subprocess
+import sys
+
+import pytest
+
+import faebrylyzer.library._F as F
+
+
+def _run(code: str):
+    # a fresh interpreter, import order problems are hidden by loaded modules
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.parametrize("name", sorted(F.MODULES))
+def test_facade_entry_imports_first(name: str):
+    _run(f"import faebrylyzer.library._F as F; F.{name}")
+
+
+@pytest.mark.parametrize("name", sorted(F.MODULES))
+def test_library_module_imports_first(name: str):
+    _run(f"import {F.MODULES[name]}")
+
+
+def test_map_is_up_to_date():
+    assert F.generate() == F.MODULES
@@ -0,0 +1,42 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+import fcntl
+from pathlib import Path
+
+import pytest
+from faebryk.libs.picker.jlcpcb.jlcpcb import JLCPCB_DB
+
+from faebrylyzer.locking import locked_jlcpcb_db
+
+
+def _is_locked(path: Path) -> bool:
+    with open(path.with_name(path.name + ".lock"), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return False
+
+
+def test_jlcpcb_db_is_opened_under_its_lock(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    db_path = tmp_path / "jlcpcb_part_database"
+    monkeypatch.setattr(JLCPCB_DB.config, "db_path", db_path)
+    locked: list[bool] = []
+
+    def init(self: JLCPCB_DB):
+        # instead of opening (or downloading) the database
+        self.connected = False
+        locked.append(_is_locked(db_path))
+
+    monkeypatch.setattr(JLCPCB_DB, "init", init)
+
+    # JLCPCB_DB() would also register an exit handler thread
+    with locked_jlcpcb_db():
+        object.__new__(JLCPCB_DB).init()
+    object.__new__(JLCPCB_DB).init()
+
+    assert locked == [True, False]
@@ -0,0 +1,85 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+
+import pytest
+
+from faebrylyzer import loopback
+from faebrylyzer.app import faebrylyzerApp
+from faebrylyzer.loopback import (
+    Pattern,
+    Probe,
+    channel_map,
+    prbs_words,
+    synthesize,
+    verify,
+    walking_ones,
+)
+
+SAMPLES = 100_003
+
+
+@pytest.fixture
+def vectors(monkeypatch: pytest.MonkeyPatch) -> loopback.TestVectors:
+    # several chunks and a partial one
+    monkeypatch.setattr(loopback, "CHUNK", 10_000)
+    probes = [Probe(pin=str(i + 1), net=f"ch_{i}", channel=i, bit=i) for i in range(8)]
+    return loopback.TestVectors(
+        probes=probes,
+        patterns={
+            "walking_ones": Pattern(walking_ones(probes), hold=4),
+            "prbs7": Pattern(prbs_words(probes), hold=4),
+        },
+    )
+
+
+@pytest.mark.parametrize("pattern", ["walking_ones", "prbs7"])
+@pytest.mark.parametrize("phase, step", [(0, 0), (3, 5), (1, 8)])
+def test_round_trip(
+    tmp_path: Path, vectors: loopback.TestVectors, pattern: str, phase: int, step: int
+):
+    capture = tmp_path / "capture.bin"
+    synthesize(capture, vectors, pattern, SAMPLES, phase=phase, step=step)
+
+    result = verify(capture, vectors, pattern)
+
+    assert result.ok, result.report()
+    assert result.samples == SAMPLES
+    assert result.first_error is None
+
+
+def test_flips_are_counted(tmp_path: Path, vectors: loopback.TestVectors):
+    capture = tmp_path / "capture.bin"
+    synthesize(capture, vectors, "prbs7", SAMPLES, phase=2, flips=50, seed=1)
+
+    result = verify(capture, vectors, "prbs7", guard=0)
+
+    assert not result.ok
+    assert sum(result.errors) == 50
+    assert result.first_error is not None
+
+
+@pytest.mark.parametrize("pattern", ["walking_ones", "prbs7"])
+@pytest.mark.parametrize("level", [0, 1])
+def test_stuck_bit_fails_only_its_probe(
+    tmp_path: Path, vectors: loopback.TestVectors, pattern: str, level: int
+):
+    capture = tmp_path / "capture.bin"
+    synthesize(capture, vectors, pattern, SAMPLES, stuck={3: level})
+
+    result = verify(capture, vectors, pattern)
+
+    assert not result.ok
+    assert [bool(e) for e in result.errors] == [p.bit == 3 for p in vectors.probes]
+
+
+def test_channel_map_follows_the_connector_pinout(faebrylyzer_app: faebrylyzerApp):
+    probes = channel_map(faebrylyzer_app)
+
+    # faebrylyzerModule: channel 0 on connector pin 18, channel i on pin i
+    # (0-based, pad names are 1-based), through the buffer to PB i
+    assert [p.channel for p in probes] == list(range(8))
+    assert [p.pin for p in probes] == ["19", *(str(i + 1) for i in range(1, 8))]
+    assert [p.bit for p in probes] == list(range(8))
+    assert [p.net for p in probes] == [f"ch_{i}" for i in range(8)]
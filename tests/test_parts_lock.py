@@ -0,0 +1,60 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+
+from faebrylyzer.parts_lock import LockedPart, PartsLock
+
+
+def _part(partno: str) -> LockedPart:
+    return LockedPart(partno=partno, constraints="0123456789abcdef", params={})
+
+
+def _write(path: Path, **parts: str):
+    lock = PartsLock()
+    lock.parts = {k: _part(v) for k, v in parts.items()}
+    lock.dump(path)
+
+
+def _read(path: Path) -> dict[str, str]:
+    return {k: v.partno for k, v in PartsLock.load(path).parts.items()}
+
+
+def test_concurrent_picks_are_merged(tmp_path: Path):
+    path = tmp_path / "parts.lock"
+    _write(path, r1="C1")
+    a, b = PartsLock.load(path), PartsLock.load(path)
+
+    a.parts["r2"] = _part("C2")
+    a.dump(path)
+    b.parts["r3"] = _part("C3")
+    b.dump(path)
+
+    assert _read(path) == {"r1": "C1", "r2": "C2", "r3": "C3"}
+
+
+def test_entries_changed_by_this_build_win(tmp_path: Path):
+    path = tmp_path / "parts.lock"
+    _write(path, r1="C1", r2="C2", r3="C3")
+    a, b = PartsLock.load(path), PartsLock.load(path)
+
+    a.parts["r1"] = _part("C10")
+    a.parts["r2"] = _part("C20")
+    a.dump(path)
+    # b re-picks r1 and removes r3, r2 is as b loaded it
+    b.parts["r1"] = _part("C11")
+    del b.parts["r3"]
+    b.dump(path)
+
+    assert _read(path) == {"r1": "C11", "r2": "C20"}
+    assert _read(path) == {k: v.partno for k, v in b.parts.items()}
+
+
+def test_unchanged_lock_is_not_rewritten(tmp_path: Path):
+    path = tmp_path / "parts.lock"
+    _write(path, r1="C1")
+    mtime = path.stat().st_mtime_ns
+
+    PartsLock.load(path).dump(path)
+
+    assert path.stat().st_mtime_ns == mtime
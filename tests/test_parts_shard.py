@@ -0,0 +1,46 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+
+import pytest
+from faebryk.core.module import Module
+from faebryk.libs.picker.jlcpcb.jlcpcb import JLCPCB_DB
+from faebryk.libs.picker.picker import PickError
+
+from faebrylyzer import main
+from faebrylyzer.main import pick_parts
+
+
+@pytest.fixture
+def picked_from(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> list[Path]:
+    # like use_shard, without opening a database
+    monkeypatch.setattr(JLCPCB_DB.config, "db_path", tmp_path / "shard")
+    monkeypatch.setattr(JLCPCB_DB.config, "no_download_prompt", True)
+    picked_from: list[Path] = []
+
+    def pick_part_recursively(module: Module):
+        picked_from.append(JLCPCB_DB.config.db_path)
+        if JLCPCB_DB.config.db_path == tmp_path / "shard":
+            raise PickError("not in the shard", module)
+
+    monkeypatch.setattr(main, "pick_part_recursively", pick_part_recursively)
+    return picked_from
+
+
+def test_parts_missing_from_the_shard_are_picked_from_the_full_database(
+    tmp_path: Path, picked_from: list[Path]
+):
+    pick_parts(Module(), full_db=tmp_path / "full")
+
+    assert picked_from == [tmp_path / "shard", tmp_path / "full"]
+    assert not JLCPCB_DB.config.no_download_prompt
+
+
+def test_without_full_database_the_error_is_raised(
+    tmp_path: Path, picked_from: list[Path]
+):
+    with pytest.raises(PickError, match="not in the shard"):
+        pick_parts(Module())
+
+    assert picked_from == [tmp_path / "shard"]
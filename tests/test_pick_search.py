@@ -0,0 +1,105 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+import faebryk.library._F as F
+import pytest
+from faebryk.core.module import Module
+from faebryk.libs.picker.picker import (
+    Part,
+    PickerOption,
+    PickerProgress,
+    PickError,
+    Supplier,
+    has_part_picked,
+    pick_module_by_params,
+)
+from faebryk.libs.units import P
+
+from faebrylyzer import pick_search
+from faebrylyzer.pick_search import BoundedPartPicker, PickBudget
+
+
+class _Supplier(Supplier):
+    def attach(self, module: Module, part: PickerOption):
+        pass
+
+
+class _Pair(Module):
+    """
+    Two resistors where `load` must be at least twice `source`, like the load
+    capacitors of a crystal oscillator derive from the crystal
+    """
+
+    source: F.Resistor
+    load: F.Resistor
+
+    def __preinit__(self):
+        self.load.resistance.merge(
+            F.Range(self.source.resistance * F.Constant(2), F.Constant(1 * P.Mohm))
+        )
+
+
+def _add_picker(module: F.Resistor, partno: str, ohm: float):
+    option = PickerOption(
+        part=Part(partno, _Supplier()),
+        params={"resistance": F.Constant(ohm * P.ohm)},
+    )
+    module.add(
+        F.has_multi_picker(
+            0,
+            F.has_multi_picker.FunctionPicker(
+                lambda m: pick_module_by_params(m, [option])
+            ),
+        )
+    )
+
+
+def _pair() -> _Pair:
+    pair = _Pair()
+    # like main.fill_unspecified_parameters
+    pair.source.resistance.merge(F.ANY())
+    _add_picker(pair.source, "R100", 100)
+    _add_picker(pair.load, "R300", 300)
+    return pair
+
+
+def test_failed_pick_is_retried_after_its_operands_are_picked(monkeypatch):
+    # the constraints fingerprint alone may miss the operands (its repr fallback
+    # for unresolved operations)
+    monkeypatch.setattr(
+        pick_search, "constraints_fingerprint", lambda m: type(m).__qualname__
+    )
+    pair = _pair()
+    picker = BoundedPartPicker(PickBudget(max_evaluations=None, max_seconds=None))
+    progress = PickerProgress.from_module(pair)
+
+    with progress.context():
+        with pytest.raises(PickError):
+            picker._pick(pair.load, progress)
+        picker._pick(pair.source, progress)
+        picker._pick(pair.load, progress)
+
+    assert pair.load.get_trait(has_part_picked).get_part().partno == "R300"
+    assert picker.budget.attempts[pair.load] == 2
+
+
+def test_failed_pick_is_not_retried_with_the_same_operands():
+    pair = _pair()
+    picker = BoundedPartPicker(PickBudget(max_evaluations=None, max_seconds=None))
+    progress = PickerProgress.from_module(pair)
+
+    with progress.context():
+        for _ in range(2):
+            with pytest.raises(PickError):
+                picker._pick(pair.load, progress)
+
+    assert picker.budget.attempts[pair.load] == 1
+
+
+def test_pick_orders_the_pair_by_dependency():
+    pair = _pair()
+    picker = BoundedPartPicker(PickBudget(max_evaluations=None, max_seconds=None))
+
+    picker.pick(pair)
+
+    assert picker.budget.attempts == {pair.source: 1, pair.load: 1}
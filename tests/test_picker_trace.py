@@ -0,0 +1,85 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+import faebryk.library._F as F
+import pytest
+from faebryk.core.module import Module
+from faebryk.libs.picker.picker import (
+    Part,
+    PickerOption,
+    PickErrorParams,
+    Supplier,
+    has_part_picked,
+)
+from faebryk.libs.units import P
+
+from faebrylyzer.picker_trace import PickTrace, TracedPicker, pick_module_by_params
+
+
+class _Supplier(Supplier):
+    def attach(self, module: Module, part: PickerOption):
+        pass
+
+
+def _option(partno: str, ohm: float) -> PickerOption:
+    return PickerOption(
+        part=Part(partno, _Supplier()),
+        params={"resistance": F.Constant(ohm * P.ohm)},
+    )
+
+
+def _resistor() -> F.Resistor:
+    r = F.Resistor()
+    r.resistance.merge(F.Range.from_center_rel(100 * P.ohm, 0.05))
+    return r
+
+
+def _traced(options: list[PickerOption]) -> tuple[PickTrace, TracedPicker]:
+    trace = PickTrace()
+    picker = F.has_multi_picker.FunctionPicker(
+        lambda m: pick_module_by_params(m, options)
+    )
+    return trace, TracedPicker(trace, picker, prio=0, first=True)
+
+
+def test_records_rejected_options():
+    r = _resistor()
+    trace, picker = _traced([_option("R1k", 1000), _option("R100", 100)])
+
+    picker.pick(r)
+
+    attempt = trace.record(r).attempts[0]
+    assert attempt.success
+    assert attempt.options_evaluated == 2
+    assert [x.part for x in attempt.rejections] == ["R1k"]
+    assert attempt.rejections[0].reason.startswith("resistance=")
+    assert r.get_trait(has_part_picked).get_part().partno == "R100"
+    assert PickTrace._active is None
+
+
+def test_no_match_raises_and_releases_trace():
+    r = _resistor()
+    trace, picker = _traced([_option("R1k", 1000), _option("R10", 10)])
+
+    with pytest.raises(PickErrorParams):
+        picker.pick(r)
+
+    attempt = trace.record(r).attempts[0]
+    assert not attempt.success
+    assert len(attempt.rejections) == 2
+    assert PickTrace._active is None
+
+
+def test_filter_rejection_is_recorded():
+    r = _resistor()
+    filtered = PickerOption(
+        part=Part("R100f", _Supplier()),
+        params={"resistance": F.Constant(100 * P.ohm)},
+        filter=lambda m: False,
+    )
+    trace, picker = _traced([filtered, _option("R100", 100)])
+
+    picker.pick(r)
+
+    attempt = trace.record(r).attempts[0]
+    assert [(x.part, x.reason) for x in attempt.rejections] == [("R100f", "filter")]
@@ -0,0 +1,46 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+import faebryk.library._F as F
+from faebryk.core.module import Module
+from faebryk.libs.app.parameters import replace_tbd_with_any
+from faebryk.libs.picker.jlcpcb.jlcpcb import JLCPCB_DB
+from faebryk.libs.picker.lcsc import LCSC
+from faebryk.libs.picker.picker import has_part_picked, pick_part_recursively
+
+from faebrylyzer.library.ResistorArray import ResistorArray
+from faebrylyzer.pickers import attach_pickers
+
+
+def test_resistor_array_elements_get_no_pickers():
+    array = ResistorArray()
+    modules = [array, *array.get_children(direct_only=False, types=Module)]
+
+    covered = attach_pickers(modules, jlcpcb=True)
+
+    def pickers(module: Module):
+        return module.get_children(direct_only=True, types=F.has_multi_picker)
+
+    assert covered == {array}
+    assert pickers(array)
+    for element in array.resistor:
+        assert not pickers(element)
+
+
+def test_reference_design_picks_without_the_jlcpcb_database(monkeypatch):
+    # no footprint downloads, only the picking itself
+    monkeypatch.setattr(LCSC, "attach", lambda self, module, part: None)
+
+    mcu = F.CBM9002A_56ILG_Reference_Design()
+    replace_tbd_with_any(mcu, recursive=True)
+    modules = [mcu, *mcu.get_children(direct_only=False, types=Module)]
+
+    attach_pickers(modules, jlcpcb=True)
+    assert JLCPCB_DB._instance is None
+
+    # the rest of the design needs the supply voltages of the app
+    pick_part_recursively(mcu.reset_circuit)
+    assert JLCPCB_DB._instance is None
+
+    diode = mcu.reset_circuit.diode
+    assert diode.get_trait(has_part_picked).get_part().partno == "C2902909"
@@ -0,0 +1,102 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+import os
+from pathlib import Path
+
+import faebryk.library._F as F
+import pytest
+from faebryk.libs.units import P
+
+from faebrylyzer import server
+from faebrylyzer.main import BuildPaths
+from faebrylyzer.parts_lock import serialize_param
+from faebrylyzer.server import (
+    BuildServer,
+    ConstrainedApp,
+    Event,
+    JobOptions,
+    run_job,
+)
+
+# export_parameters=True makes the fake job below kill its worker
+CRASH = JobOptions(export_parameters=True)
+
+
+def _fake_run_job(job_id, options, root, cache_dir, emit):
+    if options.export_parameters:
+        os._exit(3)
+    emit({"job": job_id, "event": "done", "artifacts": [], "timings": {}})
+
+
+@pytest.fixture
+def build_server(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    # the workers are forked, they see the fake
+    monkeypatch.setattr(server, "run_job", _fake_run_job)
+    build_server = BuildServer(workers=1, root=tmp_path)
+    yield build_server
+    build_server.close()
+
+
+def test_dead_worker_fails_its_job_and_is_replaced(build_server: BuildServer):
+    crashed = build_server.submit(CRASH)
+    after = build_server.submit(JobOptions())
+
+    crashed_events = list(build_server.events(crashed))
+    assert crashed_events[-1]["event"] == "failed"
+    assert "exit code 3" in crashed_events[-1]["error"]
+    assert list(build_server.events(after))[-1]["event"] == "done"
+
+
+def test_run_job_reports_system_exit(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    def build(*args, **kwargs):
+        raise SystemExit(2)
+
+    monkeypatch.setattr(server, "build", build)
+    events: list[Event] = []
+
+    run_job("job", JobOptions(), tmp_path, None, events.append)
+
+    assert events[-1] == {"job": "job", "event": "failed", "error": "SystemExit: 2"}
+
+
+def test_parameters_are_validated():
+    constraint = {"type": "Constant", "value": {"magnitude": 1, "units": "ohm"}}
+
+    options = JobOptions.from_dict({"parameters": {"r.resistance": constraint}})
+
+    assert options.parameters == {"r.resistance": constraint}
+    assert options.own_parts_lock
+    with pytest.raises(ValueError, match="r.resistance"):
+        JobOptions.from_dict({"parameters": {"r.resistance": {"type": "Nope"}}})
+    with pytest.raises(ValueError, match="must be an object"):
+        JobOptions.from_dict({"parameters": ["r.resistance"]})
+
+
+def test_constrained_app_merges_parameters():
+    constraint = serialize_param(F.Range(90 * P.ohm, 110 * P.ohm))
+
+    resistor = ConstrainedApp({"resistance": constraint}, F.Resistor)()
+
+    assert resistor.resistance.get_most_narrow() == F.Range(90 * P.ohm, 110 * P.ohm)
+    with pytest.raises(ValueError, match="Unknown parameters: capacitance"):
+        ConstrainedApp({"capacitance": constraint}, F.Resistor)()
+
+
+@pytest.mark.parametrize(
+    "options, own",
+    [
+        (JobOptions(), False),
+        (JobOptions(update_parts=True), True),
+        (JobOptions(parameters={"r.resistance": {"type": "ANY"}}), True),
+    ],
+)
+def test_jobs_picking_other_parts_get_their_own_parts_lock(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, options: JobOptions, own: bool
+):
+    built: list[BuildPaths] = []
+    monkeypatch.setattr(server, "build", lambda paths, **kwargs: built.append(paths))
+
+    run_job("job", options, tmp_path, None, lambda event: None)
+
+    assert built[0].parts_lock.is_relative_to(tmp_path) == own
@@ -0,0 +1,44 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+import os
+
+import faebryk.library._F as F
+import pytest
+from faebryk.core.module import Module
+
+from faebrylyzer.benchmark import ScaledResistorArrays
+from faebrylyzer.testing import AppSnapshot
+
+SESSION_PID = os.getpid()
+
+
+@pytest.fixture(scope="module")
+def snapshot() -> AppSnapshot:
+    return AppSnapshot(lambda: ScaledResistorArrays(2))
+
+
+def _label(app: Module, label: str) -> int:
+    app.add(F.has_designator_prefix_defined(label))
+    return os.getpid()
+
+
+def test_run_returns_result_of_a_fork(snapshot: AppSnapshot):
+    pid = snapshot.run(_label, snapshot.app, "X")
+
+    assert pid != os.getpid()
+    assert not snapshot.app.has_trait(F.has_designator_prefix)
+
+
+def test_run_raises_exception_of_the_fork(snapshot: AppSnapshot):
+    def fail():
+        raise KeyError("in fork")
+
+    with pytest.raises(KeyError, match="in fork"):
+        snapshot.run(fail)
+
+
+def test_app_fixture_runs_in_a_fork(faebrylyzer_app: Module):
+    faebrylyzer_app.add(F.has_designator_prefix_defined("X"))
+
+    assert os.getpid() != SESSION_PID
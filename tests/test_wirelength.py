@@ -0,0 +1,66 @@
+# This file is part of the faebryk project
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from faebryk.libs.kicad.fileformats import C_kicad_pcb_file
+
+from faebrylyzer.wirelength import MAX_EXACT_PADS, PCB, Ratsnest
+
+PCB_FILE = Path(__file__).parent.parent / "source" / "main.kicad_pcb"
+
+
+@pytest.fixture(scope="module")
+def pcb() -> PCB:
+    return C_kicad_pcb_file.loads(PCB_FILE).kicad_pcb
+
+
+def test_small_nets_are_exact(pcb: PCB):
+    approximate = Ratsnest.from_pcb(pcb)
+    exact = Ratsnest.from_pcb(pcb, max_exact_pads=None)
+    a, e = approximate.estimate(), exact.estimate()
+
+    small = approximate.sizes <= MAX_EXACT_PADS
+    assert not small.all()
+    assert np.array_equal(a.hpwl, e.hpwl)
+    assert np.allclose(a.mst[small], e.mst[small])
+    assert np.allclose(a.manhattan[small], e.manhattan[small])
+
+
+def test_large_nets_are_approximated(pcb: PCB):
+    a = Ratsnest.from_pcb(pcb).estimate()
+    e = Ratsnest.from_pcb(pcb, max_exact_pads=None).estimate()
+
+    assert np.allclose(a.mst, e.mst, rtol=0.25)
+    assert np.allclose(a.manhattan, e.manhattan, rtol=0.25)
+
+
+def test_mst_of_a_line():
+    ratsnest = Ratsnest(
+        nets=["a"],
+        footprints=["R1"],
+        fp_at=np.zeros((1, 3)),
+        pad_net=np.zeros(5, dtype=np.intp),
+        pad_fp=np.zeros(5, dtype=np.intp),
+        pad_offset=np.array([[4, 0], [0, 0], [3, 0], [1, 0], [2, 0]], dtype=float),
+    )
+    estimate = ratsnest.estimate()
+
+    assert estimate.hpwl[0] == estimate.mst[0] == estimate.manhattan[0] == 4
+
+
+def test_board_without_nets():
+    ratsnest = Ratsnest(
+        nets=[],
+        footprints=["R1"],
+        fp_at=np.zeros((1, 3)),
+        pad_net=np.zeros(0, dtype=np.intp),
+        pad_fp=np.zeros(0, dtype=np.intp),
+        pad_offset=np.zeros((0, 2)),
+    )
+    estimate = ratsnest.estimate()
+
+    assert len(estimate.hpwl) == len(estimate.mst) == 0
+    assert "total" in ratsnest.report(estimate)